@@ -0,0 +1,233 @@
+"""
+api_bench.py — End-to-end latency benchmark for the FastAPI app and MCP tools.
+
+Generates a synthetic ledger (see ledger_gen.py) in a temp SQLite file, runs
+the real app with its lifespan (recompute worker included) and drives it
+in-process through httpx's ASGI transport. Each scenario reports p50/p95/p99
+latency and throughput; the whole report is printed as JSON.
+
+Scenarios:
+    write   POST /transactions/, then DELETE /transactions/{id} for each row created
+    stats   every /stats/* endpoint in STATS_ENDPOINTS
+    mcp     every tool in MCP_TOOLS, called through the FastMCP server
+
+Usage (from Server/):
+    python benchmarks/api_bench.py --transactions 10000
+    python benchmarks/api_bench.py --sizes 1000,10000,100000 --output bench.json
+    python benchmarks/api_bench.py --transactions 1000000 --iterations 20 --scenarios write
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCH_DIR.parent
+for path in (str(SERVER_DIR), str(BENCH_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ledger_gen  # noqa: E402
+
+USER_ID = 1
+
+TODAY = date.today()
+YEAR_START = TODAY.replace(month=1, day=1)
+
+STATS_ENDPOINTS = [
+    "/stats/sankey/{user_id}",
+    "/stats/history/{user_id}",
+    "/stats/categories/{user_id}",
+    "/stats/category-history/{user_id}?categories=Housing,Food,Transportation",
+    "/stats/daily-spending/{user_id}",
+    # Range mode (a full year from the daily rollup), reported under "?start&end"
+    f"/stats/daily-spending/{{user_id}}?start={YEAR_START.replace(year=TODAY.year - 1)}&end={TODAY}",
+    f"/stats/range/{{user_id}}?start={YEAR_START.replace(year=TODAY.year - 1)}&end={TODAY}",
+    "/stats/net-worth/{user_id}?interval=weekly",
+]
+MCP_TOOLS = [
+    ("get_net_worth", {"user_id": USER_ID}),
+    ("get_user_info", {"user_id": USER_ID}),
+    ("get_expense_categories", {"user_id": USER_ID, "year": TODAY.year, "month": TODAY.month}),
+    ("get_transactions", {"user_id": USER_ID, "year": TODAY.year, "month": TODAY.month}),
+    ("get_monthly_summary", {"user_id": USER_ID, "year": TODAY.year, "month": TODAY.month}),
+    ("get_financial_history", {"user_id": USER_ID}),
+    ("get_recurring_transactions", {"user_id": USER_ID}),
+    ("get_budgets", {"user_id": USER_ID}),
+    ("get_notifications", {"user_id": USER_ID}),
+    ("get_debts", {"user_id": USER_ID}),
+    ("get_tracked_assets", {"user_id": USER_ID}),
+    ("log_transaction", {"user_id": USER_ID, "amount": 12.5, "tx_type": "expense",
+                         "category": "Food", "recipient": "Bench Cafe"}),
+]
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float], wall_s: float) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p95_ms": round(percentile(ordered, 95), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "throughput_rps": round(len(ordered) / wall_s, 1) if wall_s else None,
+    }
+
+
+async def timed(samples: list[float], call) -> object:
+    started = time.perf_counter()
+    result = await call
+    samples.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+async def bench_write(client, iterations: int) -> dict:
+    import database
+
+    results = {}
+    samples: list[float] = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        payload = {
+            "user_id": USER_ID, "recipient": f"Bench Shop {i % 20}", "date": TODAY.isoformat(),
+            "amount": 9.99, "category": "Food", "type": "expense",
+        }
+        response = await timed(samples, client.post("/transactions/", json=payload))
+        response.raise_for_status()
+    results["POST /transactions/"] = summarize(samples, time.perf_counter() - started)
+
+    conn = database.create_connection()
+    ids = [row["id"] for row in conn.execute(
+        "SELECT id FROM transactions WHERE recipient LIKE 'Bench Shop %' ORDER BY id DESC LIMIT ?", (iterations,)
+    )]
+    conn.close()
+
+    samples = []
+    started = time.perf_counter()
+    for transaction_id in ids:
+        response = await timed(samples, client.delete(f"/transactions/{transaction_id}"))
+        response.raise_for_status()
+    results["DELETE /transactions/{id}"] = summarize(samples, time.perf_counter() - started)
+    return results
+
+
+async def bench_stats(client, iterations: int) -> dict:
+    results = {}
+    for template in STATS_ENDPOINTS:
+        path = template.format(user_id=USER_ID)
+        samples: list[float] = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            response = await timed(samples, client.get(path))
+            response.raise_for_status()
+        route, _, query = template.partition("?")
+        key = f"GET {route}"
+        if key in results:
+            # Another mode of an endpoint already measured: name it by its parameters
+            key += "?" + "&".join(param.split("=")[0] for param in query.split("&"))
+        results[key] = summarize(samples, time.perf_counter() - started)
+    return results
+
+
+async def bench_mcp(iterations: int) -> dict:
+    import main
+
+    server = main.get_mcp_server()
+    results = {}
+    for name, arguments in MCP_TOOLS:
+        samples: list[float] = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await timed(samples, server.call_tool(name, arguments))
+        results[f"mcp {name}"] = summarize(samples, time.perf_counter() - started)
+    return results
+
+
+async def run_scenarios(scenarios: list[str], iterations: int) -> dict:
+    import httpx
+    import main
+
+    results: dict = {}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # One untimed request so first-call imports and caches are not measured
+            (await client.get("/")).raise_for_status()
+            if "write" in scenarios:
+                results.update(await bench_write(client, iterations))
+            if "stats" in scenarios:
+                results.update(await bench_stats(client, iterations))
+            if "mcp" in scenarios:
+                results.update(await bench_mcp(iterations))
+    return results
+
+
+def run_single(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["SAIVE_USER_DATA"] = data_dir
+        ledger = ledger_gen.generate_from_args(args)
+        scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+        results = asyncio.run(run_scenarios(scenarios, args.iterations))
+        ledger.pop("database", None)
+        return {"ledger": ledger, "iterations": args.iterations, "results": results}
+
+
+def run_sizes(args: argparse.Namespace, argv: list[str]) -> list[dict]:
+    """The database path is fixed at import, so each size runs in its own process."""
+    passthrough = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg in ("--sizes", "--output", "--transactions"):
+            skip = True
+            continue
+        if arg.startswith(("--sizes=", "--output=", "--transactions=")):
+            continue
+        passthrough.append(arg)
+
+    reports = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--transactions", str(size), *passthrough],
+            cwd=SERVER_DIR, capture_output=True, text=True, check=True,
+        )
+        reports.append(json.loads(proc.stdout))
+    return reports
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ledger_gen.add_arguments(parser)
+    parser.add_argument("--sizes", help="comma-separated ledger sizes, one run each (e.g. 1000,100000)")
+    parser.add_argument("--iterations", type=int, default=50, help="calls per endpoint/tool")
+    parser.add_argument("--scenarios", default="write,stats,mcp", help="subset of write,stats,mcp")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    # App and worker logging goes to stderr so stdout stays pure JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_sizes(args, sys.argv[1:]) if args.sizes else run_single(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+import_profile.py — Import-time profiling report for the backend.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter against a
+throwaway database directory, then aggregates the per-module timings by
+top-level package so the biggest contributors to cold start stand out.
+
+Usage (from Server/):
+    python benchmarks/import_profile.py            # table of the top 25 packages
+    python benchmarks/import_profile.py --top 50
+    python benchmarks/import_profile.py --json     # machine-readable report
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def run_importtime(module: str = "main") -> list[tuple[str, int, int]]:
+    """Returns (module, self_us, cumulative_us) for every module imported."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = {**os.environ, "SAIVE_USER_DATA": data_dir}
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=SERVER_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr}")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        # Format: "import time:   self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def build_report(entries: list[tuple[str, int, int]], top: int) -> dict:
+    by_package: dict[str, int] = defaultdict(int)
+    for name, self_us, _ in entries:
+        by_package[name.split(".")[0]] += self_us
+
+    total_us = sum(self_us for _, self_us, _ in entries)
+    packages = sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    modules = sorted(entries, key=lambda e: e[2], reverse=True)[:top]
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "module_count": len(entries),
+        "packages": [
+            {"package": pkg, "self_ms": round(us / 1000, 1), "share": round(us / total_us * 100, 1)}
+            for pkg, us in packages
+        ],
+        "slowest_cumulative": [
+            {"module": name.strip(), "cumulative_ms": round(cum / 1000, 1)}
+            for name, _, cum in modules
+        ],
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"import main: {report['total_ms']} ms across {report['module_count']} modules\n")
+    print(f"{'package':<32}{'self ms':>10}{'share':>9}")
+    for row in report["packages"]:
+        print(f"{row['package']:<32}{row['self_ms']:>10}{row['share']:>8}%")
+    print(f"\n{'slowest modules (cumulative)':<48}{'ms':>10}")
+    for row in report["slowest_cumulative"]:
+        print(f"{row['module'][:47]:<48}{row['cumulative_ms']:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="rows per section")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = build_report(run_importtime(args.module), args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
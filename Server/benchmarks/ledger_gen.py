@@ -0,0 +1,203 @@
+"""
+ledger_gen.py — Synthetic ledger generator for benchmarks.
+
+Writes users, multi-year transactions, debts (with debt-linked charges and
+payments), recurring items, tracked assets, budgets and notifications
+straight into a SQLite file using the app's own schema, then optionally runs
+the app's aggregate recompute so user_assets and net worth match the ledger.
+
+SAIVE_USER_DATA must point at the target directory before `database` is
+imported; the CLI takes care of that.
+
+Usage (from Server/):
+    python benchmarks/ledger_gen.py --out /tmp/saive-bench --transactions 100000
+    python benchmarks/ledger_gen.py --out /tmp/saive-bench --transactions 1000000 --years 8 --no-aggregates
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+if str(SERVER_DIR) not in sys.path:
+    sys.path.insert(0, str(SERVER_DIR))
+
+CHUNK_SIZE = 50_000
+
+MERCHANTS = {
+    "Food": ["Whole Foods", "Trader Joe's", "Chipotle", "Starbucks", "Safeway", "DoorDash", "Local Bakery"],
+    "Transportation": ["Shell", "Chevron", "Uber", "Lyft", "Metro Transit", "Parking Garage"],
+    "Subscriptions": ["Netflix", "Spotify", "iCloud", "Gym Membership", "NYTimes"],
+    "Bills": ["Electric Co", "Water Utility", "Comcast", "Verizon", "Insurance Co"],
+    "Housing": ["Rent", "Home Depot", "IKEA"],
+    "Other": ["Amazon", "Target", "Pharmacy", "Bookstore", "Gift Shop"],
+}
+EXPENSE_WEIGHTS = {"Food": 40, "Transportation": 15, "Subscriptions": 8, "Bills": 10, "Housing": 5, "Other": 22}
+INCOME_SHARE = 0.08
+DEBT_LINKED_SHARE = 0.05
+
+
+def generate(
+    transactions: int = 10_000,
+    users: int = 1,
+    years: int = 3,
+    debts: int = 3,
+    recurring: int = 8,
+    tracked_assets: int = 3,
+    seed: int = 42,
+    aggregates: bool = True,
+) -> dict:
+    """Fill the database at database.DATABASE_PATH. Returns a summary dict."""
+    import database
+
+    rng = random.Random(seed)
+    database.ensure_schema()
+    conn = database.create_connection()
+    cursor = conn.cursor()
+
+    today = date.today()
+    first_day = today - timedelta(days=365 * years)
+    span_days = (today - first_day).days
+
+    cursor.execute("SELECT id FROM users ORDER BY id")
+    user_ids = [row["id"] for row in cursor.fetchall()]
+    while len(user_ids) < users:
+        cursor.execute("INSERT INTO users (name, net_worth) VALUES (?, 0.0)", (f"Bench User {len(user_ids) + 1}",))
+        user_ids.append(cursor.lastrowid)
+    user_ids = user_ids[:users]
+
+    debt_ids: dict[int, list[int]] = {}
+    for user_id in user_ids:
+        debt_ids[user_id] = []
+        for i in range(debts):
+            debt_type = "credit_card" if i == 0 else rng.choice(["auto", "student", "mortgage", "personal"])
+            total = round(rng.uniform(2_000, 300_000), 2)
+            cursor.execute('''
+                INSERT INTO debts (user_id, name, type, balance, total_amount, interest_rate, monthly_payment, start_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, f"Bench {debt_type} {i}", debt_type, round(total * rng.uniform(0.2, 0.9), 2), total,
+                  round(rng.uniform(2, 25), 2), round(total / 120, 2), first_day.isoformat()))
+            debt_ids[user_id].append(cursor.lastrowid)
+
+        for i in range(tracked_assets):
+            asset_type = rng.choice(["real_estate", "vehicle", "investment", "valuable", "other"])
+            cursor.execute(
+                "INSERT INTO tracked_assets (user_id, name, type, value) VALUES (?, ?, ?, ?)",
+                (user_id, f"Bench {asset_type} {i}", asset_type, round(rng.uniform(1_000, 500_000), 2)),
+            )
+
+        for i in range(recurring):
+            category = rng.choice(["Subscriptions", "Bills", "Housing"])
+            interval = rng.choice(["weekly", "monthly", "monthly", "yearly"])
+            # next_date in the future so the recurring loop stays idle while benchmarking
+            next_date = today + timedelta(days=rng.randint(1, 28))
+            cursor.execute('''
+                INSERT INTO recurring_transactions (user_id, amount, category, recipient, type, interval, start_date, next_date)
+                VALUES (?, ?, ?, ?, 'expense', ?, ?, ?)
+            ''', (user_id, round(rng.uniform(5, 2_000), 2), category, rng.choice(MERCHANTS[category]),
+                  interval, first_day.isoformat(), next_date.isoformat()))
+
+        for category in EXPENSE_WEIGHTS:
+            cursor.execute(
+                "INSERT OR REPLACE INTO budgets (user_id, category, amount) VALUES (?, ?, ?)",
+                (user_id, category, round(rng.uniform(100, 2_000), 2)),
+            )
+
+        cursor.executemany('''
+            INSERT INTO notifications (user_id, title, message, date, is_read, type)
+            VALUES (?, ?, ?, ?, ?, 'system')
+        ''', [(user_id, "Subscription Paid", f"Bench notification {i}",
+               (today - timedelta(days=i)).isoformat() + " 09:00:00", i % 3 == 0) for i in range(60)])
+    conn.commit()
+
+    categories = list(EXPENSE_WEIGHTS)
+    weights = list(EXPENSE_WEIGHTS.values())
+    per_user = transactions // len(user_ids)
+    started = time.perf_counter()
+    for user_id in user_ids:
+        remaining = per_user
+        while remaining:
+            batch = []
+            for _ in range(min(CHUNK_SIZE, remaining)):
+                day = (first_day + timedelta(days=rng.randrange(span_days + 1))).isoformat()
+                if rng.random() < INCOME_SHARE:
+                    batch.append((user_id, day, round(rng.uniform(500, 6_000), 2), "Income", "Employer Payroll", "income", None))
+                    continue
+                category = rng.choices(categories, weights)[0]
+                debt_id = None
+                if debt_ids[user_id] and rng.random() < DEBT_LINKED_SHARE:
+                    debt_id = debt_ids[user_id][0]
+                batch.append((user_id, day, round(rng.lognormvariate(3.2, 1.0), 2), category,
+                              rng.choice(MERCHANTS[category]), "expense", debt_id))
+            cursor.executemany('''
+                INSERT INTO transactions (user_id, date, amount, category, recipient, type, debt_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            conn.commit()
+            remaining -= len(batch)
+    insert_s = time.perf_counter() - started
+    conn.close()
+
+    aggregate_s = 0.0
+    if aggregates:
+        import main
+
+        started = time.perf_counter()
+        for user_id in user_ids:
+            main.recompute_user(user_id, (first_day.year, first_day.month))
+        aggregate_s = time.perf_counter() - started
+
+    return {
+        "database": str(database.DATABASE_PATH),
+        "users": len(user_ids),
+        "transactions": per_user * len(user_ids),
+        "years": years,
+        "debts_per_user": debts,
+        "recurring_per_user": recurring,
+        "tracked_assets_per_user": tracked_assets,
+        "insert_s": round(insert_s, 2),
+        "aggregate_s": round(aggregate_s, 2),
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--transactions", type=int, default=10_000, help="total ledger rows (1k to 1M)")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--years", type=int, default=3, help="history span ending today")
+    parser.add_argument("--debts", type=int, default=3, help="debts per user (first is a credit card)")
+    parser.add_argument("--recurring", type=int, default=8, help="recurring items per user")
+    parser.add_argument("--tracked-assets", type=int, default=3, help="tracked assets per user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-aggregates", action="store_true", help="skip the user_assets/net worth recompute")
+
+
+def generate_from_args(args: argparse.Namespace) -> dict:
+    return generate(
+        transactions=args.transactions,
+        users=args.users,
+        years=args.years,
+        debts=args.debts,
+        recurring=args.recurring,
+        tracked_assets=args.tracked_assets,
+        seed=args.seed,
+        aggregates=not args.no_aggregates,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="directory for database.db (used as SAIVE_USER_DATA)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    os.environ["SAIVE_USER_DATA"] = args.out
+    summary = generate_from_args(args)
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
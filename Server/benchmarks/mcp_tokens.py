@@ -0,0 +1,187 @@
+"""
+mcp_tokens.py — Token cost of the list-returning MCP tools, verbose vs compact.
+
+Generates a synthetic ledger (see ledger_gen.py), calls each tool in TOOLS
+through the FastMCP server exactly as a client would, and counts the tokens
+of the text content it returns, in four modes:
+
+    verbose         the default output (one dict per row, as FastMCP renders it)
+    compact_all     compact=True with the row cap lifted: the pure format saving
+    compact         compact=True (at most compact_output.MAX_ROWS rows)
+    compact_top     compact=True, top=--top
+
+compact_all is checked to expand (compact_output.expand) to the verbose rows
+with numbers rounded to cents, and every capped mode to keep the totals:
+listed rows plus "others" add up to the verbose ones.
+
+Tokens are counted with --tokenizer (a Hugging Face tokenizer.json, e.g. the
+local model's, via the `tokenizers` package), else with tiktoken's
+o200k_base when it is installed, else estimated: words split into pieces of
+up to four letters, digits in groups of three, every other symbol and every
+line break with its indent one token each. The report names the counter.
+
+Usage (from Server/):
+    python benchmarks/mcp_tokens.py
+    python benchmarks/mcp_tokens.py --transactions 200000 --top 20 --tokenizer ~/models/gemma-3-270m/tokenizer.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCH_DIR.parent
+for path in (str(SERVER_DIR), str(BENCH_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ledger_gen  # noqa: E402
+
+USER_ID = 1
+TODAY = date.today()
+TOOLS = [
+    ("get_transactions", {"user_id": USER_ID, "year": TODAY.year, "month": TODAY.month}),
+    ("get_financial_history", {"user_id": USER_ID}),
+    ("get_recurring_transactions", {"user_id": USER_ID}),
+    ("get_debts", {"user_id": USER_ID}),
+]
+TOTALS = {
+    "get_transactions": ("amount",),
+    "get_recurring_transactions": ("amount",),
+    "get_debts": ("balance", "monthly_payment"),
+}
+
+_ESTIMATE = re.compile(r"[A-Za-z]+|\d{1,3}|\n[ \t]*|[^\sA-Za-z\d]")
+
+
+def token_counter(tokenizer_path: str = None):
+    """(name, count(text) -> int) for the best tokenizer available."""
+    if tokenizer_path:
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(str(Path(tokenizer_path).expanduser()))
+        return Path(tokenizer_path).parent.name or "tokenizer.json", lambda text: len(tokenizer.encode(text).ids)
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("o200k_base")
+        return "tiktoken o200k_base", lambda text: len(encoding.encode(text))
+    except Exception:  # not installed, or its vocabulary cannot be downloaded
+        pass
+
+    def estimate(text: str) -> int:
+        return sum(math.ceil(len(piece) / 4) if piece.isalpha() else 1 for piece in _ESTIMATE.findall(text))
+
+    return "estimate", estimate
+
+
+def content_text(result) -> str:
+    """The text a client passes to the model: every text content, one per line."""
+    content = result[0] if isinstance(result, tuple) else result
+    return "\n".join(item.text for item in content)
+
+
+def verbose_rows(text: str) -> list:
+    """Verbose output as dicts; FastMCP sends a list one item per content block."""
+    decoder = json.JSONDecoder()
+    rows, index = [], 0
+    while index < len(text):
+        row, index = decoder.raw_decode(text, index)
+        rows.append(row)
+        while index < len(text) and text[index].isspace():
+            index += 1
+    return rows
+
+
+def check(name: str, verbose: list, compact: dict, complete: bool) -> bool:
+    """compact matches verbose: row for row when complete, else in its totals."""
+    import compact_output
+
+    listed = compact_output.expand(compact)
+    if name == "get_transactions":
+        for row in listed:
+            row["date"] = f"{compact['year']:04d}-{compact['month']:02d}-{row.pop('day'):02d}"
+    if complete:
+        expected = [{key: compact_output.number(row[key]) for key in listed[0]} for row in verbose] if listed else []
+        return listed == expected
+    for column in TOTALS.get(name, ()):
+        total = sum(row[column] for row in listed) + (
+            compact["others"]["expense"] + compact["others"]["income"] if column == "amount"
+            else compact["others"][column])
+        if abs(total - sum(row[column] for row in verbose)) > 0.01 * (len(verbose) + 1):
+            return False
+    return len(listed) + compact["others"]["count"] == len(verbose)
+
+
+async def measure(count, top: int) -> dict:
+    import compact_output
+    import main
+
+    server = main.get_mcp_server()
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        for name, arguments in TOOLS:
+            modes = {
+                "verbose": {**arguments, "compact": False},
+                "compact_all": {**arguments, "compact": True},
+                "compact": {**arguments, "compact": True},
+            }
+            if name != "get_financial_history":
+                modes["compact_top"] = {**arguments, "compact": True, "top": top}
+            report, texts = {}, {}
+            for mode, mode_arguments in modes.items():
+                max_rows = compact_output.MAX_ROWS
+                if mode == "compact_all":
+                    compact_output.MAX_ROWS = sys.maxsize
+                try:
+                    started = time.perf_counter()
+                    text = content_text(await server.call_tool(name, mode_arguments))
+                    elapsed = (time.perf_counter() - started) * 1000
+                finally:
+                    compact_output.MAX_ROWS = max_rows
+                texts[mode] = text
+                report[mode] = {"bytes": len(text.encode("utf-8")), "tokens": count(text), "ms": round(elapsed, 2)}
+
+            verbose = verbose_rows(texts["verbose"])
+            report["rows"] = len(verbose)
+            for mode in modes:
+                if mode != "verbose":
+                    compact = json.loads(texts[mode])
+                    report[mode]["listed"] = len(compact["rows"])
+                    report[mode]["matches_verbose"] = check(name, verbose, compact, "others" not in compact)
+                    report[mode]["token_share"] = round(report[mode]["tokens"] / max(report["verbose"]["tokens"], 1), 3)
+            results[name] = report
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ledger_gen.add_arguments(parser)
+    parser.add_argument("--top", type=int, default=10, help="rows listed in the compact_top mode")
+    parser.add_argument("--tokenizer", help="a Hugging Face tokenizer.json to count with")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    counter_name, count = token_counter(args.tokenizer)
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory() as data_dir:
+        os.environ["SAIVE_USER_DATA"] = data_dir
+        ledger = ledger_gen.generate_from_args(args)
+        ledger.pop("database", None)
+        report = {"ledger": ledger, "tokenizer": counter_name, "tools": asyncio.run(measure(count, args.top))}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+
+
+if __name__ == "__main__":
+    main()
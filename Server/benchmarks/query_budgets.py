@@ -0,0 +1,347 @@
+"""
+query_budgets.py — Per-route SQL budgets and an N+1 detector.
+
+QueryRecorder hooks into instrumentation.py while it is active: every HTTP
+request handled by the app is recorded with its statement and connection
+counts and the shape of each statement it ran. On exit it can check the
+counts against BUDGETS and list query shapes a single request executed
+REPEAT_THRESHOLD or more times, the signature of a per-row/per-month loop.
+
+As a test fixture:
+    @pytest.fixture
+    def query_budget():
+        with query_budgets.QueryRecorder() as recorder:
+            yield recorder
+        recorder.assert_within_budgets()
+
+As a CLI gate (exit status 1 on any budget exceeded by more than
+STATEMENT_SLACK statements or by any connection, or on a repeated shape in
+a route not listed in REPEAT_ALLOWED; run in CI by
+.github/workflows/query-budgets.yml), from Server/:
+    python benchmarks/query_budgets.py
+    python benchmarks/query_budgets.py --transactions 50000 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+from collections import Counter, defaultdict
+from datetime import date
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCH_DIR.parent
+for path in (str(SERVER_DIR), str(BENCH_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import instrumentation  # noqa: E402
+import ledger_gen  # noqa: E402
+
+USER_ID = 1
+REPEAT_THRESHOLD = 3
+# Extra statements a route may run over its budget before the gate fails, so
+# a harmless added read does not break CI. Connections get no slack: an extra
+# one means a connection stopped being reused.
+STATEMENT_SLACK = 1
+# Routes allowed to repeat a statement shape, with the reason. Anything else
+# that repeats one fails the gate whatever its budget.
+REPEAT_ALLOWED: dict[str, str] = {}
+
+
+class Budget(NamedTuple):
+    statements: int
+    connections: int
+
+
+# Keyed by "METHOD /route/template". Counts cover the request only; the
+# aggregate recompute runs on the background worker and is not included.
+# Each budget is the count measured when the route last changed on purpose;
+# a change that needs more updates the budget in the same commit. Per-row
+# loops fail as repeated shapes whatever the budget (see REPEAT_ALLOWED).
+BUDGETS: dict[str, Budget] = {
+    "POST /transactions/": Budget(statements=5, connections=1),
+    "GET /transactions/": Budget(statements=2, connections=2),
+    "GET /transactions/{transaction_id}": Budget(statements=1, connections=1),
+    "DELETE /transactions/{transaction_id}": Budget(statements=6, connections=1),
+    "GET /users/{user_id}": Budget(statements=1, connections=1),
+    "GET /user_asset/{user_id}": Budget(statements=3, connections=3),
+    "GET /user_assets/{user_id}/all": Budget(statements=1, connections=1),
+    "GET /user_assets/{user_id}/category": Budget(statements=1, connections=1),
+    "GET /stats/sankey/{user_id}": Budget(statements=2, connections=2),
+    "GET /stats/history/{user_id}": Budget(statements=1, connections=1),
+    "GET /stats/categories/{user_id}": Budget(statements=1, connections=1),
+    # All 12 months grouped in one query
+    "GET /stats/category-history/{user_id}": Budget(statements=1, connections=1),
+    "GET /stats/daily-spending/{user_id}": Budget(statements=1, connections=1),
+    # Cold index load; warm queries fetch only rows changed since the last one
+    "GET /stats/range/{user_id}": Budget(statements=1, connections=1),
+    "GET /stats/net-worth/{user_id}": Budget(statements=1, connections=1),
+    # BEGIN plus one read per widget source, all on one snapshot
+    "GET /dashboard/{user_id}": Budget(statements=8, connections=1),
+    # Match count plus one ranked page
+    "GET /transactions/{user_id}/search": Budget(statements=2, connections=1),
+    "GET /recipients/{user_id}/suggest": Budget(statements=1, connections=1),
+    # BEGIN, user check, cursor, change scan, then one read per changed table (7 at most)
+    "GET /sync/{user_id}": Budget(statements=11, connections=1),
+    "GET /debts/{user_id}": Budget(statements=1, connections=1),
+    "POST /debts/{user_id}": Budget(statements=3, connections=1),
+    "PUT /debts/{debt_id}": Budget(statements=4, connections=1),
+    "PATCH /debts/{debt_id}/balance": Budget(statements=3, connections=1),
+    "DELETE /debts/{debt_id}": Budget(statements=3, connections=1),
+    "GET /budgets/{user_id}": Budget(statements=1, connections=1),
+    "PUT /budgets/{user_id}": Budget(statements=1, connections=1),
+    "GET /notifications/{user_id}": Budget(statements=1, connections=1),
+    "PUT /notifications/user/{user_id}/read_all": Budget(statements=1, connections=1),
+    "GET /tracked_assets/{user_id}": Budget(statements=1, connections=1),
+    "POST /tracked_assets/": Budget(statements=2, connections=1),
+    "PUT /tracked_assets/{asset_id}": Budget(statements=4, connections=1),
+    "DELETE /tracked_assets/{asset_id}": Budget(statements=3, connections=1),
+    "GET /recurring_transactions/{user_id}": Budget(statements=1, connections=1),
+    "POST /recurring_transactions/": Budget(statements=1, connections=1),
+    "PUT /recurring_transactions/{rt_id}": Budget(statements=3, connections=1),
+    "DELETE /recurring_transactions/{rt_id}": Budget(statements=3, connections=1),
+    "GET /rules/{user_id}": Budget(statements=1, connections=1),
+    "POST /rules/": Budget(statements=2, connections=2),
+    "DELETE /rules/{rule_id}": Budget(statements=3, connections=1),
+    # BEGIN, drop stale learned rules, upsert the rest
+    "POST /rules/{user_id}/learn": Budget(statements=3, connections=1),
+    # Rule load after an invalidate, then one batched hit-count update
+    "POST /rules/{user_id}/categorize": Budget(statements=2, connections=2),
+}
+
+
+class RequestRecord(NamedTuple):
+    route: str
+    status: int
+    statements: int
+    connections: int
+    shapes: Counter
+
+
+class QueryRecorder:
+    """Records SQL activity per request while active; see the module docstring."""
+
+    def __init__(self, budgets: Optional[dict[str, Budget]] = None, repeat_threshold: int = REPEAT_THRESHOLD,
+                 statement_slack: int = STATEMENT_SLACK, repeat_allowed: Optional[dict[str, str]] = None):
+        self.budgets = BUDGETS if budgets is None else budgets
+        self.repeat_threshold = repeat_threshold
+        self.statement_slack = statement_slack
+        self.repeat_allowed = REPEAT_ALLOWED if repeat_allowed is None else repeat_allowed
+        self.records: list[RequestRecord] = []
+
+    def __enter__(self):
+        instrumentation.set_statement_tracing(True)
+        instrumentation.add_request_listener(self._on_request)
+        return self
+
+    def __exit__(self, *exc):
+        instrumentation.remove_request_listener(self._on_request)
+        instrumentation.set_statement_tracing(False)
+        return False
+
+    def _on_request(self, method, route, status, seconds, stats) -> None:
+        self.records.append(RequestRecord(
+            f"{method} {route}", status, stats.queries, stats.connections, Counter(stats.statements or {}),
+        ))
+
+    def worst_by_route(self) -> dict[str, Budget]:
+        """Highest statement and connection counts seen per route."""
+        worst: dict[str, Budget] = {}
+        for record in self.records:
+            current = worst.get(record.route, Budget(0, 0))
+            worst[record.route] = Budget(max(current.statements, record.statements),
+                                         max(current.connections, record.connections))
+        return worst
+
+    def violations(self) -> list[str]:
+        problems = []
+        for route, record in sorted(self.worst_by_route().items()):
+            budget = self.budgets.get(route)
+            if budget is None:
+                continue
+            if record.statements > budget.statements + self.statement_slack:
+                problems.append(f"{route}: {record.statements} statements "
+                                f"(budget {budget.statements} + {self.statement_slack})")
+            if record.connections > budget.connections:
+                problems.append(f"{route}: {record.connections} connections (budget {budget.connections})")
+        for route, shapes in self.repeated_shapes().items():
+            if route not in self.repeat_allowed:
+                problems += [f"{route}: {count}x the same statement shape" for _, count in shapes]
+        return problems
+
+    def unbudgeted_routes(self) -> list[str]:
+        return sorted({record.route for record in self.records} - set(self.budgets))
+
+    def repeated_shapes(self) -> dict[str, list[tuple[str, int]]]:
+        """Per route, the statement shapes a single request ran repeat_threshold+ times (max seen)."""
+        repeated: dict[str, dict[str, int]] = defaultdict(dict)
+        for record in self.records:
+            for shape, count in record.shapes.items():
+                if count >= self.repeat_threshold:
+                    repeated[record.route][shape] = max(count, repeated[record.route].get(shape, 0))
+        return {route: sorted(shapes.items(), key=lambda item: -item[1]) for route, shapes in sorted(repeated.items())}
+
+    def report(self) -> dict:
+        routes = {}
+        for route, record in sorted(self.worst_by_route().items()):
+            budget = self.budgets.get(route)
+            routes[route] = {
+                "statements": record.statements,
+                "connections": record.connections,
+                "budget": budget._asdict() if budget else None,
+            }
+        return {
+            "routes": routes,
+            "violations": self.violations(),
+            "unbudgeted": self.unbudgeted_routes(),
+            "repeated_shapes": {
+                route: [{"count": count, "sql": shape} for shape, count in shapes]
+                for route, shapes in self.repeated_shapes().items()
+            },
+        }
+
+    def assert_within_budgets(self) -> None:
+        problems = self.violations()
+        if problems:
+            lines = ["Query budget exceeded:", *(f"  {p}" for p in problems)]
+            for route, shapes in self.repeated_shapes().items():
+                lines.append(f"  repeated in {route}:")
+                lines += [f"    {count}x {shape}" for shape, count in shapes]
+            raise AssertionError("\n".join(lines))
+
+
+# ── CLI scenario ────────────────────────────────────────────────────────────
+
+async def exercise(client) -> None:
+    """Hit every budgeted route once against the generated ledger."""
+    import database
+
+    today = date.today().isoformat()
+    conn = database.create_connection()
+    debt_id = conn.execute("SELECT id FROM debts WHERE user_id = ? ORDER BY id LIMIT 1", (USER_ID,)).fetchone()["id"]
+    conn.close()
+
+    async def call(method, path, **kwargs):
+        response = await client.request(method, path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    tx = {"user_id": USER_ID, "recipient": "Budget Check", "date": today, "amount": 4.2, "category": "Food", "type": "expense"}
+    await call("POST", "/transactions/", json=tx)
+    await call("POST", "/transactions/", json={**tx, "debt_id": debt_id})
+    await call("POST", "/transactions/?on_duplicate=skip", json=tx)
+    conn = database.create_connection()
+    created = [row["id"] for row in conn.execute("SELECT id FROM transactions WHERE recipient = 'Budget Check'")]
+    conn.close()
+    await call("GET", f"/transactions/{created[0]}")
+    for transaction_id in created:
+        await call("DELETE", f"/transactions/{transaction_id}")
+    await call("GET", "/transactions/")
+
+    for path in ("/users/{u}", "/user_asset/{u}", "/user_assets/{u}/all", "/user_assets/{u}/category",
+                 "/stats/sankey/{u}", "/stats/history/{u}", "/stats/categories/{u}",
+                 "/stats/category-history/{u}", "/stats/daily-spending/{u}",
+                 f"/stats/range/{{u}}?start={date.today().year}-01-01&end={today}", "/stats/net-worth/{u}?interval=weekly", "/dashboard/{u}",
+                 f"/stats/daily-spending/{{u}}?start={date.today().year - 1}-01-01&end={today}",
+                 "/debts/{u}", "/budgets/{u}", "/notifications/{u}", "/tracked_assets/{u}",
+                 "/recurring_transactions/{u}", "/transactions/{u}/search?q=food",
+                 "/recipients/{u}/suggest?prefix=ch"):
+        await call("GET", path.format(u=USER_ID))
+
+    debt = {"user_id": USER_ID, "name": "Budget Card", "type": "credit_card", "balance": 100.0,
+            "total_amount": 1000.0, "monthly_payment": 25.0}
+    new_debt = (await call("POST", f"/debts/{USER_ID}", json=debt)).json()
+    await call("PUT", f"/debts/{new_debt['id']}", json={**debt, "balance": 90.0})
+    await call("PATCH", f"/debts/{new_debt['id']}/balance", json={"balance": 80.0})
+    await call("DELETE", f"/debts/{new_debt['id']}")
+
+    await call("PUT", f"/budgets/{USER_ID}", json={"user_id": USER_ID, "category": "Food", "amount": 400.0})
+    await call("PUT", f"/notifications/user/{USER_ID}/read_all")
+
+    asset = {"user_id": USER_ID, "name": "Budget Bike", "type": "vehicle", "value": 800.0}
+    new_asset = (await call("POST", "/tracked_assets/", json=asset)).json()
+    await call("PUT", f"/tracked_assets/{new_asset['id']}", json={**asset, "value": 750.0})
+    await call("DELETE", f"/tracked_assets/{new_asset['id']}")
+
+    recurring = {"user_id": USER_ID, "recipient": "Budget Gym", "amount": 30.0, "category": "Subscriptions",
+                 "type": "expense", "interval": "monthly", "start_date": today}
+    await call("POST", "/recurring_transactions/", json=recurring)
+    conn = database.create_connection()
+    rt_id = conn.execute("SELECT id FROM recurring_transactions WHERE recipient = 'Budget Gym'").fetchone()["id"]
+    conn.close()
+    await call("PUT", f"/recurring_transactions/{rt_id}", json={**recurring, "amount": 35.0})
+    await call("DELETE", f"/recurring_transactions/{rt_id}")
+
+    rule = (await call("POST", "/rules/", json={"user_id": USER_ID, "pattern": "netflix", "category": "Subscriptions"})).json()
+    await call("POST", f"/rules/{USER_ID}/learn")
+    await call("GET", f"/rules/{USER_ID}")
+    await call("POST", f"/rules/{USER_ID}/categorize", json=[
+        {"recipient": "NETFLIX.COM", "amount": 15.49, "type": "expense"},
+        {"recipient": "Whole Foods", "amount": 62.1},
+    ])
+    await call("DELETE", f"/rules/{rule['id']}")
+
+    # Full sync, then a delta covering every write above
+    await call("GET", f"/sync/{USER_ID}")
+    await call("GET", f"/sync/{USER_ID}?since=1")
+
+
+async def run_check() -> dict:
+    import httpx
+    import main
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://budget") as client:
+            (await client.get("/")).raise_for_status()
+            with QueryRecorder() as recorder:
+                await exercise(client)
+    return recorder.report()
+
+
+def print_report(report: dict) -> None:
+    for route, row in report["routes"].items():
+        budget = row["budget"]
+        limit = f"{budget['statements']}/{budget['connections']}" if budget else "-"
+        print(f"{row['statements']:>4} stmts {row['connections']:>4} conns  budget {limit:>7}  {route}")
+    for route, shapes in report["repeated_shapes"].items():
+        reason = REPEAT_ALLOWED.get(route)
+        print(f"\nRepeated in {route}" + (f" (allowed: {reason}):" if reason else ":"))
+        for shape in shapes:
+            print(f"  {shape['count']}x {shape['sql']}")
+    if report["unbudgeted"]:
+        print("\nNo budget declared for: " + ", ".join(report["unbudgeted"]))
+    if report["violations"]:
+        print("\nBudget exceeded:")
+        for problem in report["violations"]:
+            print(f"  {problem}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ledger_gen.add_arguments(parser)
+    parser.set_defaults(transactions=5_000, years=2)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["SAIVE_USER_DATA"] = data_dir
+        with contextlib.redirect_stdout(sys.stderr):
+            ledger_gen.generate_from_args(args)
+            report = asyncio.run(run_check())
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    sys.exit(1 if report["violations"] else 0)
+
+
+if __name__ == "__main__":
+    main()
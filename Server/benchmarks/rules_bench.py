@@ -0,0 +1,160 @@
+"""
+rules_bench.py — Throughput of the compiled categorisation rules.
+
+Builds a rule set from the merchants ledger_gen.py uses ("contains" rules),
+padded with random-word rules up to --rules, a few amount-range rules and
+one exact rule per merchant, then categorises synthetic bank lines such as
+"POS 4411 WHOLE FOODS #7731" with:
+
+    compiled_unique     rules_engine.CompiledRules, every line distinct
+                        (the regex runs once per row)
+    compiled_repeated   up to rules_engine.MAX_MEMO lines categorised again,
+                        as in a re-import (memo hits)
+    naive               every rule tested in precedence order with `in`, per row
+
+Compile time is reported separately, and the compiled results are checked
+against the naive ones. No database is needed.
+
+Usage (from Server/):
+    python benchmarks/rules_bench.py
+    python benchmarks/rules_bench.py --rules 2000 --rows 500000 --output rules.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCH_DIR.parent
+for path in (str(SERVER_DIR), str(BENCH_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ledger_gen  # noqa: E402
+
+WORDS = ["acme", "store", "market", "cafe", "deli", "online", "pay", "shop", "club", "co",
+         "express", "garage", "pharma", "books", "travel", "hotel", "air", "fuel", "wash", "mart"]
+PREFIXES = ["POS", "DEBIT CARD PURCHASE", "ACH", "CHECKCARD", "SQ *", "PAYPAL *"]
+
+
+def build_rules(count: int, rng: random.Random) -> list:
+    """crud.get_rule_conditions-shaped rows."""
+    rules = []
+
+    def add(pattern, match_type, category, tx_type=None, min_amount=None, max_amount=None, priority=0, source="user"):
+        rules.append((len(rules) + 1, pattern, match_type, category, tx_type, min_amount, max_amount, priority, source))
+
+    for category, merchants in ledger_gen.MERCHANTS.items():
+        for merchant in merchants:
+            add(merchant.upper(), "contains", category)
+            add(merchant.lower(), "exact", category, source="learned")
+    add("", "contains", "Housing", "expense", 1500.0)
+    add("", "contains", "Income", "income", 500.0)
+    add("uber", "contains", "Food", max_amount=15.0, priority=1)
+    categories = list(ledger_gen.MERCHANTS)
+    while len(rules) < count:
+        pattern = " ".join(rng.sample(WORDS, rng.randint(1, 2))) + f" {rng.randint(1, 999)}"
+        add(pattern, "contains", rng.choice(categories), priority=rng.randint(0, 2))
+    return rules
+
+
+def build_rows(count: int, rng: random.Random) -> list:
+    merchants = [m for ms in ledger_gen.MERCHANTS.values() for m in ms]
+    rows = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            name = rng.choice(merchants).upper()
+        else:
+            name = " ".join(rng.sample(WORDS, 2)).upper()
+        recipient = f"{rng.choice(PREFIXES)} {rng.randint(1000, 9999)} {name} #{rng.randint(1, 99999)}"
+        rows.append((recipient, round(rng.uniform(1, 3000), 2), rng.choice(["expense", "expense", "income"])))
+    return rows
+
+
+def naive(rules: list):
+    """Reference matcher: every rule, in precedence order, per row."""
+    import recipient_index
+
+    ordered = sorted(
+        ((recipient_index.normalize(pattern), match_type, rule_id, tx_type, min_amount, max_amount, priority, source)
+         for rule_id, pattern, match_type, _, tx_type, min_amount, max_amount, priority, source in rules),
+        key=lambda r: (r[7] != "user", -r[6], -len(r[0]), r[2]),
+    )
+
+    def match(recipient, amount, tx_type):
+        key = recipient_index.normalize(recipient)
+        for pattern, match_type, rule_id, rule_type, min_amount, max_amount, _, _ in ordered:
+            if pattern and (pattern != key if match_type == "exact" else pattern not in key):
+                continue
+            if ((rule_type is None or rule_type == tx_type)
+                    and (min_amount is None or amount >= min_amount)
+                    and (max_amount is None or amount <= max_amount)):
+                return rule_id
+        return None
+
+    return match
+
+
+def rate(rows: list, match) -> tuple[float, list]:
+    started = time.perf_counter()
+    results = [match(*row) for row in rows]
+    elapsed = time.perf_counter() - started
+    return round(len(rows) / elapsed), results
+
+
+def run(args: argparse.Namespace) -> dict:
+    import rules_engine
+
+    rng = random.Random(args.seed)
+    rules = build_rules(args.rules, rng)
+    rows = build_rows(args.rows, rng)
+
+    started = time.perf_counter()
+    compiled = rules_engine.CompiledRules(rules)
+    compile_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def match_id(recipient, amount, tx_type):
+        rule = compiled.match(recipient, amount, tx_type)
+        return rule.id if rule else None
+
+    unique_rate, results = rate(rows, match_id)
+    repeated = rows[:rules_engine.MAX_MEMO]
+    rate(repeated, match_id)
+    repeated_rate, _ = rate(repeated, match_id)
+    sample = rows[:args.naive_rows]
+    naive_rate, expected = rate(sample, naive(rules))
+    return {
+        "rules": len(rules),
+        "rows": len(rows),
+        "compile_ms": compile_ms,
+        "rows_per_s": {
+            "compiled_unique": unique_rate,
+            "compiled_repeated": repeated_rate,
+            "naive": naive_rate,
+        },
+        "speedup_unique_over_naive": round(unique_rate / naive_rate, 1),
+        "matched_share": round(sum(r is not None for r in results) / len(results), 3),
+        "identical_to_naive": results[:len(sample)] == expected,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=500, help="total rules, padded with random-word rules")
+    parser.add_argument("--rows", type=int, default=200_000, help="bank lines to categorise")
+    parser.add_argument("--naive-rows", type=int, default=20_000, help="rows for the naive reference")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args), indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+
+
+if __name__ == "__main__":
+    main()
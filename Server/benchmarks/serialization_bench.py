@@ -0,0 +1,141 @@
+"""
+serialization_bench.py — Validation and JSON encoding cost of the list endpoints.
+
+Generates a synthetic ledger (see ledger_gen.py) and, for each large list
+endpoint, times the steps that turn SQLite rows into a response body:
+
+    stock         crud models -> FastAPI response_model validation -> JSONResponse (json.dumps)
+    trusted       crud models -> fast_json.trusted (orjson, or json.dumps without it)
+    rows          crud rows   -> fast_json.trusted, no models at all
+                  (for /transactions/, SQLite's json_group_array -> fast_json.raw)
+
+Fetch time (SQLite plus model construction) is reported separately from
+encode time, and every fast path is checked to decode to the same JSON as
+the stock one. Each fast path also runs with orjson disabled to show the
+fallback cost.
+
+Usage (from Server/):
+    python benchmarks/serialization_bench.py --transactions 100000
+    python benchmarks/serialization_bench.py --transactions 1000000 --iterations 3 --output serialization.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCH_DIR.parent
+for path in (str(SERVER_DIR), str(BENCH_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ledger_gen  # noqa: E402
+
+USER_ID = 1
+
+
+def endpoints():
+    """(route path, model fetch, row/JSON fetch or None) per benchmarked endpoint."""
+    import crud
+
+    return [
+        ("/transactions/", crud.get_all_transactions, crud.get_all_transactions_json),
+        ("/user_assets/{user_id}/all", lambda: crud.get_all_user_assets(USER_ID),
+         lambda: crud.get_all_user_asset_rows(USER_ID)),
+        ("/notifications/{user_id}", lambda: crud.get_user_notifications(USER_ID), None),
+        ("/debts/{user_id}", lambda: crud.get_debts(USER_ID), None),
+    ]
+
+
+def best_of(iterations: int, fn) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return round(best, 3), result
+
+
+def stock_body(field, content) -> bytes:
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    serialized = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(serialized).body
+
+
+def bench(iterations: int) -> dict:
+    import fast_json
+    import main
+
+    routes = {route.path: route for route in main.app.routes
+              if getattr(route, "response_field", None) and "GET" in route.methods}
+    has_orjson = fast_json.orjson is not None
+    results = {}
+    for path, fetch_models, fetch_rows in endpoints():
+        field = routes[path].response_field
+        fetch_ms, models = best_of(iterations, fetch_models)
+        stock_ms, stock = best_of(iterations, lambda: stock_body(field, models))
+        expected = json.loads(stock)
+        entry = {
+            "items": len(models),
+            "fetch_models_ms": fetch_ms,
+            "stock_encode_ms": stock_ms,
+            "stock_total_ms": round(fetch_ms + stock_ms, 3),
+        }
+
+        variants = [("trusted", models)]
+        if fetch_rows is not None:
+            rows_fetch_ms, rows = best_of(iterations, fetch_rows)
+            entry["fetch_rows_ms"] = rows_fetch_ms
+            variants.append(("rows", rows))
+        for name, content in variants:
+            if isinstance(content, str):
+                encode_ms, body = best_of(iterations, lambda: fast_json.raw(content).body)
+                entry[f"{name}_sqlite_encode_ms"] = encode_ms
+                entry[f"{name}_sqlite_total_ms"] = round(entry["fetch_rows_ms"] + encode_ms, 3)
+                entry[f"{name}_sqlite_identical"] = json.loads(body) == expected
+                continue
+            for encoder in (["orjson"] if has_orjson else []) + ["stdlib"]:
+                saved = fast_json.orjson
+                if encoder == "stdlib":
+                    fast_json.orjson = None
+                try:
+                    encode_ms, body = best_of(iterations, lambda: fast_json.trusted(content).body)
+                finally:
+                    fast_json.orjson = saved
+                fetch = entry["fetch_rows_ms"] if name == "rows" else fetch_ms
+                entry[f"{name}_{encoder}_encode_ms"] = encode_ms
+                entry[f"{name}_{encoder}_total_ms"] = round(fetch + encode_ms, 3)
+                entry[f"{name}_{encoder}_identical"] = json.loads(body) == expected
+        results[f"GET {path}"] = entry
+    return {"orjson": has_orjson, "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ledger_gen.add_arguments(parser)
+    parser.set_defaults(transactions=100_000)
+    parser.add_argument("--iterations", type=int, default=5, help="best-of runs per measurement")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory() as data_dir:
+        os.environ["SAIVE_USER_DATA"] = data_dir
+        ledger = ledger_gen.generate_from_args(args)
+        ledger.pop("database", None)
+        report = {"ledger": ledger, "iterations": args.iterations, **bench(args.iterations)}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+
+
+if __name__ == "__main__":
+    main()
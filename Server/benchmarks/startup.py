@@ -0,0 +1,169 @@
+"""
+startup.py — Reproducible cold-start benchmark for backend build profiles.
+
+Each run launches the backend with a fresh SAIVE_USER_DATA directory and
+records two timings from process spawn, matching what Electron waits for:
+    port_ms   — the `PORT:<n>` line appears on stdout
+    ready_ms  — GET / first returns 200
+
+Usage (from Server/):
+    python benchmarks/startup.py                             # source + any built dist/ profiles
+    python benchmarks/startup.py --runs 20 --json
+    python benchmarks/startup.py \\
+        --profile onefile=dist-onefile/sAIve-backend \\
+        --profile onedir=dist/sAIve-backend/sAIve-backend
+
+Build the profiles to compare first, e.g.:
+    pyinstaller sAIve-backend.spec --distpath dist-onefile
+    pyinstaller sAIve-backend-onedir.spec --distpath dist
+"""
+
+import argparse
+import http.client
+import json
+import os
+import re
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+EXE_SUFFIX = ".exe" if sys.platform == "win32" else ""
+TIMEOUT_S = 60.0
+
+
+def default_profiles() -> dict[str, list[str]]:
+    profiles = {"source": [sys.executable, "launcher.py"]}
+    binary = f"sAIve-backend{EXE_SUFFIX}"
+    candidates = {
+        "onefile": [SERVER_DIR / "dist-onefile" / binary, SERVER_DIR / "dist" / binary],
+        "onedir": [SERVER_DIR / "dist" / "sAIve-backend" / binary],
+    }
+    for name, paths in candidates.items():
+        for path in paths:
+            if path.is_file():
+                profiles[name] = [str(path)]
+                break
+    return profiles
+
+
+def _read_port(proc: subprocess.Popen, found: dict, done: threading.Event) -> None:
+    for line in proc.stdout:
+        match = re.search(r"PORT:(\d+)", line)
+        if match:
+            found["port"] = int(match.group(1))
+            found["t"] = time.perf_counter()
+            done.set()
+            break
+    # Keep draining so the child never blocks on a full pipe
+    for _ in proc.stdout:
+        pass
+    done.set()
+
+
+def _get_root(port: int) -> bool:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+    try:
+        conn.request("GET", "/")
+        return conn.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        conn.close()
+
+
+def measure_once(command: list[str]) -> dict:
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = {**os.environ, "SAIVE_USER_DATA": data_dir, "PYTHONUNBUFFERED": "1"}
+        env.pop("PORT", None)
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            command, cwd=SERVER_DIR, env=env, text=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        try:
+            found: dict = {}
+            done = threading.Event()
+            threading.Thread(target=_read_port, args=(proc, found, done), daemon=True).start()
+            if not done.wait(TIMEOUT_S) or "port" not in found:
+                raise RuntimeError(f"{command} did not report a port")
+            port_ms = (found["t"] - start) * 1000
+
+            while not _get_root(found["port"]):
+                if time.perf_counter() - start > TIMEOUT_S:
+                    raise RuntimeError(f"{command} never answered GET /")
+                time.sleep(0.005)
+            ready_ms = (time.perf_counter() - start) * 1000
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return {"port_ms": port_ms, "ready_ms": ready_ms}
+
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+    return {
+        "min": round(ordered[0], 1),
+        "median": round(statistics.median(ordered), 1),
+        "p95": round(p95, 1),
+        "max": round(ordered[-1], 1),
+    }
+
+
+def run(profiles: dict[str, list[str]], runs: int, warmup: int) -> dict:
+    report = {"runs": runs, "platform": sys.platform, "profiles": {}}
+    for name, command in profiles.items():
+        for _ in range(warmup):
+            measure_once(command)  # prime the OS file cache
+        results = [measure_once(command) for _ in range(runs)]
+        report["profiles"][name] = {
+            "command": command,
+            "port_ms": summarize([r["port_ms"] for r in results]),
+            "ready_ms": summarize([r["ready_ms"] for r in results]),
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['runs']} runs per profile on {report['platform']}\n")
+    print(f"{'profile':<12}{'PORT: median':>14}{'p95':>9}{'GET / median':>15}{'p95':>9}")
+    for name, row in report["profiles"].items():
+        print(f"{name:<12}{row['port_ms']['median']:>14}{row['port_ms']['p95']:>9}"
+              f"{row['ready_ms']['median']:>15}{row['ready_ms']['p95']:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", action="append", default=[], metavar="NAME=COMMAND",
+                        help="profile to benchmark; repeatable (default: source + built dist/ profiles)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiles = {}
+        for spec in args.profile:
+            name, _, command = spec.partition("=")
+            profiles[name] = shlex.split(command)
+    else:
+        profiles = default_profiles()
+
+    report = run(profiles, args.runs, args.warmup)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
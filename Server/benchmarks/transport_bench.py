@@ -0,0 +1,247 @@
+"""
+transport_bench.py — Request latency over loopback TCP vs a Unix domain socket.
+
+Generates a synthetic ledger (see ledger_gen.py), then starts the real
+backend through launcher.py twice on that database: once on a free loopback
+port (`PORT:`) and once on a Unix socket (`--uds`, `UDS:`). For each
+transport it measures, with a stdlib http.client:
+
+    ping        GET / — transport and framework overhead only
+    refetch     the GETs the UI issues after a transactions_changed SSE event,
+                one burst per iteration, timed per request and per burst
+
+Both scenarios run over one kept-alive connection ("keepalive") and with a
+new connection per request ("connect"), which is what a burst of parallel
+fetches opening fresh sockets costs. The report also records whether uvloop
+and httptools were importable, since uvicorn picks them up automatically.
+
+Usage (from Server/, Linux/macOS):
+    python benchmarks/transport_bench.py
+    python benchmarks/transport_bench.py --transactions 10000 --iterations 500 --output transport.json
+"""
+
+import argparse
+import contextlib
+import http.client
+import importlib.util
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCH_DIR.parent
+for path in (str(SERVER_DIR), str(BENCH_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ledger_gen  # noqa: E402
+
+USER_ID = 1
+TIMEOUT_S = 60.0
+
+# Mirrors EVENT_QUERY_MAP["transactions_changed"] in sAIve/src/hooks/useServerEvents.ts
+REFETCH_ENDPOINTS = [
+    "/transactions/",
+    "/user_assets/{user_id}/all",
+    "/user_asset/{user_id}",
+    "/user_assets/{user_id}/category",
+    "/stats/categories/{user_id}",
+    "/stats/history/{user_id}",
+    "/stats/category-history/{user_id}",
+    "/stats/daily-spending/{user_id}",
+    "/users/{user_id}",
+    "/stats/sankey/{user_id}",
+]
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 10):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def connector(address: str):
+    """A factory for connections to a `PORT:<n>` or `UDS:<path>` address."""
+    kind, _, target = address.partition(":")
+    if kind == "UDS":
+        return lambda: UnixHTTPConnection(target)
+    return lambda: http.client.HTTPConnection("127.0.0.1", int(target), timeout=10)
+
+
+def get(conn: http.client.HTTPConnection, path: str) -> None:
+    conn.request("GET", path)
+    response = conn.getresponse()
+    response.read()
+    if response.status != 200:
+        raise RuntimeError(f"GET {path} returned {response.status}")
+
+
+@contextlib.contextmanager
+def backend(data_dir: str, args: list[str]):
+    """Start launcher.py and yield the address line it announces."""
+    env = {**os.environ, "SAIVE_USER_DATA": data_dir, "PYTHONUNBUFFERED": "1", "SAIVE_PRELOAD": ""}
+    env.pop("PORT", None)
+    env.pop("SAIVE_UDS", None)
+    proc = subprocess.Popen(
+        [sys.executable, "launcher.py", *args], cwd=SERVER_DIR, env=env, text=True,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    found: dict = {}
+    announced = threading.Event()
+
+    def read():
+        for line in proc.stdout:
+            match = re.search(r"(PORT:\d+|UDS:\S+)", line)
+            if match and not announced.is_set():
+                found["address"] = match.group(1)
+                announced.set()
+        announced.set()
+
+    threading.Thread(target=read, daemon=True).start()
+    try:
+        if not announced.wait(TIMEOUT_S) or "address" not in found:
+            raise RuntimeError(f"launcher.py {' '.join(args)} did not announce an address")
+        connect = connector(found["address"])
+        started = time.perf_counter()
+        while True:
+            conn = connect()
+            try:
+                get(conn, "/")
+                break
+            except OSError:
+                if time.perf_counter() - started > TIMEOUT_S:
+                    raise
+                time.sleep(0.01)
+            finally:
+                conn.close()
+        yield found["address"]
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))], 3)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+    }
+
+
+def timed_requests(connect, paths: list[str], iterations: int, keepalive: bool) -> tuple[list, list]:
+    """Per-request and per-iteration (all of `paths`) latencies in ms."""
+    per_request, per_burst = [], []
+    conn = connect() if keepalive else None
+    try:
+        for _ in range(iterations):
+            burst_started = time.perf_counter()
+            for path in paths:
+                started = time.perf_counter()
+                if keepalive:
+                    get(conn, path)
+                else:
+                    fresh = connect()
+                    try:
+                        get(fresh, path)
+                    finally:
+                        fresh.close()
+                per_request.append((time.perf_counter() - started) * 1000)
+            per_burst.append((time.perf_counter() - burst_started) * 1000)
+    finally:
+        if conn is not None:
+            conn.close()
+    return per_request, per_burst
+
+
+def bench_transport(address: str, iterations: int) -> dict:
+    connect = connector(address)
+    refetch = [path.format(user_id=USER_ID) for path in REFETCH_ENDPOINTS]
+    timed_requests(connect, ["/"] + refetch, 3, keepalive=True)  # warm caches and the threadpool
+
+    results = {}
+    for mode in ("keepalive", "connect"):
+        ping, _ = timed_requests(connect, ["/"], iterations, keepalive=mode == "keepalive")
+        requests, bursts = timed_requests(connect, refetch, max(iterations // 10, 1), keepalive=mode == "keepalive")
+        results[mode] = {
+            "ping": summarize(ping),
+            "refetch_request": summarize(requests),
+            "refetch_burst": summarize(bursts),
+        }
+    return results
+
+
+def run(args: argparse.Namespace) -> dict:
+    if sys.platform == "win32" or not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("Unix domain sockets are not available on this platform")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        with contextlib.redirect_stdout(sys.stderr):
+            os.environ["SAIVE_USER_DATA"] = data_dir
+            ledger = ledger_gen.generate_from_args(args)
+            ledger.pop("database", None)
+
+        transports = {}
+        with backend(data_dir, []) as address:
+            transports["tcp"] = {"address": address, **bench_transport(address, args.iterations)}
+        with backend(data_dir, ["--uds", os.path.join(data_dir, "saive.sock")]) as address:
+            if not address.startswith("UDS:"):
+                raise RuntimeError(f"launcher fell back to {address}")
+            transports["uds"] = {"address": address, **bench_transport(address, args.iterations)}
+
+    speedup = {
+        mode: {
+            scenario: round(transports["tcp"][mode][scenario]["p50_ms"] / transports["uds"][mode][scenario]["p50_ms"], 2)
+            for scenario in ("ping", "refetch_request", "refetch_burst")
+        }
+        for mode in ("keepalive", "connect")
+    }
+    return {
+        "ledger": ledger,
+        "iterations": args.iterations,
+        "platform": sys.platform,
+        "uvloop": importlib.util.find_spec("uvloop") is not None,
+        "httptools": importlib.util.find_spec("httptools") is not None,
+        "transports": transports,
+        "p50_speedup_uds_over_tcp": speedup,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ledger_gen.add_arguments(parser)
+    parser.set_defaults(transactions=2_000)
+    parser.add_argument("--iterations", type=int, default=1000, help="GET / requests per mode (refetch runs a tenth)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args), indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+compact_output.py — Token-lean results for the list-returning MCP tools.
+
+The assistant runs on small local models (270M–1B parameters) where every
+prompt token costs latency, and the list tools answer with one dict per row:
+every key repeated on every row, floats at whatever precision SQLite kept,
+and FastMCP pretty-prints dicts with two-space indents. With compact=True
+(or SAIVE_MCP_COMPACT=1 as the server default) those tools return one
+minified JSON table instead:
+
+    {"columns": ["id", "day", "amount", "type", "category", "recipient"],
+     "rows": [[412, 3, 15.49, "expense", 1, "Netflix"], ...],
+     "codes": {"category": ["Food", "Subscriptions"]},
+     "others": {"count": 180, "expense": 2210.4, "income": 0}}
+
+  * keys appear once, in "columns"; each row is a plain array
+  * numbers are rounded to cents and whole values lose their ".0"
+  * repetitive text columns are interned: the row holds an index into that
+    column's list under "codes"
+  * at most MAX_ROWS rows are listed (SAIVE_MCP_MAX_ROWS), or only the `top`
+    largest when the caller asks; the rest are folded into "others" (count
+    and totals), so sums over the answer stay exact
+
+Without top and under the cap nothing but float noise is dropped:
+expand() turns a table back into the verbose rows.
+
+Usage (backend):
+    import compact_output
+    if compact_output.enabled(compact):
+        return compact_output.encode(compact_output.table(
+            rows, ["id", "day", "amount", "type", "category", "recipient"],
+            codes=("category",), top=top, rank=lambda r: r["amount"],
+            summarize=compact_output.flow_totals))
+"""
+
+import os
+from typing import Callable, Optional
+
+import fast_json
+
+DEFAULT = os.environ.get("SAIVE_MCP_COMPACT", "0") == "1"
+MAX_ROWS = int(os.environ.get("SAIVE_MCP_MAX_ROWS", "200"))
+
+
+def enabled(compact: Optional[bool]) -> bool:
+    """A tool's `compact` argument, or the server default when it is None."""
+    return DEFAULT if compact is None else compact
+
+
+def number(value):
+    """Floats rounded to cents, whole ones as ints; anything else unchanged."""
+    if isinstance(value, float):
+        value = round(value, 2)
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def flow_totals(rows: list) -> dict:
+    """Count and expense/income totals of transaction-shaped rows."""
+    expense = sum(r["amount"] for r in rows if r["type"] == "expense")
+    income = sum(r["amount"] for r in rows if r["type"] == "income")
+    return {"count": len(rows), "expense": number(expense), "income": number(income)}
+
+
+def column_totals(*columns: str) -> Callable:
+    """A summarize() for table(): count plus the sum of each of `columns`."""
+    def summarize(rows: list) -> dict:
+        return {"count": len(rows), **{c: number(sum(r[c] or 0 for r in rows)) for c in columns}}
+    return summarize
+
+
+def table(rows: list, columns: list, codes: tuple = (), top: Optional[int] = None,
+          rank: Optional[Callable] = None, summarize: Optional[Callable] = None) -> dict:
+    """`rows` (dicts with at least `columns`) as a compact table.
+
+    Keeps the `top` rows with the highest rank(row), or all of them, up to
+    MAX_ROWS; kept rows stay in their original order.
+    The rest are summarised by summarize(rows) under "others" (just their
+    count without one).
+    """
+    keep = min(len(rows) if top is None else max(top, 0), MAX_ROWS)
+    dropped = []
+    if keep < len(rows):
+        order = range(len(rows))
+        if rank is not None:
+            order = sorted(order, key=lambda i: rank(rows[i]), reverse=True)
+        kept = set(order[:keep])
+        dropped = [row for i, row in enumerate(rows) if i not in kept]
+        rows = [row for i, row in enumerate(rows) if i in kept]
+
+    lookups = {column: {} for column in codes if column in columns}
+    values = []
+    for row in rows:
+        values.append([
+            lookups[column].setdefault(row[column], len(lookups[column]))
+            if column in lookups and row[column] is not None else number(row[column])
+            for column in columns
+        ])
+    result = {"columns": columns, "rows": values}
+    if lookups:
+        result["codes"] = {column: list(lookup) for column, lookup in lookups.items()}
+    if dropped:
+        result["others"] = summarize(dropped) if summarize is not None else {"count": len(dropped)}
+    return result
+
+
+def expand(result: dict) -> list:
+    """The listed rows of a table() result as dicts again."""
+    codes = result.get("codes", {})
+    columns = result["columns"]
+    return [
+        {column: codes[column][value] if column in codes and value is not None else value
+         for column, value in zip(columns, row)}
+        for row in result["rows"]
+    ]
+
+
+def encode(result) -> str:
+    """Minified JSON text; FastMCP passes a str result through untouched."""
+    return fast_json.dumps(result).decode("utf-8")
@@ -0,0 +1,127 @@
+"""
+compression.py — Negotiated gzip/brotli compression for large responses.
+
+Pure ASGI middleware. A complete (non-streaming) response whose body is at
+least MIN_SIZE bytes and whose type is JSON or text is compressed with the
+best encoding the client accepts: brotli when the `brotli` package is
+installed and `br` is accepted, otherwise gzip. Streaming responses (SSE,
+MCP) and anything already encoded pass through untouched. Bodies above
+THREAD_MIN_SIZE are compressed on a worker thread to keep the event loop free.
+
+It is enabled in cloud mode (PORT set), where responses cross a real network.
+On the desktop the client sits on loopback and compression would only cost
+CPU. SAIVE_COMPRESS=1/0 forces it on or off either way.
+
+Usage (backend):
+    import compression
+    if compression.enabled():
+        app.add_middleware(compression.CompressionMiddleware)
+"""
+
+import gzip
+import os
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+MIN_SIZE = int(os.environ.get("SAIVE_COMPRESS_MIN_BYTES", "1024"))
+THREAD_MIN_SIZE = 128 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def enabled() -> bool:
+    setting = os.environ.get("SAIVE_COMPRESS")
+    if setting is not None:
+        return setting.strip().lower() in ("1", "true", "yes", "on")
+    return bool(os.environ.get("PORT"))
+
+
+def negotiate(accept_encoding: str):
+    """The encoding to use for an Accept-Encoding header, or None."""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip()] = quality
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or content_type.startswith("text/event-stream")
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            if message.get("more_body", False):
+                # Streaming body: send it as-is rather than hold it back
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if len(body) >= self.minimum_size:
+                if len(body) >= THREAD_MIN_SIZE:
+                    body = await anyio.to_thread.run_sync(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,7 +1,15 @@
-from database import create_connection
-from models import User, UserAsset, Transaction, TransactionCreate, Budget, BudgetCreate, Debt, DebtCreate
+import hashlib
+import json
+import re
+import sqlite3
+
+from database import create_connection, rebuild_user_totals, rebuild_net_worth_snapshots, transaction_fingerprint, EXPECTED_USER_TOTALS_SQL, CHANGE_LOG_TABLES
+import unit_of_work
+from models import User, UserAsset, Transaction, TransactionCreate, TransactionCategory, Budget, BudgetCreate, Debt, DebtCreate
 
 def create_user(user: User):
+    """Inserts the user and returns the stored row. net_worth follows
+    user_totals, so the value passed in does not survive the insert."""
     conn = create_connection()
     cursor = conn.cursor()
 
@@ -9,10 +17,14 @@ def create_user(user: User):
         INSERT INTO users (name, net_worth)
         VALUES (?, ?)
     ''', (user.name, user.net_worth))
+    user_id = cursor.lastrowid
+    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+    row = cursor.fetchone()
 
     conn.commit()
     conn.close()
-    return user
+    return User(id=row['id'], name=row['name'], net_worth=row['net_worth'])
+@unit_of_work.identity("user")
 def get_user(user_id: int):
     conn = create_connection()
     cursor = conn.cursor()
@@ -27,20 +39,25 @@ def get_user(user_id: int):
     if row:
         return User(id=row['id'], name=row['name'], net_worth=row['net_worth'])
     return None
+_UPDATE_USER = '''
+        UPDATE users
+        SET name = ?, net_worth = ?
+        WHERE id = ?
+    '''
 def update_user(user_id: int, user: User):
+    params = (user.name, user.net_worth, user_id)
+    if unit_of_work.defer_write(("user", user_id), user, _UPDATE_USER, params):
+        return user
     conn = create_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        UPDATE users
-        SET name = ?, net_worth = ?
-        WHERE id = ?
-    ''', (user.name, user.net_worth, user_id))
+    cursor.execute(_UPDATE_USER, params)
 
     conn.commit()
     conn.close()
     return user
 def delete_user(user_id: int):
+    unit_of_work.evict(("user", user_id))
     conn = create_connection()
     cursor = conn.cursor()
 
@@ -52,6 +69,7 @@ def delete_user(user_id: int):
     conn.close()
 
 def create_user_asset(user_asset: UserAsset):
+    unit_of_work.evict(("user_asset", user_asset.user_id, user_asset.year, user_asset.month))
     conn = create_connection()
     cursor = conn.cursor()
 
@@ -63,6 +81,7 @@ def create_user_asset(user_asset: UserAsset):
     conn.commit()
     conn.close()
     return user_asset
+@unit_of_work.identity("user_asset")
 def get_user_asset(user_asset_id: int, current_year: int, current_month: int ):
     conn = create_connection()
     cursor = conn.cursor()
@@ -94,15 +113,20 @@ def has_asset(user_id: int):
     return False
 
 
+_UPDATE_USER_ASSET = '''
+        UPDATE user_assets
+        SET user_id = ?, year = ?, month = ?, TIncome = ?, TExpense = ?, TSavings = ?, NetWorth = ?
+        WHERE id = ?
+    '''
 def update_user_asset(user_asset: UserAsset):
+    params = (user_asset.user_id, user_asset.year, user_asset.month, user_asset.TIncome, user_asset.TExpense, user_asset.TSavings, user_asset.net_worth, user_asset.id)
+    key = ("user_asset", user_asset.user_id, user_asset.year, user_asset.month)
+    if unit_of_work.defer_write(key, user_asset, _UPDATE_USER_ASSET, params):
+        return user_asset
     conn = create_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        UPDATE user_assets
-        SET user_id = ?, year = ?, month = ?, TIncome = ?, TExpense = ?, TSavings = ?, NetWorth = ?
-        WHERE id = ?
-    ''', (user_asset.user_id, user_asset.year, user_asset.month, user_asset.TIncome, user_asset.TExpense, user_asset.TSavings, user_asset.net_worth, user_asset.id))
+    cursor.execute(_UPDATE_USER_ASSET, params)
 
     conn.commit()
     conn.close()
@@ -126,6 +150,76 @@ def get_all_user_assets(user_id: int):
     
     return user_assets
 
+def get_all_user_asset_rows(user_id: int) -> list:
+    """get_all_user_assets() as rows shaped like models.UserAsset."""
+    conn = create_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, user_id, year, month, TIncome, TExpense, TSavings, NetWorth AS net_worth
+        FROM user_assets
+        WHERE user_id = ?
+    ''', (user_id,))
+
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_user_assets_since(user_id: int, year: int, month: int):
+    """The user's monthly rows from (year, month) on, plus the latest row before
+    it whose savings carry over into the first recomputed month."""
+    conn = create_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT * FROM user_assets
+        WHERE user_id = ?
+        AND year * 100 + month >= COALESCE((
+            SELECT MAX(year * 100 + month) FROM user_assets
+            WHERE user_id = ? AND year * 100 + month < ?
+        ), ?)
+    ''', (user_id, user_id, year * 100 + month, year * 100 + month))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [UserAsset(id=row['id'], user_id=row['user_id'], year=row['year'], month=row['month'], TIncome=row['TIncome'], TExpense=row['TExpense'], TSavings=row['TSavings'], net_worth=row['NetWorth']) for row in rows]
+
+def get_category_history(user_id: int, categories: list, months: int = 12) -> list:
+    """[(year, month, {category: expense total})] for the user's latest `months`
+    user_assets months, oldest first, in one grouped query. Categories with no
+    expenses in a month are left out of its dict."""
+    conn = create_connection()
+    cursor = conn.cursor()
+
+    placeholders = ", ".join("?" for _ in categories)
+    cursor.execute(f'''
+        WITH months AS (
+            SELECT id, year, month, printf('%04d-%02d-01', year, month) AS first_day
+            FROM user_assets
+            WHERE user_id = ?
+            ORDER BY year DESC, month DESC, id DESC
+            LIMIT ?
+        )
+        SELECT m.id, m.year, m.month, t.category, SUM(t.amount) AS total
+        FROM months m
+        LEFT JOIN transactions t
+            ON t.user_id = ? AND t.type = 'expense' AND t.category IN ({placeholders})
+            AND t.date >= m.first_day AND t.date < date(m.first_day, '+1 month')
+        GROUP BY m.id, t.category
+        ORDER BY m.year, m.month, m.id
+    ''', (user_id, months, user_id, *categories))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    history = {}
+    for row in rows:
+        _, _, totals = history.setdefault(row['id'], (row['year'], row['month'], {}))
+        if row['category'] is not None:
+            totals[row['category']] = row['total']
+    return list(history.values())
+
 def get_assets_by_all_category(user_id: int):
     conn = create_connection()
     cursor = conn.cursor()
@@ -148,6 +242,7 @@ def get_assets_by_all_category(user_id: int):
     return cat_spends
 
 def delete_user_asset(user_asset_id: int):
+    unit_of_work.evict_kind("user_asset")
     conn = create_connection()
     cursor = conn.cursor()
 
@@ -176,7 +271,10 @@ def create_transaction(transaction: TransactionCreate):
     ))
 
     conn.commit()
+    transaction_id = cursor.lastrowid
     conn.close()
+    return transaction_id
+@unit_of_work.identity("transaction")
 def get_transaction(transaction_id: int):
     conn = create_connection()
     cursor = conn.cursor()
@@ -210,6 +308,89 @@ def get_all_transactions():
     
     return transactions
 
+# JSON key -> SQL expression, in models.Transaction field order
+TRANSACTION_JSON_COLUMNS = {
+    'id': 'id', 'user_id': 'user_id', 'recipient': 'recipient', 'date': 'date(date)',
+    'amount': 'amount', 'category': 'category', 'type': 'type', 'debt_id': 'debt_id',
+}
+
+def get_all_transactions_json(fields: list = None) -> str:
+    """get_all_transactions() encoded to a JSON array by SQLite itself, with
+    the same keys as models.Transaction (or only `fields`, a sparse fieldset
+    already checked against the model). REALs keep 15 significant digits,
+    plenty for currency amounts."""
+    keys = fields or list(TRANSACTION_JSON_COLUMNS)
+    members = ", ".join(f"'{key}', {key}" for key in keys)
+    columns = ", ".join(
+        key if TRANSACTION_JSON_COLUMNS[key] == key else f"{TRANSACTION_JSON_COLUMNS[key]} AS {key}" for key in keys
+    )
+
+    conn = create_connection()
+    cursor = conn.cursor()
+
+    # json_group_array keeps the subquery's row order
+    cursor.execute(f'''
+        SELECT json_group_array(json_object({members})) AS body
+        FROM (
+            SELECT {columns}
+            FROM transactions
+            ORDER BY transactions.date ASC
+        )
+    ''')
+
+    body = cursor.fetchone()['body']
+    conn.close()
+    return body
+
+# Terms as FTS5's unicode61 tokenizer splits them (underscore is a separator)
+_SEARCH_TERM = re.compile(r"[^\W_]+")
+MAX_SEARCH_TERMS = 8
+
+def search_transactions(user_id: int, query: str, limit: int = 50, offset: int = 0) -> tuple:
+    """Transactions whose recipient or category contains every term of `query`,
+    each matched as a word prefix ("net fl" finds "Netflix"). Ranked by BM25
+    with recipient hits weighted over category hits, then newest first.
+    Returns (total matches, one page of Transaction)."""
+    terms = _SEARCH_TERM.findall(query.lower())[:MAX_SEARCH_TERMS]
+    if not terms:
+        return 0, []
+    columns = "t.id, t.user_id, t.recipient, date(t.date) AS date, t.amount, t.category, t.type, t.debt_id"
+
+    conn = create_connection()
+    cursor = conn.cursor()
+    try:
+        # CROSS JOIN pins the FTS scan as the outer loop; otherwise the planner
+        # walks the user's transactions and runs the MATCH once per row
+        match = " ".join(f'"{term}"*' for term in terms)
+        cursor.execute('''
+            SELECT COUNT(*) FROM transactions_fts f CROSS JOIN transactions t ON t.id = f.rowid
+            WHERE transactions_fts MATCH ? AND t.user_id = ?
+        ''', (match, user_id))
+        total = cursor.fetchone()[0]
+        cursor.execute(f'''
+            SELECT {columns}
+            FROM transactions_fts f CROSS JOIN transactions t ON t.id = f.rowid
+            WHERE transactions_fts MATCH ? AND t.user_id = ?
+            ORDER BY bm25(transactions_fts, 10.0, 1.0), t.date DESC, t.id DESC
+            LIMIT ? OFFSET ?
+        ''', (match, user_id, limit, offset))
+    except sqlite3.OperationalError as e:
+        if "transactions_fts" not in str(e):
+            raise
+        # SQLite built without FTS5: substring scan, same filter semantics
+        where = " AND ".join("(t.recipient LIKE ? OR t.category LIKE ?)" for _ in terms)
+        params = [p for term in terms for p in (f"%{term}%", f"%{term}%")]
+        cursor.execute(f'SELECT COUNT(*) FROM transactions t WHERE t.user_id = ? AND {where}', (user_id, *params))
+        total = cursor.fetchone()[0]
+        cursor.execute(f'''
+            SELECT {columns} FROM transactions t WHERE t.user_id = ? AND {where}
+            ORDER BY t.date DESC, t.id DESC LIMIT ? OFFSET ?
+        ''', (user_id, *params, limit, offset))
+
+    results = [Transaction(**dict(row)) for row in cursor.fetchall()]
+    conn.close()
+    return total, results
+
 def get_transactions_by_month(user_id: int, year: int, month: int):
     conn = create_connection()
     cursor = conn.cursor()
@@ -232,8 +413,25 @@ def get_transactions_by_month(user_id: int, year: int, month: int):
     
     return transactions
 
+def get_transactions_since(user_id: int, year: int, month: int):
+    """The user's transactions dated in (year, month) or later, oldest first."""
+    conn = create_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT * FROM transactions
+        WHERE user_id = ? AND date >= ?
+        ORDER BY date ASC
+    ''', (user_id, f"{year:04d}-{month:02d}-01"))
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [Transaction(id=row['id'], user_id=row['user_id'], date=row['date'], amount=row['amount'], category=row['category'], type=row['type'], recipient=row['recipient'], debt_id=row['debt_id']) for row in rows]
+
 
 def delete_transaction(transaction_id: int):
+    unit_of_work.evict(("transaction", transaction_id))
     conn = create_connection()
     cursor = conn.cursor()
 
@@ -244,6 +442,86 @@ def delete_transaction(transaction_id: int):
     conn.commit()
     conn.close()
 
+# --- Duplicate Detection (transaction fingerprints) ---
+
+def match_duplicate_transactions(transactions: list) -> list:
+    """For each incoming TransactionCreate, the id of an existing transaction
+    with the same fingerprint (see database.transaction_fingerprint), or None.
+    One indexed probe per row, all in one statement. Each existing transaction
+    answers for at most one incoming row, so a batch holding the same line
+    twice only matches twice if it was stored twice before."""
+    if not transactions:
+        return []
+    batch = json.dumps([[t.user_id, t.date.isoformat(), t.amount, t.recipient, t.type] for t in transactions])
+    fingerprint = transaction_fingerprint(*(f"json_extract(value, '$[{i}]')" for i in range(1, 5)))
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        WITH incoming AS (
+            SELECT key AS row, json_extract(value, '$[0]') AS user_id, {fingerprint} AS fingerprint
+            FROM json_each(?)
+        )
+        SELECT incoming.user_id, incoming.fingerprint,
+               (SELECT json_group_array(id) FROM (
+                    SELECT id FROM transactions
+                    WHERE transactions.user_id = incoming.user_id
+                      AND transactions.fingerprint = incoming.fingerprint
+                    ORDER BY id
+               )) AS ids
+        FROM incoming
+        ORDER BY incoming.row
+    ''', (batch,))
+    rows = cursor.fetchall()
+    conn.close()
+
+    unclaimed = {}
+    matches = []
+    for row in rows:
+        key = (row['user_id'], row['fingerprint'])
+        if key not in unclaimed:
+            unclaimed[key] = iter(json.loads(row['ids']))
+        matches.append(next(unclaimed[key], None))
+    return matches
+
+def merge_duplicate_transaction(transaction_id: int, transaction: TransactionCreate) -> bool:
+    """Takes the incoming category and recipient spelling onto an existing
+    duplicate. Debt-linked transactions are left alone. True if it changed."""
+    unit_of_work.evict(("transaction", transaction_id))
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE transactions SET category = ?, recipient = ?
+        WHERE id = ? AND debt_id IS NULL AND (category IS NOT ? OR recipient IS NOT ?)
+    ''', (transaction.category, transaction.recipient, transaction_id,
+          transaction.category, transaction.recipient))
+    changed = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return changed
+
+def create_transactions(transactions: list, on_duplicate: str = "allow") -> list:
+    """Inserts a batch of transactions without debt links, applying the
+    duplicate policy (models.DuplicatePolicy). Returns (outcome, duplicate_of)
+    per row; outcome is 'inserted', 'flagged' (inserted, duplicate_of is the
+    existing match), 'merged' or 'skipped'. Run it inside a unit of work."""
+    if on_duplicate == "allow":
+        matches = [None] * len(transactions)
+    else:
+        matches = match_duplicate_transactions(transactions)
+    outcomes = []
+    for transaction, duplicate_of in zip(transactions, matches):
+        if duplicate_of is None:
+            create_transaction(transaction)
+            outcomes.append(("inserted", None))
+        elif on_duplicate == "flag":
+            create_transaction(transaction)
+            outcomes.append(("flagged", duplicate_of))
+        elif on_duplicate == "merge" and merge_duplicate_transaction(duplicate_of, transaction):
+            outcomes.append(("merged", duplicate_of))
+        else:
+            outcomes.append(("skipped", duplicate_of))
+    return outcomes
+
 # --- Recurring Transactions ---
 
 from models import RecurringTransaction, RecurringTransactionCreate, Notification, NotificationCreate
@@ -552,6 +830,7 @@ def get_debts_by_type(user_id: int, debt_type: str) -> list:
     conn.close()
     return [_row_to_debt(r) for r in rows]
 
+@unit_of_work.identity("debt")
 def get_debt(debt_id: int):
     conn = create_connection()
     cursor = conn.cursor()
@@ -561,6 +840,7 @@ def get_debt(debt_id: int):
     return _row_to_debt(row) if row else None
 
 def update_debt(debt_id: int, debt: DebtCreate) -> Debt:
+    unit_of_work.evict(("debt", debt_id))
     conn = create_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -575,26 +855,84 @@ def update_debt(debt_id: int, debt: DebtCreate) -> Debt:
     return get_debt(debt_id)
 
 def update_debt_balance(debt_id: int, new_balance: float):
+    unit_of_work.evict(("debt", debt_id))
     conn = create_connection()
     cursor = conn.cursor()
     cursor.execute('UPDATE debts SET balance = ? WHERE id = ?', (max(new_balance, 0), debt_id))
     conn.commit()
     conn.close()
 
-def delete_debt(debt_id: int):
+def debt_balance_delta(transaction) -> float:
+    """How a debt-linked transaction moves its debt: payments (Bills) reduce
+    the balance, anything else is a charge that increases it."""
+    if transaction.category == TransactionCategory.Bills:
+        return -transaction.amount
+    return transaction.amount
+
+def create_debt_linked_transaction(transaction: TransactionCreate):
+    """Inserts the transaction and applies it to its debt in one SQLite
+    transaction, with the balance computed in SQL so concurrent writers can't
+    lose an update. Returns the new balance, or None (nothing written) when
+    the debt doesn't exist or belongs to another user."""
+    unit_of_work.evict(("debt", transaction.debt_id))
     conn = create_connection()
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM debts WHERE id = ?', (debt_id,))
+    if not conn.in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('UPDATE debts SET balance = MAX(balance + ?, 0) WHERE id = ? AND user_id = ?',
+                   (debt_balance_delta(transaction), transaction.debt_id, transaction.user_id))
+    if cursor.rowcount == 0:
+        conn.commit()
+        conn.close()
+        return None
+    cursor.execute('''
+        INSERT INTO transactions (user_id, date, amount, category, recipient, type, debt_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (transaction.user_id, transaction.date, transaction.amount, transaction.category,
+          transaction.recipient, transaction.type, transaction.debt_id))
+    cursor.execute('SELECT balance FROM debts WHERE id = ?', (transaction.debt_id,))
+    balance = cursor.fetchone()[0]
     conn.commit()
     conn.close()
+    return balance
+
+def delete_transaction_reversing_debt(transaction_id: int):
+    """Deletes the transaction and reverses its effect on a linked debt in one
+    SQLite transaction. Returns (transaction, new_balance): transaction is None
+    if it was already gone (nothing reversed twice), new_balance is None when
+    no existing debt was linked."""
+    unit_of_work.evict(("transaction", transaction_id))
+    conn = create_connection()
+    cursor = conn.cursor()
+    if not conn.in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,))
+    row = cursor.fetchone()
+    if row is None:
+        conn.commit()
+        conn.close()
+        return None, None
+    transaction = Transaction(id=row['id'], user_id=row['user_id'], date=row['date'], amount=row['amount'], category=row['category'], type=row['type'], recipient=row['recipient'], debt_id=row['debt_id'])
+    cursor.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
+    balance = None
+    if transaction.debt_id is not None:
+        unit_of_work.evict(("debt", transaction.debt_id))
+        cursor.execute('UPDATE debts SET balance = MAX(balance - ?, 0) WHERE id = ?',
+                       (debt_balance_delta(transaction), transaction.debt_id))
+        if cursor.rowcount:
+            cursor.execute('SELECT balance FROM debts WHERE id = ?', (transaction.debt_id,))
+            balance = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return transaction, balance
 
-def get_total_debt_balance(user_id: int) -> float:
+def delete_debt(debt_id: int):
+    unit_of_work.evict(("debt", debt_id))
     conn = create_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT COALESCE(SUM(balance), 0) FROM debts WHERE user_id = ?', (user_id,))
-    total = cursor.fetchone()[0]
+    cursor.execute('DELETE FROM debts WHERE id = ?', (debt_id,))
+    conn.commit()
     conn.close()
-    return total
 
 def _row_to_debt(row) -> Debt:
     return Debt(
@@ -634,6 +972,7 @@ def get_tracked_assets(user_id: int) -> list:
     conn.close()
     return [_row_to_tracked_asset(r) for r in rows]
 
+@unit_of_work.identity("tracked_asset")
 def get_tracked_asset(asset_id: int):
     conn = create_connection()
     cursor = conn.cursor()
@@ -643,6 +982,7 @@ def get_tracked_asset(asset_id: int):
     return _row_to_tracked_asset(row) if row else None
 
 def update_tracked_asset(asset_id: int, asset: models.TrackedAssetCreate) -> models.TrackedAsset:
+    unit_of_work.evict(("tracked_asset", asset_id))
     conn = create_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -655,20 +995,13 @@ def update_tracked_asset(asset_id: int, asset: models.TrackedAssetCreate) -> mod
     return get_tracked_asset(asset_id)
 
 def delete_tracked_asset(asset_id: int):
+    unit_of_work.evict(("tracked_asset", asset_id))
     conn = create_connection()
     cursor = conn.cursor()
     cursor.execute('DELETE FROM tracked_assets WHERE id = ?', (asset_id,))
     conn.commit()
     conn.close()
 
-def get_total_tracked_assets_value(user_id: int) -> float:
-    conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COALESCE(SUM(value), 0) FROM tracked_assets WHERE user_id = ?', (user_id,))
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total
-
 def _row_to_tracked_asset(row) -> models.TrackedAsset:
     return models.TrackedAsset(
         id=row['id'],
@@ -677,3 +1010,554 @@ def _row_to_tracked_asset(row) -> models.TrackedAsset:
         type=row['type'],
         value=row['value']
     )
+
+# --- Dirty Months (background recompute queue) ---
+
+def mark_months_dirty(user_id: int, months) -> None:
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT OR IGNORE INTO dirty_months (user_id, year, month)
+        VALUES (?, ?, ?)
+    ''', [(user_id, year, month) for (year, month) in months])
+    conn.commit()
+    conn.close()
+
+def claim_dirty_months() -> dict:
+    """Atomically takes every dirty row off the queue.
+    Returns {user_id: (year, month)} holding the earliest dirty month per user.
+    Rows marked after the claim stay queued for the next pass."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    if not conn.in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('''
+        SELECT user_id, MIN(year * 100 + month) AS first_key
+        FROM dirty_months
+        GROUP BY user_id
+    ''')
+    rows = cursor.fetchall()
+    cursor.execute('DELETE FROM dirty_months')
+    conn.commit()
+    conn.close()
+    return {row['user_id']: divmod(row['first_key'], 100) for row in rows}
+
+# --- User Totals (trigger-maintained running sums) ---
+
+def get_user_totals(user_id: int) -> models.UserTotals:
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM user_totals WHERE user_id = ?', (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    if row is None:
+        return models.UserTotals(user_id=user_id)
+    return models.UserTotals(user_id=row['user_id'], total_debt=row['total_debt'],
+                             total_tracked_assets=row['total_tracked_assets'], ledger_balance=row['ledger_balance'])
+
+def refresh_net_worth(user_id: int) -> None:
+    """Sets users.net_worth from the running totals in a single statement."""
+    unit_of_work.evict(("user", user_id))
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE users
+        SET net_worth = COALESCE((
+            SELECT ledger_balance + total_tracked_assets - total_debt
+            FROM user_totals WHERE user_id = users.id
+        ), 0)
+        WHERE id = ?
+    ''', (user_id,))
+    conn.commit()
+    conn.close()
+
+def verify_user_totals(tolerance: float = 0.005) -> list:
+    """Compares every stored total with a fresh scan of the source tables.
+    Returns one dict per user whose row is missing or off by more than `tolerance`."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM user_totals')
+    stored = {row['user_id']: row for row in cursor.fetchall()}
+    cursor.execute(EXPECTED_USER_TOTALS_SQL)
+    expected = cursor.fetchall()
+    conn.close()
+
+    mismatches = []
+    columns = ('total_debt', 'total_tracked_assets', 'ledger_balance')
+    for row in expected:
+        have = stored.pop(row['user_id'], None)
+        diffs = {
+            column: {"stored": have[column] if have else None, "expected": row[column]}
+            for column in columns
+            if have is None or abs(have[column] - row[column]) > tolerance
+        }
+        if diffs:
+            mismatches.append({"user_id": row['user_id'], **diffs})
+    for user_id in stored:
+        mismatches.append({"user_id": user_id, "orphaned": True})
+    return mismatches
+
+def repair_user_totals() -> int:
+    """Rebuilds user_totals from the source tables, and with it every user's
+    net worth. Returns the number of totals rows written."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    if not conn.in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+    # The user_totals insert trigger re-derives each user's net worth as well
+    rows = rebuild_user_totals(cursor)
+    conn.commit()
+    conn.close()
+    unit_of_work.evict_kind("user")
+    return rows
+
+# --- Closed Periods (frozen months the recompute skips) ---
+
+def _period_checksums(cursor, user_id: int, first_key: int, last_key: int) -> dict:
+    """{year * 100 + month: sha256} for every user_assets month in the range,
+    hashed over the month's transactions and its stored totals."""
+    digests = {}
+    cursor.execute('''
+        SELECT year * 100 + month AS period, TIncome, TExpense, TSavings FROM user_assets
+        WHERE user_id = ? AND year * 100 + month BETWEEN ? AND ?
+    ''', (user_id, first_key, last_key))
+    for row in cursor.fetchall():
+        digests[row['period']] = hashlib.sha256(
+            f"{row['TIncome']!r}|{row['TExpense']!r}|{row['TSavings']!r}".encode())
+
+    cursor.execute('''
+        SELECT CAST(strftime('%Y%m', date) AS INTEGER) AS period, id, date, amount, type
+        FROM transactions
+        WHERE user_id = ? AND date >= ? AND date < ?
+        ORDER BY date, id
+    ''', (user_id, f"{first_key // 100:04d}-{first_key % 100:02d}-01",
+          f"{last_key // 100 + last_key % 100 // 12:04d}-{last_key % 100 % 12 + 1:02d}-01"))
+    for row in cursor.fetchall():
+        digest = digests.get(row['period'])
+        if digest is not None:
+            digest.update(f"\n{row['id']}|{row['date']}|{row['amount']!r}|{row['type']}".encode())
+    return {period: digest.hexdigest() for period, digest in digests.items()}
+
+def get_first_open_month(user_id: int):
+    """The month after the user's last closed period, or None if none are closed."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT MAX(year * 100 + month) AS last_key FROM closed_periods WHERE user_id = ?
+    ''', (user_id,))
+    last_key = cursor.fetchone()['last_key']
+    conn.close()
+    if last_key is None:
+        return None
+    year, month = divmod(last_key, 100)
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+def close_periods(user_id: int, before: tuple) -> int:
+    """Freezes every open month earlier than `before` (year, month) that has a
+    user_assets row and no recompute queued. Returns the number closed."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT
+            (SELECT MAX(year * 100 + month) FROM closed_periods WHERE user_id = ?) AS last_closed,
+            (SELECT MIN(year * 100 + month) FROM dirty_months WHERE user_id = ?) AS first_dirty
+    ''', (user_id, user_id))
+    row = cursor.fetchone()
+    first_key = (row['last_closed'] or 0) + 1
+    last_key = before[0] * 100 + before[1] - 1
+    if row['first_dirty'] is not None:
+        last_key = min(last_key, row['first_dirty'] - 1)
+    if last_key < first_key:
+        conn.close()
+        return 0
+
+    checksums = _period_checksums(cursor, user_id, first_key, last_key)
+    cursor.executemany('''
+        INSERT OR REPLACE INTO closed_periods (user_id, year, month, checksum)
+        VALUES (?, ?, ?, ?)
+    ''', [(user_id, *divmod(period, 100), checksum) for period, checksum in checksums.items()])
+    conn.commit()
+    conn.close()
+    return len(checksums)
+
+def reopen_periods(user_id: int, year: int, month: int) -> int:
+    """Reopens (year, month) and every later closed month for the user."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM closed_periods WHERE user_id = ? AND year * 100 + month >= ?
+    ''', (user_id, year * 100 + month))
+    reopened = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return reopened
+
+def verify_closed_periods() -> list:
+    """Recomputes every closed month's checksum.
+    Returns {"user_id", "year", "month"} for each one that no longer matches."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT user_id, MIN(year * 100 + month) AS first_key, MAX(year * 100 + month) AS last_key
+        FROM closed_periods GROUP BY user_id
+    ''')
+    ranges = cursor.fetchall()
+
+    mismatches = []
+    for r in ranges:
+        cursor.execute('''
+            SELECT year * 100 + month AS period, checksum FROM closed_periods WHERE user_id = ?
+        ''', (r['user_id'],))
+        stored = {row['period']: row['checksum'] for row in cursor.fetchall()}
+        actual = _period_checksums(cursor, r['user_id'], r['first_key'], r['last_key'])
+        for period, checksum in sorted(stored.items()):
+            if actual.get(period) != checksum:
+                year, month = divmod(period, 100)
+                mismatches.append({"user_id": r['user_id'], "year": year, "month": month})
+    conn.close()
+    return mismatches
+
+# --- Daily Totals (range index source) ---
+
+def get_daily_totals_since(user_id: int, version: int = 0) -> list:
+    """(day, category, income, expense, version) rows changed after `version`."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT day, category, income, expense, version FROM daily_totals
+        WHERE user_id = ? AND version > ?
+    ''', (user_id, version))
+    rows = [tuple(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def get_daily_expense_totals(user_id: int, start: str, end: str) -> list:
+    """[(day, expense)] for each day in start..end (YYYY-MM-DD, inclusive) with spending."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT day, SUM(expense) AS expense FROM daily_totals
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+        GROUP BY day
+        HAVING ROUND(SUM(expense), 2) != 0
+        ORDER BY day
+    ''', (user_id, start, end))
+    rows = [(row['day'], row['expense']) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+# --- Recipient Totals (autocomplete index source) ---
+
+def get_recipient_totals_since(user_id: int, version: int = 0) -> list:
+    """(recipient_key, category, recipient, count, amount, version) rows changed after `version`."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT recipient_key, category, recipient, count, amount, version
+        FROM recipient_totals
+        WHERE user_id = ? AND version > ?
+    ''', (user_id, version))
+    rows = [tuple(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def get_recipient_totals_version(user_id: int) -> int:
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM recipient_totals WHERE user_id = ?', (user_id,))
+    version = cursor.fetchone()[0]
+    conn.close()
+    return version
+
+def get_transactions_for_documents(user_id: int, docs: list, limit: int,
+                                   start: str = None, end: str = None) -> tuple:
+    """For vector_index.search: `docs` are (recipient_key, category, score).
+    Returns (per-document count/expense/income, best first by score) and the
+    `limit` most relevant transactions (by document score, then newest),
+    optionally within [start, end]. Each document is one range seek on
+    idx_transactions_user_recipient_key."""
+    if not docs:
+        return [], []
+    params = {
+        "user_id": user_id, "docs": json.dumps(docs), "limit": limit,
+        "start": start or "0000-01-01", "end": end or "9999-12-30",
+    }
+    matched = '''
+        WITH docs AS (
+            SELECT json_extract(value, '$[0]') AS recipient_key, json_extract(value, '$[1]') AS category,
+                   json_extract(value, '$[2]') AS score
+            FROM json_each(:docs)
+        )
+        SELECT transactions.*, docs.recipient_key, docs.score
+        FROM transactions
+        JOIN docs ON docs.recipient_key = lower(trim(transactions.recipient))
+                 AND docs.category = transactions.category
+        WHERE transactions.user_id = :user_id
+          AND transactions.date >= :start AND transactions.date < date(:end, '+1 day')
+    '''
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT recipient_key, category, score, COUNT(*) AS count,
+               COALESCE(SUM(CASE WHEN type = 'expense' THEN amount END), 0) AS expense,
+               COALESCE(SUM(CASE WHEN type = 'income' THEN amount END), 0) AS income
+        FROM ({matched})
+        GROUP BY recipient_key, category
+        ORDER BY score DESC, count DESC
+    ''', params)
+    groups = [dict(row) for row in cursor.fetchall()]
+    cursor.execute(f'''
+        SELECT id, date(date) AS date, recipient, amount, category, type
+        FROM ({matched})
+        ORDER BY score DESC, date DESC, id DESC
+        LIMIT :limit
+    ''', params)
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return groups, rows
+
+# --- Category Rules (compiled by rules_engine.py) ---
+
+def create_category_rule(rule: models.CategoryRuleCreate) -> models.CategoryRule:
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO category_rules (user_id, pattern, match_type, category, type, min_amount, max_amount, priority)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (rule.user_id, rule.pattern, rule.match_type, rule.category, rule.type,
+          rule.min_amount, rule.max_amount, rule.priority))
+    conn.commit()
+    rule_id = cursor.lastrowid
+    conn.close()
+    return get_category_rule(rule_id)
+
+def get_category_rules(user_id: int) -> list:
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM category_rules WHERE user_id = ? ORDER BY id ASC', (user_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [models.CategoryRule(**dict(row)) for row in rows]
+
+def get_category_rule(rule_id: int):
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM category_rules WHERE id = ?', (rule_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return models.CategoryRule(**dict(row)) if row else None
+
+def update_category_rule(rule_id: int, rule: models.CategoryRuleCreate) -> models.CategoryRule:
+    """Editing a learned rule turns it into a user rule, so re-learning leaves it alone."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE category_rules
+        SET pattern = ?, match_type = ?, category = ?, type = ?, min_amount = ?, max_amount = ?,
+            priority = ?, source = 'user'
+        WHERE id = ?
+    ''', (rule.pattern, rule.match_type, rule.category, rule.type,
+          rule.min_amount, rule.max_amount, rule.priority, rule_id))
+    conn.commit()
+    conn.close()
+    return get_category_rule(rule_id)
+
+def delete_category_rule(rule_id: int):
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM category_rules WHERE id = ?', (rule_id,))
+    conn.commit()
+    conn.close()
+
+def get_rule_conditions(user_id: int) -> list:
+    """(id, pattern, match_type, category, type, min_amount, max_amount, priority, source) per rule."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, pattern, match_type, category, type, min_amount, max_amount, priority, source
+        FROM category_rules
+        WHERE user_id = ?
+    ''', (user_id,))
+    rows = [tuple(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def learn_category_rules(user_id: int, min_count: int, min_share: float) -> dict:
+    """Turns every recipient with at least `min_count` transactions, `min_share`
+    of them in one category, into a learned exact rule for that category,
+    unless the user already has an exact rule for it. Learned rules whose
+    recipient no longer qualifies are removed; hit counts of the ones that
+    stay are kept."""
+    qualifying = '''
+        SELECT recipient_key, category FROM (
+            SELECT recipient_key, category, count,
+                   SUM(count) OVER (PARTITION BY recipient_key) AS total,
+                   ROW_NUMBER() OVER (PARTITION BY recipient_key ORDER BY count DESC, category) AS rank
+            FROM recipient_totals
+            WHERE user_id = :user_id AND count > 0 AND recipient_key != ''
+        )
+        WHERE rank = 1 AND total >= :min_count AND count >= :min_share * total
+          AND recipient_key NOT IN (
+              SELECT pattern FROM category_rules
+              WHERE user_id = :user_id AND source = 'user' AND match_type = 'exact'
+          )
+    '''
+    params = {"user_id": user_id, "min_count": min_count, "min_share": min_share}
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        DELETE FROM category_rules
+        WHERE user_id = :user_id AND source = 'learned'
+          AND pattern NOT IN (SELECT recipient_key FROM ({qualifying}))
+    ''', params)
+    removed = cursor.rowcount
+    cursor.execute(f'''
+        INSERT INTO category_rules (user_id, pattern, match_type, category, source)
+        SELECT :user_id, recipient_key, 'exact', category, 'learned' FROM ({qualifying})
+        WHERE true
+        ON CONFLICT (user_id, pattern) WHERE source = 'learned' DO UPDATE SET category = excluded.category
+        WHERE category != excluded.category
+    ''', params)
+    upserted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return {"upserted": upserted, "removed": removed}
+
+def record_rule_hits(hits: dict) -> None:
+    """Adds {rule_id: count} to each rule's hit count and stamps last_hit_at."""
+    if not hits:
+        return
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.executemany('''
+        UPDATE category_rules SET hits = hits + ?, last_hit_at = CURRENT_TIMESTAMP WHERE id = ?
+    ''', [(count, rule_id) for rule_id, count in hits.items()])
+    conn.commit()
+    conn.close()
+
+# --- Net Worth Snapshots (daily history) ---
+
+def refresh_net_worth_history(user_id: int, since: str) -> int:
+    """Re-derives past snapshots from `since` (YYYY-MM-DD) on; see database.rebuild_net_worth_snapshots."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    rows = rebuild_net_worth_snapshots(cursor, user_id, since)
+    conn.commit()
+    conn.close()
+    return rows
+
+def get_net_worth_snapshots(user_id: int, start: str, end: str) -> list:
+    """[(day, net_worth)] for start..end (YYYY-MM-DD, inclusive), led by the
+    latest snapshot before start, which gives the value on the first day."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT day, ledger_balance + holdings AS net_worth FROM (
+            SELECT * FROM (
+                SELECT * FROM net_worth_snapshots
+                WHERE user_id = ? AND day < ?
+                ORDER BY day DESC LIMIT 1
+            )
+            UNION ALL
+            SELECT * FROM net_worth_snapshots
+            WHERE user_id = ? AND day BETWEEN ? AND ?
+        )
+        ORDER BY day
+    ''', (user_id, start, user_id, start, end))
+    rows = [(row['day'], row['net_worth']) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+# --- Change Log (incremental sync) ---
+
+# Synced table -> (model, SELECT list shaped like the model)
+SYNC_ENTITIES = {
+    'transactions': (Transaction, "id, user_id, recipient, date(date) AS date, amount, category, type, debt_id"),
+    'budgets': (Budget, "id, user_id, category, amount"),
+    'debts': (Debt, "id, user_id, name, type, balance, total_amount, interest_rate, monthly_payment, "
+                    "start_date, linked_asset_id"),
+    'tracked_assets': (models.TrackedAsset, "id, user_id, name, type, value"),
+    'user_assets': (UserAsset, "id, user_id, year, month, TIncome, TExpense, TSavings, NetWorth AS net_worth"),
+    'recurring_transactions': (RecurringTransaction, "id, user_id, recipient, amount, category, type, "
+                                                     "interval, start_date, next_date"),
+    'notifications': (Notification, "id, user_id, title, message, date, is_read, type"),
+}
+
+def get_changes_since(user_id: int, since: int) -> dict:
+    """Everything in the synced tables that changed for the user after change_log
+    seq `since`: per table, the current rows ("upserted") and the ids that no
+    longer exist ("deleted"). since=0, or a cursor older than what compaction
+    kept, returns every row with full=True. `seq` is the client's next cursor."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    # Read the cursor first: a write landing after it is sent again next time
+    cursor.execute('''
+        SELECT
+            (SELECT seq FROM sqlite_sequence WHERE name = 'change_log') AS seq,
+            (SELECT seq FROM sync_floor WHERE user_id = ?) AS floor
+    ''', (user_id,))
+    row = cursor.fetchone()
+    seq = row['seq'] or 0
+    full = since <= 0 or since < (row['floor'] or 0)
+
+    if full:
+        changed = {entity: None for entity in SYNC_ENTITIES}
+    else:
+        cursor.execute('''
+            SELECT entity, json_group_array(DISTINCT entity_id) AS ids
+            FROM change_log
+            WHERE user_id = ? AND seq > ?
+            GROUP BY entity
+        ''', (user_id, since))
+        changed = {row['entity']: row['ids'] for row in cursor.fetchall() if row['entity'] in SYNC_ENTITIES}
+
+    changes = {}
+    for entity, ids in changed.items():
+        model, columns = SYNC_ENTITIES[entity]
+        if ids is None:
+            cursor.execute(f'SELECT {columns} FROM {entity} WHERE user_id = ? ORDER BY id', (user_id,))
+        else:
+            cursor.execute(f'''
+                SELECT {columns} FROM {entity}
+                WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+                ORDER BY id
+            ''', (user_id, ids))
+        upserted = [model(**dict(row)) for row in cursor.fetchall()]
+        present = {item.id for item in upserted}
+        deleted = [] if ids is None else sorted(set(json.loads(ids)) - present)
+        changes[entity] = {"upserted": upserted, "deleted": deleted}
+
+    conn.close()
+    return {"user_id": user_id, "since": since, "seq": seq, "full": full, "changes": changes}
+
+def compact_change_log(retention_days: int) -> dict:
+    """Keeps only the newest change_log row per entity (lossless: a client
+    only needs the latest seq to know something changed), then drops rows
+    for deleted entities older than `retention_days`, raising the users'
+    sync_floor so clients that could miss those deletes resync in full."""
+    conn = create_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM change_log WHERE seq NOT IN (
+            SELECT MAX(seq) FROM change_log GROUP BY user_id, entity, entity_id
+        )
+    ''')
+    coalesced = cursor.rowcount
+
+    gone = " OR ".join(
+        f"(entity = '{table}' AND NOT EXISTS (SELECT 1 FROM {table} "
+        f"WHERE {table}.id = change_log.entity_id AND {table}.user_id = change_log.user_id))"
+        for table in CHANGE_LOG_TABLES
+    )
+    expired = f"changed_at < datetime('now', ?) AND ({gone})"
+    cutoff = f"-{int(retention_days)} days"
+    cursor.execute(f'''
+        INSERT INTO sync_floor (user_id, seq)
+        SELECT user_id, MAX(seq) FROM change_log WHERE {expired} GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET seq = MAX(seq, excluded.seq)
+    ''', (cutoff,))
+    cursor.execute(f'DELETE FROM change_log WHERE {expired}', (cutoff,))
+    pruned = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return {"coalesced": coalesced, "pruned": pruned}
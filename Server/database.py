@@ -2,8 +2,13 @@ import sqlite3
 import sys
 import os
 import shutil
+import threading
+from datetime import date
 from pathlib import Path
 
+import instrumentation
+import unit_of_work
+
 # Determine the intended persistent storage location
 # Electron should pass SAIVE_USER_DATA environment variable
 user_data_dir = os.environ.get("SAIVE_USER_DATA")
@@ -31,15 +36,40 @@ else:
     # Running in development
     DATABASE_PATH = Path(__file__).parent.resolve() / "database.db"
 
-def create_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def _connect():
+    conn = sqlite3.connect(DATABASE_PATH, factory=instrumentation.InstrumentedConnection)
     conn.row_factory = sqlite3.Row
-    return conn  
+    return conn
+
+def create_connection():
+    if not _schema_ready:
+        ensure_schema()
+    # Inside a unit of work every crud call shares its connection and transaction
+    shared = unit_of_work.borrow()
+    if shared is not None:
+        return shared
+    return _connect()
+
+def ensure_schema():
+    """Runs create_tables() once per process. main.py starts this on a
+    background thread at startup; a connection opened before it finishes waits."""
+    global _schema_ready
+    with _schema_lock:
+        if not _schema_ready:
+            create_tables()
+            _schema_ready = True
 
 def create_tables():
-    conn = create_connection()
+    conn = _connect()
     cursor = conn.cursor()
 
+    # WAL lets the background recompute worker read while a request writes,
+    # and makes each commit an append instead of a full journal rewrite.
+    cursor.execute('PRAGMA journal_mode=WAL')
+
     # Create users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -149,6 +179,19 @@ def create_tables():
     except sqlite3.OperationalError as e:
         if "duplicate column name" not in str(e).lower():
             raise
+
+    # Migration: add the duplicate-detection fingerprint to transactions. It is
+    # a virtual generated column (computed on read, nothing stored in the row),
+    # so every insert path gets it for free; only the index below stores it.
+    try:
+        cursor.execute(f'''
+            ALTER TABLE transactions ADD COLUMN fingerprint TEXT
+            GENERATED ALWAYS AS ({transaction_fingerprint('date', 'amount', 'recipient', 'type')}) VIRTUAL
+        ''')
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" not in str(e).lower():
+            raise
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_fingerprint ON transactions (user_id, fingerprint)')
             
     # Create tracked_assets table
     cursor.execute('''
@@ -169,5 +212,500 @@ def create_tables():
         if "duplicate column name" not in str(e).lower():
             raise
 
+    # Create dirty_months table — months whose user_assets aggregates are stale
+    # and waiting for the background recompute worker
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dirty_months (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            PRIMARY KEY (user_id, year, month)
+        )
+    ''')
+
+    # Indexes for the per-user debt and tracked-asset lookups
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_debts_user_id ON debts (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracked_assets_user_id ON tracked_assets (user_id)')
+
+    # Create user_totals table — running per-user sums so net worth is one row
+    # read instead of three scans. The triggers below keep it in step with
+    # every write to users, transactions, debts and tracked_assets.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_totals'")
+    backfill_totals = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_totals (
+            user_id INTEGER PRIMARY KEY,
+            total_debt REAL NOT NULL DEFAULT 0,
+            total_tracked_assets REAL NOT NULL DEFAULT 0,
+            ledger_balance REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    for trigger in _user_totals_triggers():
+        cursor.execute(trigger)
+    if backfill_totals:
+        rebuild_user_totals(cursor)
+
+    # Create closed_periods table — months frozen past the close horizon. The
+    # recompute skips them; their checksum covers the month's transactions and
+    # its user_assets totals so drift can be detected later.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS closed_periods (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            checksum TEXT NOT NULL,
+            closed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, year, month)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date)')
+    for trigger in _closed_period_triggers():
+        cursor.execute(trigger)
+
+    # Create daily_totals table — income and expense per user, day and category.
+    # `version` is a per-user counter bumped on every change so the in-memory
+    # range index (range_index.py) can fetch just the rows it hasn't seen.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_totals'")
+    backfill_daily = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            income REAL NOT NULL DEFAULT 0,
+            expense REAL NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, category)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_totals_user_version ON daily_totals (user_id, version)')
+    for trigger in _daily_totals_triggers():
+        cursor.execute(trigger)
+    if backfill_daily:
+        cursor.execute('''
+            INSERT INTO daily_totals (user_id, day, category, income, expense, version)
+            SELECT user_id, date(date), category,
+                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                1
+            FROM transactions
+            GROUP BY user_id, date(date), category
+        ''')
+
+    # Create net_worth_snapshots table — one row per user per day on which net
+    # worth changed. Today's row follows user_totals live (trigger below); past
+    # rows are re-derived from daily_totals by the recompute worker, so
+    # back-dated transactions reach history too. holdings = tracked assets - debts.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'net_worth_snapshots'")
+    backfill_snapshots = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS net_worth_snapshots (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            ledger_balance REAL NOT NULL,
+            holdings REAL NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+    for event in ("INSERT", "UPDATE"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_user_totals_snapshot_{event.lower()} AFTER {event} ON user_totals BEGIN
+                INSERT INTO net_worth_snapshots (user_id, day, ledger_balance, holdings)
+                VALUES (NEW.user_id, date('now', 'localtime'), NEW.ledger_balance, NEW.total_tracked_assets - NEW.total_debt)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    ledger_balance = excluded.ledger_balance,
+                    holdings = excluded.holdings;
+            END
+        ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_snapshots_delete AFTER DELETE ON users BEGIN
+            DELETE FROM net_worth_snapshots WHERE user_id = OLD.id;
+        END
+    ''')
+    if backfill_snapshots:
+        cursor.execute('''
+            INSERT INTO net_worth_snapshots (user_id, day, ledger_balance, holdings)
+            SELECT user_id, date('now', 'localtime'), ledger_balance, total_tracked_assets - total_debt
+            FROM user_totals
+        ''')
+        cursor.execute('SELECT user_id, MIN(day) AS first_day FROM daily_totals GROUP BY user_id')
+        for row in cursor.fetchall():
+            rebuild_net_worth_snapshots(cursor, row['user_id'], row['first_day'])
+
+    # Create change_log table — one row per write to a synced table, in commit
+    # order. /sync/{user_id}?since=<seq> reads it to send only what changed.
+    # AUTOINCREMENT keeps seq monotonic even after compaction deletes the tail.
+    # sync_floor is the highest seq compaction dropped for a user; a client
+    # whose cursor is older than that has to take a full resync.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_user_seq ON change_log (user_id, seq)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_floor (
+            user_id INTEGER PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    ''')
+    for trigger in _change_log_triggers():
+        cursor.execute(trigger)
+
+    # Create recipient_totals — per user, normalised recipient and category:
+    # how often it was used and the summed amount, plus the latest spelling.
+    # `version` works like daily_totals.version, for recipient_index.py.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recipient_totals'")
+    backfill_recipients = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recipient_totals (
+            user_id INTEGER NOT NULL,
+            recipient_key TEXT NOT NULL,
+            category TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, recipient_key, category)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recipient_totals_user_version ON recipient_totals (user_id, version)')
+    for trigger in _recipient_totals_triggers():
+        cursor.execute(trigger)
+    if backfill_recipients:
+        cursor.execute('''
+            INSERT INTO recipient_totals (user_id, recipient_key, category, recipient, count, amount, version)
+            SELECT user_id, lower(trim(recipient)), category, recipient, COUNT(*), SUM(amount), 1
+            FROM transactions
+            GROUP BY user_id, lower(trim(recipient)), category
+        ''')
+    # The transactions of one recipient_totals cell, by date; covering for the
+    # per-document totals of vector_index.search
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_recipient_key
+        ON transactions (user_id, lower(trim(recipient)), category, date, type, amount)
+    ''')
+
+    # Create category_rules — user-defined and learned categorisation rules,
+    # compiled into one matcher per user by rules_engine.py. A rule matches on
+    # the recipient (substring or whole name) and/or an inclusive amount range,
+    # optionally for one transaction type. Learned rules are exact-name rules
+    # derived from recipient_totals; the partial index lets re-learning upsert them.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            pattern TEXT NOT NULL DEFAULT '',
+            match_type TEXT NOT NULL DEFAULT 'contains' CHECK(match_type IN ('contains', 'exact')),
+            category TEXT NOT NULL,
+            type TEXT CHECK(type IN ('income', 'expense')),
+            min_amount REAL,
+            max_amount REAL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            source TEXT NOT NULL DEFAULT 'user' CHECK(source IN ('user', 'learned')),
+            hits INTEGER NOT NULL DEFAULT 0,
+            last_hit_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_category_rules_user ON category_rules (user_id)')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_category_rules_learned
+        ON category_rules (user_id, pattern) WHERE source = 'learned'
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_category_rules_delete AFTER DELETE ON users BEGIN
+            DELETE FROM category_rules WHERE user_id = OLD.id;
+        END
+    ''')
+
+    # Create transactions_fts — an external-content FTS5 index over recipient
+    # and category (the text lives only in transactions; the index holds the
+    # terms). Prefix indexes on 2 and 3 characters keep search-as-you-type
+    # queries fast. Builds without FTS5 fall back to LIKE in crud.search_transactions.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'")
+    backfill_fts = cursor.fetchone() is None
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+                recipient, category,
+                content = 'transactions', content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search unavailable, falling back to LIKE: {e}")
+    else:
+        for trigger in _transactions_fts_triggers():
+            cursor.execute(trigger)
+        if backfill_fts:
+            cursor.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+
     conn.commit()
     conn.close()
+
+def transaction_fingerprint(date: str, amount: str, recipient: str, type: str) -> str:
+    """SQL for a transaction's duplicate fingerprint: day, amount to the cent,
+    case-folded recipient and type. Used for the generated column and, with
+    parameters, for probing it, so both sides are computed by SQLite alike."""
+    return f"date({date}) || '|' || printf('%.2f', {amount}) || '|' || lower(trim({recipient})) || '|' || {type}"
+
+# Signed effect of a transaction row on the ledger balance
+_LEDGER_DELTA = "CASE {row}.type WHEN 'income' THEN {row}.amount WHEN 'expense' THEN -{row}.amount ELSE 0 END"
+
+def _totals_upsert(column: str, user_id: str, delta: str) -> str:
+    return f'''
+            INSERT INTO user_totals (user_id, {column}) VALUES ({user_id}, {delta})
+            ON CONFLICT (user_id) DO UPDATE SET {column} = {column} + excluded.{column};'''
+
+def _user_totals_triggers() -> list:
+    triggers = [
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_totals_insert AFTER INSERT ON users BEGIN
+            INSERT OR IGNORE INTO user_totals (user_id) VALUES (NEW.id);
+        END''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_totals_delete AFTER DELETE ON users BEGIN
+            DELETE FROM user_totals WHERE user_id = OLD.id;
+        END''',
+    ]
+    # users.net_worth follows the totals in the same statement, so it is never stale
+    for event in ("INSERT", "UPDATE"):
+        triggers.append(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_user_totals_net_worth_{event.lower()} AFTER {event} ON user_totals BEGIN
+            UPDATE users SET net_worth = NEW.ledger_balance + NEW.total_tracked_assets - NEW.total_debt
+            WHERE id = NEW.user_id;
+        END''')
+    # (table, column feeding the total, total column, watched columns)
+    sources = [
+        ("transactions", _LEDGER_DELTA, "ledger_balance", "user_id, amount, type"),
+        ("debts", "{row}.balance", "total_debt", "user_id, balance"),
+        ("tracked_assets", "{row}.value", "total_tracked_assets", "user_id, value"),
+    ]
+    for table, delta, column, watched in sources:
+        new, old = delta.format(row="NEW"), delta.format(row="OLD")
+        triggers += [
+            f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_totals_insert AFTER INSERT ON {table} BEGIN{_totals_upsert(column, "NEW.user_id", new)}
+        END''',
+            f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_totals_delete AFTER DELETE ON {table} BEGIN{_totals_upsert(column, "OLD.user_id", f"-({old})")}
+        END''',
+            f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_totals_update AFTER UPDATE OF {watched} ON {table} BEGIN{_totals_upsert(column, "OLD.user_id", f"-({old})")}{_totals_upsert(column, "NEW.user_id", new)}
+        END''',
+        ]
+    return triggers
+
+def _reopen_from(user_id: str, date: str) -> str:
+    # Closed months form a prefix of the history, so reopening the written
+    # month and everything after it keeps them contiguous
+    return f'''
+            DELETE FROM closed_periods
+            WHERE user_id = {user_id}
+            AND year * 100 + month >= CAST(strftime('%Y%m', {date}) AS INTEGER);'''
+
+def _closed_period_triggers() -> list:
+    """A write dated inside a closed month reopens that month and its successors."""
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_reopen_insert AFTER INSERT ON transactions BEGIN{_reopen_from("NEW.user_id", "NEW.date")}
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_reopen_delete AFTER DELETE ON transactions BEGIN{_reopen_from("OLD.user_id", "OLD.date")}
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_reopen_update AFTER UPDATE OF user_id, date, amount, type ON transactions BEGIN{_reopen_from("OLD.user_id", "OLD.date")}{_reopen_from("NEW.user_id", "NEW.date")}
+        END''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_users_closed_periods_delete AFTER DELETE ON users BEGIN
+            DELETE FROM closed_periods WHERE user_id = OLD.id;
+        END''',
+    ]
+
+def _daily_upsert(row: str, sign: str) -> str:
+    return f'''
+            INSERT INTO daily_totals (user_id, day, category, income, expense, version)
+            VALUES ({row}.user_id, date({row}.date), {row}.category,
+                CASE WHEN {row}.type = 'income' THEN {sign}{row}.amount ELSE 0 END,
+                CASE WHEN {row}.type = 'expense' THEN {sign}{row}.amount ELSE 0 END,
+                (SELECT COALESCE(MAX(version), 0) + 1 FROM daily_totals WHERE user_id = {row}.user_id))
+            ON CONFLICT (user_id, day, category) DO UPDATE SET
+                income = income + excluded.income,
+                expense = expense + excluded.expense,
+                version = excluded.version;'''
+
+def _daily_totals_triggers() -> list:
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_daily_insert AFTER INSERT ON transactions BEGIN{_daily_upsert("NEW", "")}
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_daily_delete AFTER DELETE ON transactions BEGIN{_daily_upsert("OLD", "-")}
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_daily_update AFTER UPDATE OF user_id, date, category, amount, type ON transactions BEGIN{_daily_upsert("OLD", "-")}{_daily_upsert("NEW", "")}
+        END''',
+    ]
+
+# Tables /sync serves, with the columns whose change is worth a change_log row
+CHANGE_LOG_TABLES = {
+    'transactions': ('user_id', 'date', 'amount', 'category', 'recipient', 'type', 'debt_id'),
+    'budgets': ('user_id', 'category', 'amount'),
+    'debts': ('user_id', 'name', 'type', 'balance', 'total_amount', 'interest_rate',
+              'monthly_payment', 'start_date', 'linked_asset_id'),
+    'tracked_assets': ('user_id', 'name', 'type', 'value'),
+    'user_assets': ('user_id', 'year', 'month', 'TIncome', 'TExpense', 'TSavings', 'NetWorth'),
+    'recurring_transactions': ('user_id', 'amount', 'category', 'recipient', 'type', 'interval',
+                               'start_date', 'next_date'),
+    'notifications': ('user_id', 'title', 'message', 'date', 'is_read', 'type'),
+}
+
+def _log_change(table: str, row: str) -> str:
+    return f'''
+            INSERT INTO change_log (user_id, entity, entity_id) VALUES ({row}.user_id, '{table}', {row}.id);'''
+
+def _change_log_triggers() -> list:
+    """Log every insert and delete, and every update that changes a watched
+    column (the recompute rewrites user_assets rows, mostly with the same values)."""
+    triggers = []
+    for table, columns in CHANGE_LOG_TABLES.items():
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+        triggers += [
+            f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_change_log_insert AFTER INSERT ON {table} BEGIN{_log_change(table, "NEW")}
+        END''',
+            f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_change_log_delete AFTER DELETE ON {table} BEGIN{_log_change(table, "OLD")}
+        END''',
+            # Moving a row to another user reads as a delete for the old one
+            f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_change_log_update AFTER UPDATE ON {table} WHEN {changed} BEGIN
+            INSERT INTO change_log (user_id, entity, entity_id)
+            SELECT OLD.user_id, '{table}', OLD.id WHERE OLD.user_id IS NOT NEW.user_id;{_log_change(table, "NEW")}
+        END''',
+        ]
+    triggers.append('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_change_log_delete AFTER DELETE ON users BEGIN
+            DELETE FROM change_log WHERE user_id = OLD.id;
+            DELETE FROM sync_floor WHERE user_id = OLD.id;
+        END''')
+    return triggers
+
+def _recipient_upsert(row: str, sign: str) -> str:
+    return f'''
+            INSERT INTO recipient_totals (user_id, recipient_key, category, recipient, count, amount, version)
+            VALUES ({row}.user_id, lower(trim({row}.recipient)), {row}.category, {row}.recipient,
+                {sign}1, {sign}{row}.amount,
+                (SELECT COALESCE(MAX(version), 0) + 1 FROM recipient_totals WHERE user_id = {row}.user_id))
+            ON CONFLICT (user_id, recipient_key, category) DO UPDATE SET
+                count = count + excluded.count,
+                amount = amount + excluded.amount,
+                recipient = CASE WHEN excluded.count > 0 THEN excluded.recipient ELSE recipient END,
+                version = excluded.version;'''
+
+def _recipient_totals_triggers() -> list:
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_recipient_insert AFTER INSERT ON transactions BEGIN{_recipient_upsert("NEW", "")}
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_recipient_delete AFTER DELETE ON transactions BEGIN{_recipient_upsert("OLD", "-")}
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_recipient_update AFTER UPDATE OF user_id, recipient, category, amount ON transactions BEGIN{_recipient_upsert("OLD", "-")}{_recipient_upsert("NEW", "")}
+        END''',
+    ]
+
+def _fts_insert(row: str) -> str:
+    return f'''
+            INSERT INTO transactions_fts (rowid, recipient, category) VALUES ({row}.id, {row}.recipient, {row}.category);'''
+
+def _fts_delete(row: str) -> str:
+    # External-content tables are told what the deleted row contained
+    return f'''
+            INSERT INTO transactions_fts (transactions_fts, rowid, recipient, category)
+            VALUES ('delete', {row}.id, {row}.recipient, {row}.category);'''
+
+def _transactions_fts_triggers() -> list:
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert AFTER INSERT ON transactions BEGIN{_fts_insert("NEW")}
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete AFTER DELETE ON transactions BEGIN{_fts_delete("OLD")}
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update AFTER UPDATE OF recipient, category ON transactions BEGIN{_fts_delete("OLD")}{_fts_insert("NEW")}
+        END''',
+    ]
+
+# Totals recomputed from the source tables, one row per user id seen anywhere
+EXPECTED_USER_TOTALS_SQL = f'''
+    SELECT ids.user_id,
+        (SELECT COALESCE(SUM(balance), 0) FROM debts WHERE user_id = ids.user_id) AS total_debt,
+        (SELECT COALESCE(SUM(value), 0) FROM tracked_assets WHERE user_id = ids.user_id) AS total_tracked_assets,
+        (SELECT COALESCE(SUM({_LEDGER_DELTA.format(row="transactions")}), 0)
+            FROM transactions WHERE user_id = ids.user_id) AS ledger_balance
+    FROM (
+        SELECT id AS user_id FROM users
+        UNION SELECT user_id FROM transactions
+        UNION SELECT user_id FROM debts
+        UNION SELECT user_id FROM tracked_assets
+    ) AS ids
+'''
+
+def rebuild_user_totals(cursor) -> int:
+    """Recomputes every user_totals row from scratch; the caller commits."""
+    cursor.execute('DELETE FROM user_totals')
+    cursor.execute(f'''
+        INSERT INTO user_totals (user_id, total_debt, total_tracked_assets, ledger_balance)
+        {EXPECTED_USER_TOTALS_SQL}
+    ''')
+    return cursor.rowcount
+
+def rebuild_net_worth_snapshots(cursor, user_id: int, since: str) -> int:
+    """Re-derives the ledger balance of every snapshot before today from `since`
+    (YYYY-MM-DD) on, adding a row for each day with transactions. Holdings carry
+    forward from the previous snapshot. The caller commits; returns rows written."""
+    today = date.today().isoformat()
+    cursor.execute('''
+        SELECT ledger_balance, holdings FROM net_worth_snapshots
+        WHERE user_id = ? AND day < ? ORDER BY day DESC LIMIT 1
+    ''', (user_id, since))
+    row = cursor.fetchone()
+    if row is not None:
+        ledger, holdings = row['ledger_balance'], row['holdings']
+    else:
+        # No history before `since`: assume today's assets and debts
+        cursor.execute('SELECT total_tracked_assets - total_debt AS holdings FROM user_totals WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        ledger, holdings = 0.0, row['holdings'] if row else 0.0
+
+    cursor.execute('''
+        SELECT day, SUM(income - expense) AS delta FROM daily_totals
+        WHERE user_id = ? AND day >= ? AND day < ?
+        GROUP BY day
+    ''', (user_id, since, today))
+    deltas = {row['day']: row['delta'] for row in cursor.fetchall()}
+    cursor.execute('''
+        SELECT day, holdings FROM net_worth_snapshots
+        WHERE user_id = ? AND day >= ? AND day < ?
+    ''', (user_id, since, today))
+    existing = {row['day']: row['holdings'] for row in cursor.fetchall()}
+
+    rows = []
+    for day in sorted(deltas.keys() | existing.keys()):
+        ledger += deltas.get(day, 0.0)
+        holdings = existing.get(day, holdings)
+        rows.append((user_id, day, ledger, holdings))
+    cursor.executemany('''
+        INSERT INTO net_worth_snapshots (user_id, day, ledger_balance, holdings)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, day) DO UPDATE SET ledger_balance = excluded.ledger_balance
+    ''', rows)
+    return len(rows)
@@ -0,0 +1,108 @@
+"""
+fast_json.py — orjson-backed JSON responses with a stdlib fallback.
+
+FastAPI's default path validates every returned object against the route's
+response_model, runs jsonable_encoder over it and then json.dumps. For crud
+output that is already a list of validated models, or plain rows shaped like
+the model, all of that is repeated work. This module provides:
+
+  * FastJSONResponse, the app's default response class, which encodes with
+    orjson when it is installed and falls back to json.dumps otherwise
+    (orjson is optional: a wheel may be missing on some platforms).
+  * trusted(content), a response that skips FastAPI's re-validation and
+    encodes models and sqlite3 rows directly, and raw(body) for JSON that
+    SQLite already built (json_group_array). Routes keep their
+    response_model, so the OpenAPI schema is unchanged.
+
+Usage (backend):
+    import fast_json
+    app = FastAPI(default_response_class=fast_json.FastJSONResponse)
+
+    @app.get("/debts/{user_id}", response_model=List[models.Debt])
+    def get_debts(user_id: int):
+        return fast_json.trusted(crud.get_debts(user_id))        # models, validated once in crud
+
+    @app.get("/transactions/", response_model=list[models.Transaction])
+    def get_all_transactions():
+        return fast_json.raw(crud.get_all_transactions_json())      # encoded by SQLite
+
+Sparse fieldsets: list endpoints accept `fields=date,amount,category`.
+parse_fields() checks the names against the route's model (400 on unknown
+ones) and project() trims models or rows down to them:
+    wanted = fast_json.parse_fields(fields, models.Debt)
+    return fast_json.trusted(fast_json.project(crud.get_debts(user_id), wanted))
+"""
+
+import json
+import sqlite3
+from datetime import date, datetime
+from enum import Enum
+from typing import Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, BaseModel):
+        # Python mode keeps datetimes/enums as objects for orjson's native encoders
+        return obj.model_dump(mode="python" if orjson is not None else "json")
+    if isinstance(obj, sqlite3.Row):
+        return dict(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def trusted(content, status_code: int = 200) -> FastJSONResponse:
+    """Send already-validated crud output as-is (models, rows, or lists of them)."""
+    return FastJSONResponse(content, status_code=status_code)
+
+
+def raw(body, status_code: int = 200) -> Response:
+    """Send a JSON document encoded elsewhere, e.g. by SQLite, untouched."""
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+def parse_fields(fields: Optional[str], model) -> Optional[list]:
+    """A comma-separated `fields=` value as a list of model field names, or None for all."""
+    if not fields:
+        return None
+    wanted = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in wanted if name not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+    return wanted or None
+
+
+def project(items: list, fields: Optional[list]) -> list:
+    """Keep only `fields` of each model or row (everything when fields is None)."""
+    if fields is None:
+        return items
+    projected = []
+    for item in items:
+        if isinstance(item, BaseModel):
+            projected.append({name: getattr(item, name) for name in fields})
+        else:
+            projected.append({name: item[name] for name in fields})
+    return projected
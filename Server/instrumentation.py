@@ -0,0 +1,533 @@
+"""
+instrumentation.py — Request-level metrics and hot-path profiling.
+
+Four pieces:
+  * InstrumentedConnection / InstrumentedCursor: sqlite3 subclasses used by
+    database.create_connection() that count connections, statements, rows
+    fetched and commits — per request (via a context variable) and per process.
+  * A slow-query log: every statement is timed (execute plus fetch); those
+    over SAIVE_SLOW_QUERY_MS are printed with their EXPLAIN QUERY PLAN, full
+    table scans flagged, and kept in a top-N table (see slow_query_report()).
+  * InstrumentationMiddleware: pure ASGI middleware recording a latency
+    histogram and the per-request SQLite counters for every route.
+  * An opt-in sampling profiler: with SAIVE_PROFILE_SLOW_MS set, every request
+    is sampled and requests slower than the threshold dump a collapsed-stack
+    file (flamegraph.pl / speedscope format) to SAIVE_PROFILE_DIR.
+
+Usage (FastAPI):
+    app.add_middleware(instrumentation.InstrumentationMiddleware)
+
+    @app.get("/metrics")
+    def metrics():
+        return PlainTextResponse(instrumentation.render_prometheus(), media_type=instrumentation.PROMETHEUS_CONTENT_TYPE)
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from itertools import count
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds; SQLite count buckets in statements/connections.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Long-lived streams would swamp the latency histograms
+EXCLUDED_PREFIXES = ("/events", "/mcp", "/metrics")
+
+SLOW_REQUEST_MS = float(os.environ.get("SAIVE_PROFILE_SLOW_MS", "0") or 0)
+PROFILE_INTERVAL_S = float(os.environ.get("SAIVE_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = Path(os.environ.get("SAIVE_PROFILE_DIR") or Path(tempfile.gettempdir()) / "saive-profiles")
+
+SLOW_QUERY_MS = float(os.environ.get("SAIVE_SLOW_QUERY_MS", "50"))
+SLOW_QUERY_TOP_N = int(os.environ.get("SAIVE_SLOW_QUERY_TOP_N", "25"))
+SLOW_QUERY_MAX_SHAPES = 500
+
+SQLITE_FIELDS = ("queries", "connections", "rows", "commits")
+
+
+class SQLiteStats:
+    """Mutable SQLite counters for one request (or the whole process).
+    `statements` counts executions per query shape when statement tracing is on."""
+    __slots__ = SQLITE_FIELDS + ("statements",)
+
+    def __init__(self, trace: bool = False):
+        self.queries = 0
+        self.connections = 0
+        self.rows = 0
+        self.commits = 0
+        self.statements: Optional[Counter] = Counter() if trace else None
+
+
+_request_stats: ContextVar[Optional[SQLiteStats]] = ContextVar("saive_request_stats", default=None)
+_process_stats = SQLiteStats()
+_lock = threading.Lock()
+
+# Per-request statement tracing and listeners, used by benchmarks/query_budgets.py
+_trace_statements = False
+_request_listeners: list = []
+
+
+def _count(field: str, n: int = 1) -> None:
+    stats = _request_stats.get()
+    if stats is not None:
+        setattr(stats, field, getattr(stats, field) + n)
+    with _lock:
+        setattr(_process_stats, field, getattr(_process_stats, field) + n)
+
+
+def _trace(sql: str) -> None:
+    stats = _request_stats.get()
+    if stats is not None and stats.statements is not None:
+        stats.statements[query_shape(sql)] += 1
+
+
+def current_stats() -> Optional[SQLiteStats]:
+    """The counters for the request being handled, if any."""
+    return _request_stats.get()
+
+
+def set_statement_tracing(enabled: bool) -> None:
+    """Record every statement's shape per request (off by default: it costs a string normalisation per query)."""
+    global _trace_statements
+    _trace_statements = enabled
+
+
+def add_request_listener(listener) -> None:
+    """Call listener(method, route, status, seconds, stats) after every instrumented request."""
+    _request_listeners.append(listener)
+
+
+def remove_request_listener(listener) -> None:
+    _request_listeners.remove(listener)
+
+
+# ── SQLite instrumentation ──────────────────────────────────────────────────
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Counts statements and rows, and times each statement from execute()
+    until its result set is consumed so slow scans are caught even when the
+    cost lands in fetchall() rather than execute()."""
+    _sql = None
+    _parameters = None
+    _elapsed = 0.0
+
+    def _begin(self, sql, parameters):
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = 0.0
+
+    def _finish(self):
+        if self._sql is not None:
+            if self._elapsed * 1000 >= SLOW_QUERY_MS:
+                record_slow_query(self.connection, self._sql, self._parameters, self._elapsed)
+            self._sql = None
+            self._parameters = None
+
+    def execute(self, sql, parameters=()):
+        _count("queries")
+        _trace(sql)
+        self._finish()
+        self._begin(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed += time.perf_counter() - started
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        _count("queries")
+        _trace(sql)
+        self._finish()
+        self._begin(sql, None)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed += time.perf_counter() - started
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - started
+        if row is not None:
+            _count("rows")
+        self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._elapsed += time.perf_counter() - started
+        _count("rows", len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - started
+        _count("rows", len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._elapsed += time.perf_counter() - started
+            self._finish()
+            raise
+        self._elapsed += time.perf_counter() - started
+        _count("rows")
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _count("connections")
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute() does not go through cursor(), so route it there
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        _count("commits")
+        return super().commit()
+
+
+# ── Slow-query log ──────────────────────────────────────────────────────────
+
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "REPLACE", "UPDATE", "DELETE")
+_FULL_SCAN = re.compile(r"^SCAN (TABLE )?\S+( AS \S+)?$")
+
+
+class SlowQuery:
+    __slots__ = ("sql", "count", "total_s", "max_s", "last_s", "plan", "full_scan", "temp_sort")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.last_s = 0.0
+        self.plan: Optional[list[str]] = None
+        self.full_scan = False
+        self.temp_sort = False
+
+    def as_dict(self) -> dict:
+        return {
+            "sql": self.sql,
+            "count": self.count,
+            "max_ms": round(self.max_s * 1000, 3),
+            "mean_ms": round(self.total_s / self.count * 1000, 3),
+            "last_ms": round(self.last_s * 1000, 3),
+            "full_scan": self.full_scan,
+            "temp_sort": self.temp_sort,
+            "plan": self.plan,
+        }
+
+
+_slow_queries: dict[str, SlowQuery] = {}
+
+
+def query_shape(sql: str) -> str:
+    """Whitespace-normalised SQL, so the same query from any call site groups together."""
+    return " ".join(sql.split())
+
+
+def explain(conn: sqlite3.Connection, sql: str, parameters) -> Optional[list[str]]:
+    """EXPLAIN QUERY PLAN detail lines, or None when the statement can't be explained."""
+    if parameters is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        # The base class execute() bypasses our cursor, so this isn't counted or timed
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+    except sqlite3.Error:
+        return None
+    return [row[3] for row in rows]
+
+
+def record_slow_query(conn: sqlite3.Connection, sql: str, parameters, elapsed: float) -> None:
+    shape = query_shape(sql)
+    with _lock:
+        entry = _slow_queries.get(shape)
+        needs_plan = entry is None
+    plan = explain(conn, sql, parameters) if needs_plan else None
+
+    with _lock:
+        entry = _slow_queries.get(shape)
+        if entry is None:
+            if len(_slow_queries) >= SLOW_QUERY_MAX_SHAPES:
+                fastest = min(_slow_queries.values(), key=lambda q: q.max_s)
+                del _slow_queries[fastest.sql]
+            entry = _slow_queries[shape] = SlowQuery(shape)
+            entry.plan = plan
+            if plan:
+                entry.full_scan = any(_FULL_SCAN.match(step) for step in plan)
+                entry.temp_sort = any(step.startswith("USE TEMP B-TREE") for step in plan)
+        entry.count += 1
+        entry.total_s += elapsed
+        entry.max_s = max(entry.max_s, elapsed)
+        entry.last_s = elapsed
+        first = entry.count == 1
+        flags = [flag for flag, on in (("FULL SCAN", entry.full_scan), ("TEMP B-TREE", entry.temp_sort)) if on]
+
+    print(f"Slow query ({elapsed * 1000:.1f} ms{', ' + ', '.join(flags) if flags else ''}): {shape}")
+    if first and plan:
+        for step in plan:
+            print(f"    {step}")
+
+
+def slow_query_report(limit: Optional[int] = None) -> dict:
+    """The slowest statement shapes seen so far, worst first."""
+    with _lock:
+        entries = sorted(_slow_queries.values(), key=lambda q: q.max_s, reverse=True)
+        queries = [q.as_dict() for q in entries[:limit or SLOW_QUERY_TOP_N]]
+    return {"threshold_ms": SLOW_QUERY_MS, "tracked": len(entries), "queries": queries}
+
+
+def reset_slow_queries() -> None:
+    with _lock:
+        _slow_queries.clear()
+
+
+# ── Route metrics ───────────────────────────────────────────────────────────
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "queries", "connections", "rows", "commits", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(COUNT_BUCKETS)
+        self.connections = Histogram(COUNT_BUCKETS)
+        self.rows = 0
+        self.commits = 0
+        self.statuses: Counter = Counter()
+
+
+_routes: dict[tuple[str, str], RouteMetrics] = {}
+
+
+def record_request(method: str, route: str, status: int, seconds: float, stats: SQLiteStats) -> None:
+    with _lock:
+        metrics = _routes.get((method, route))
+        if metrics is None:
+            metrics = _routes[(method, route)] = RouteMetrics()
+        metrics.latency.observe(seconds)
+        metrics.queries.observe(stats.queries)
+        metrics.connections.observe(stats.connections)
+        metrics.rows += stats.rows
+        metrics.commits += stats.commits
+        metrics.statuses[status] += 1
+
+
+def _route_name(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+class InstrumentationMiddleware:
+    """Times every HTTP request and records its SQLite counters by route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXCLUDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        stats = SQLiteStats(trace=_trace_statements)
+        token = _request_stats.set(stats)
+        status = 500
+        sampler = StackSampler() if SLOW_REQUEST_MS > 0 else None
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = _route_name(scope)
+            record_request(scope["method"], route, status, elapsed, stats)
+            for listener in _request_listeners:
+                listener(scope["method"], route, status, elapsed, stats)
+            if sampler is not None:
+                sampler.stop()
+                if elapsed * 1000 >= SLOW_REQUEST_MS:
+                    sampler.dump(scope["method"], route, elapsed, stats)
+
+
+# ── Sampling profiler ───────────────────────────────────────────────────────
+
+_profile_seq = count(1)
+
+
+class StackSampler:
+    """Samples every thread's stack at PROFILE_INTERVAL_S while a request runs.
+    Sync endpoints execute on the threadpool, so all threads are sampled;
+    concurrent requests therefore share samples."""
+
+    def __init__(self):
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(PROFILE_INTERVAL_S):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                # Idle threads just sit in a wait; skip them
+                if stack and not stack[0].startswith(("wait ", "select ", "_worker ")):
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, method: str, route: str, elapsed: float, stats: SQLiteStats) -> Optional[Path]:
+        if not self.samples:
+            return None
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        slug = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        path = PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_profile_seq):04d}-{int(elapsed * 1000)}ms-{method}-{slug}.folded"
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        path.write_text("\n".join(lines) + "\n")
+        print(f"Slow request {method} {route} took {elapsed * 1000:.0f} ms "
+              f"({stats.queries} queries, {stats.connections} connections); profile: {path}")
+        return path
+
+
+# ── Prometheus exposition ───────────────────────────────────────────────────
+
+def _labels(**labels) -> str:
+    inner = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def _histogram_lines(name: str, hist: Histogram, **labels) -> list[str]:
+    lines = []
+    for bound, count in zip(hist.buckets, hist.counts):
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {hist.sum}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+    return lines
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        routes = sorted(_routes.items())
+        process = {field: getattr(_process_stats, field) for field in SQLITE_FIELDS}
+
+        out = [
+            "# HELP saive_http_request_duration_seconds Request latency by route.",
+            "# TYPE saive_http_request_duration_seconds histogram",
+        ]
+        for (method, route), m in routes:
+            out += _histogram_lines("saive_http_request_duration_seconds", m.latency, method=method, route=route)
+
+        out += [
+            "# HELP saive_http_requests_total Requests by route and status code.",
+            "# TYPE saive_http_requests_total counter",
+        ]
+        for (method, route), m in routes:
+            for status, count in sorted(m.statuses.items()):
+                out.append(f"saive_http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+        out += [
+            "# HELP saive_http_request_sqlite_queries SQLite statements executed per request.",
+            "# TYPE saive_http_request_sqlite_queries histogram",
+        ]
+        for (method, route), m in routes:
+            out += _histogram_lines("saive_http_request_sqlite_queries", m.queries, method=method, route=route)
+
+        out += [
+            "# HELP saive_http_request_sqlite_connections SQLite connections opened per request.",
+            "# TYPE saive_http_request_sqlite_connections histogram",
+        ]
+        for (method, route), m in routes:
+            out += _histogram_lines("saive_http_request_sqlite_connections", m.connections, method=method, route=route)
+
+        out += [
+            "# HELP saive_http_request_sqlite_rows_total Rows fetched by requests, by route.",
+            "# TYPE saive_http_request_sqlite_rows_total counter",
+        ]
+        for (method, route), m in routes:
+            out.append(f"saive_http_request_sqlite_rows_total{_labels(method=method, route=route)} {m.rows}")
+
+        out += [
+            "# HELP saive_http_request_sqlite_commits_total Commits issued by requests, by route.",
+            "# TYPE saive_http_request_sqlite_commits_total counter",
+        ]
+        for (method, route), m in routes:
+            out.append(f"saive_http_request_sqlite_commits_total{_labels(method=method, route=route)} {m.commits}")
+
+    for field in SQLITE_FIELDS:
+        name = f"saive_sqlite_{field}_total"
+        out += [
+            f"# HELP {name} SQLite {field} across the whole process, background work included.",
+            f"# TYPE {name} counter",
+            f"{name} {process[field]}",
+        ]
+    return "\n".join(out) + "\n"
@@ -0,0 +1,176 @@
+"""
+launcher.py — Fast-start entry point for the desktop backend.
+
+Electron shows the UI only after it reads the `PORT:` line from stdout. This
+entry point binds the listening socket and prints the port before FastAPI,
+pydantic or any app module is imported, so Electron can start its readiness
+check while the app is still loading. Connections that arrive early wait in
+the socket's listen backlog until uvicorn starts accepting them, and handing
+uvicorn the already-bound socket removes the bind/close/rebind port race.
+
+On Linux and macOS the backend can listen on a Unix domain socket instead
+(SAIVE_UDS or --uds, a path chosen by Electron). It prints `UDS:<path>`
+rather than `PORT:<n>`. There is no port to pick, nothing else on the machine
+can reach the socket (it is created 0600), and each request skips the TCP
+loopback stack. If the platform has no AF_UNIX or the bind fails (e.g. the
+path is too long for sun_path), it falls back to TCP and prints `PORT:`.
+
+Desktop mode runs uvicorn with server_options(): uvloop and httptools when
+they are installed (uvicorn's "auto" falls back to asyncio/h11), no
+per-request access log, and a long keep-alive so the bursts of refetches
+after each SSE event reuse their connections.
+
+Once uvicorn is accepting, the modules listed in preload_modules.txt (or the
+SAIVE_PRELOAD env var) are imported on a background thread so the first MCP
+call or write does not pay for them.
+
+Usage:
+    python launcher.py                          # local/Electron mode, prints PORT:<n>
+    python launcher.py --uds /tmp/saive.sock    # Unix socket, prints UDS:<path>
+    PORT=8000 python launcher.py                # cloud mode, same as `python main.py`
+    SAIVE_PRELOAD= python launcher.py           # disable the post-startup warm-up
+"""
+
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+def preload_list() -> list[str]:
+    """Modules to warm after startup: SAIVE_PRELOAD (comma-separated) wins,
+    otherwise preload_modules.txt next to the bundle or this file."""
+    env = os.environ.get("SAIVE_PRELOAD")
+    if env is not None:
+        return [m.strip() for m in env.split(",") if m.strip()]
+
+    base_dir = Path(getattr(sys, "_MEIPASS", Path(__file__).resolve().parent))
+    path = base_dir / "preload_modules.txt"
+    if not path.exists():
+        return []
+    lines = (line.split("#", 1)[0].strip() for line in path.read_text().splitlines())
+    return [line for line in lines if line]
+
+
+def start_preload(server) -> None:
+    """Import the preload list once `server` has started accepting requests."""
+    modules = preload_list()
+    if not modules:
+        return
+
+    def run():
+        while not server.started and not server.should_exit:
+            time.sleep(0.05)
+        for module in modules:
+            try:
+                __import__(module)
+            except ImportError as e:
+                print(f"Preload of {module} failed: {e}")
+
+    threading.Thread(target=run, name="preload", daemon=True).start()
+
+
+UDS_SUPPORTED = sys.platform != "win32" and hasattr(socket, "AF_UNIX")
+BACKLOG = 128
+
+
+def uds_path(argv: list[str] = None) -> str | None:
+    """The Unix socket path from --uds or SAIVE_UDS, if any."""
+    argv = sys.argv[1:] if argv is None else argv
+    if "--uds" in argv:
+        index = argv.index("--uds")
+        if index + 1 < len(argv):
+            return argv[index + 1]
+    return os.environ.get("SAIVE_UDS") or None
+
+
+def bind_local(path: str | None = None) -> tuple[socket.socket, str]:
+    """Bind the desktop listener before any app import.
+
+    Returns the listening socket and the line Electron waits for: `UDS:<path>`
+    for a Unix socket at `path`, else `PORT:<n>` for a free loopback port.
+    """
+    if path and UDS_SUPPORTED:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # A previous run leaves its socket file behind; never remove anything else
+            if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+                os.unlink(path)
+            # Created owner-only: a chmod after bind() would leave a window in
+            # which another local user could connect. Nothing else runs yet,
+            # so changing the process-wide umask here is safe.
+            umask = os.umask(0o177)
+            try:
+                sock.bind(path)
+            finally:
+                os.umask(umask)
+            os.chmod(path, 0o600)
+            sock.listen(BACKLOG)
+            return sock, f"UDS:{path}"
+        except OSError as e:
+            sock.close()
+            print(f"Unix socket {path} unavailable ({e}), falling back to TCP")
+    elif path:
+        print("Unix sockets are not supported on this platform, falling back to TCP")
+
+    # Let the OS assign a free port and keep the socket open for uvicorn.
+    # IPPROTO_TCP (not the default 0) is what makes asyncio set TCP_NODELAY on
+    # accepted connections; without it kept-alive requests stall ~40 ms on
+    # Nagle plus delayed ACK.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(BACKLOG)
+    return sock, f"PORT:{sock.getsockname()[1]}"
+
+
+def server_options() -> dict:
+    """uvicorn.Config keyword arguments for the desktop backend."""
+    return {
+        "loop": "auto",                 # uvloop when installed
+        "http": "auto",                 # httptools when installed
+        "access_log": False,
+        "timeout_keep_alive": 75,
+        "log_level": "info",
+    }
+
+
+def serve(app, sock: socket.socket) -> None:
+    """Run uvicorn on an already-bound socket.
+
+    A Unix socket file is left in place on exit (uvicorn re-raises SIGTERM
+    once it has shut down); bind_local() replaces it on the next start.
+    """
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, **server_options()))
+    start_preload(server)
+    server.run(sockets=[sock])
+
+
+def main() -> None:
+    # Cloud environments (e.g. Railway) dictate the port; nothing to race for
+    env_port = os.getenv("PORT")
+    if env_port:
+        import uvicorn
+        from main import app
+
+        print(f"Starting in cloud mode on port {env_port}")
+        uvicorn.run(app, host="0.0.0.0", port=int(env_port), log_level="info")
+        return
+
+    sock, announce = bind_local(uds_path())
+
+    # Signal the address to Electron (must be flushed immediately)
+    print(announce, flush=True)
+
+    # Heavy imports happen only after Electron already knows where to connect
+    from main import app
+
+    serve(app, sock)
+
+
+if __name__ == "__main__":
+    main()
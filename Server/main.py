@@ -1,31 +1,51 @@
-from datetime import datetime
-import time
-from fastapi import FastAPI, Depends, HTTPException
+from datetime import datetime, date, timedelta
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import models
 import crud
 import database
 import sse_bus
+import recompute_worker
+import unit_of_work
+import instrumentation
+import fast_json
+import range_index
+import recipient_index
+import rules_engine
+import vector_index
+import compact_output
+import compression
 from typing import List, Optional
 from collections import defaultdict
 from contextlib import asynccontextmanager
 import asyncio
-import bleach
+import hashlib
+import json
+import threading
 
 def sanitize(value: str) -> str:
     """Strip all HTML/script tags from a string to prevent stored XSS."""
+    import bleach  # deferred: only the MCP write tools need it, keep it off startup
     return bleach.clean(str(value), tags=[], strip=True)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Start the background task
+    # Create/migrate the schema off the startup path; the first connection
+    # waits for it if a request beats it there
+    threading.Thread(target=database.ensure_schema, name="schema-init", daemon=True).start()
+    # Start the background tasks
+    recompute_worker.start()
     task = asyncio.create_task(process_recurring_transactions_loop())
     yield
     # Optionally cancel task on shutdown
     task.cancel()
+    recompute_worker.stop()
+    if vector_index.available():
+        vector_index.flush()
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=fast_json.FastJSONResponse)
 
 origins = ["*"]
 
@@ -40,8 +60,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if compression.enabled():
+    # Cloud mode: list responses cross a real network, so gzip/brotli them
+    app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(instrumentation.InstrumentationMiddleware)
 
-database.create_tables()
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Per-route latency and SQLite counters in Prometheus text format."""
+    return PlainTextResponse(instrumentation.render_prometheus(), media_type=instrumentation.PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/diagnostics/slow-queries", include_in_schema=False)
+def slow_queries(limit: Optional[int] = None):
+    """Slowest SQL statement shapes seen by this process, with their query plans."""
+    return instrumentation.slow_query_report(limit)
 
 # --- SSE Events Endpoint ---
 @app.get("/events/{user_id}")
@@ -61,10 +93,29 @@ async def event_stream(user_id: int):
 # User endpoints
 @app.post("/users/", response_model=models.User)
 def create_user(user: models.User):
-    return crud.create_user(user)
+    # net_worth is derived from transactions, debts and assets; like the
+    # onboarding balances, an opening net worth is logged as a transaction
+    current_date = datetime.now()
+    with unit_of_work.begin(immediate=True):
+        user_id = crud.create_user(user).id
+        if user.net_worth:
+            crud.create_transaction(models.TransactionCreate(
+                user_id=user_id,
+                amount=abs(user.net_worth),
+                type="income" if user.net_worth > 0 else "expense",
+                category="Income" if user.net_worth > 0 else "Other",
+                date=current_date.strftime("%Y-%m-%d"),
+                recipient="Opening Balance"
+            ))
+            recompute_worker.mark_dirty(user_id, [(current_date.year, current_date.month)])
+        created = crud.get_user(user_id)
+    if user.net_worth:
+        sse_bus.emit_event("transactions_changed", user_id)
+    return created
 
 @app.get("/users/{user_id}", response_model=models.User)
 def read_user(user_id: int):
+    recompute_worker.wait_until_clean(user_id)
     db_user = crud.get_user(user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -80,6 +131,8 @@ def update_user(user_id: int, user: models.User):
 @app.delete("/users/{user_id}")
 def delete_user(user_id: int):
     crud.delete_user(user_id)
+    # The saved vector index outlives the process; drop it with the user
+    vector_index.invalidate(user_id)
     return {"detail": "User deleted"}
 
 # --- Onboarding Endpoint ---
@@ -98,36 +151,34 @@ def onboard_user(user_id: int, data: OnboardData):
     
     current_date = datetime.now()
     
-    # Insert 'Checking Balance' as an income transaction
-    if data.checking > 0:
-        tx_checking = models.TransactionCreate(
-            user_id=user_id,
-            amount=data.checking,
-            type="income",
-            category="Income",
-            date=current_date.strftime("%Y-%m-%d"),
-            recipient="Checking Account"
-        )
-        crud.create_transaction(tx_checking)
-        
-    # Insert 'Savings Balance' as an income transaction
-    if data.savings > 0:
-        tx_savings = models.TransactionCreate(
-            user_id=user_id,
-            amount=data.savings,
-            type="income",
-            category="Income",
-            date=current_date.strftime("%Y-%m-%d"),
-            recipient="Savings Account"
-        )
-        crud.create_transaction(tx_savings)
+    with unit_of_work.begin():
+        # Insert 'Checking Balance' as an income transaction
+        if data.checking > 0:
+            tx_checking = models.TransactionCreate(
+                user_id=user_id,
+                amount=data.checking,
+                type="income",
+                category="Income",
+                date=current_date.strftime("%Y-%m-%d"),
+                recipient="Checking Account"
+            )
+            crud.create_transaction(tx_checking)
 
-    # Note: data.income is kept on the client side for AI context, we don't insert a fake transaction for it.
-    
-    all_transactions = crud.get_all_transactions()
-    month_update(user_id, all_transactions)
-    organize_assets(user_id, all_transactions)
-    update_networth(user_id, transactions=all_transactions)
+        # Insert 'Savings Balance' as an income transaction
+        if data.savings > 0:
+            tx_savings = models.TransactionCreate(
+                user_id=user_id,
+                amount=data.savings,
+                type="income",
+                category="Income",
+                date=current_date.strftime("%Y-%m-%d"),
+                recipient="Savings Account"
+            )
+            crud.create_transaction(tx_savings)
+
+        # Note: data.income is kept on the client side for AI context, we don't insert a fake transaction for it.
+
+        recompute_worker.mark_dirty(user_id, [(current_date.year, current_date.month)])
     sse_bus.emit_event("transactions_changed", user_id)
 
     return {"detail": "Onboarding complete"}
@@ -149,6 +200,7 @@ def update_budget(user_id: int, budget: models.BudgetCreate):
 
 @app.get("/user_asset/{user_id}", response_model=models.UserAssetWithUser)
 def get_user_asset(user_id: int):
+    recompute_worker.wait_until_clean(user_id)
     CurrentDate = datetime.now()
     db_user_asset = crud.get_user_asset(user_id, CurrentDate.year, CurrentDate.month)
     user = crud.get_user(user_id)
@@ -165,52 +217,67 @@ def get_user_asset(user_id: int):
     return models.UserAssetWithUser(asset=db_user_asset, previous_asset=previous_user_asset, user=user)
 
 @app.get("/user_assets/{user_id}/all", response_model=List[models.UserAsset])
-def get_user_asset_history(user_id: int):
-    time.sleep(.05)
-    return crud.get_all_user_assets(user_id)
+def get_user_asset_history(user_id: int, fields: Optional[str] = None):
+    wanted = fast_json.parse_fields(fields, models.UserAsset)
+    recompute_worker.wait_until_clean(user_id)
+    return fast_json.trusted(fast_json.project(crud.get_all_user_asset_rows(user_id), wanted))
 @app.get("/user_assets/{user_id}/category", response_model=List[models.AssetCategory])
 def get_category_summary(user_id: int):
     return crud.get_assets_by_all_category(user_id)
 
 # Transaction endpoints
 @app.post("/transactions/")
-def create_transaction(transaction: models.TransactionCreate):
-    # Validate linked debt (if any) before creating the transaction
-    debt = None
-    if transaction.debt_id is not None:
-        debt = crud.get_debt(transaction.debt_id)
-        if debt is None:
-            raise HTTPException(status_code=404, detail="Debt not found")
-        # Ensure the debt belongs to the same user as the transaction
-        if getattr(debt, "user_id", None) != transaction.user_id:
-            raise HTTPException(status_code=400, detail="Debt does not belong to user")
-
-    crud.create_transaction(transaction)
-
-    if debt is not None:
-        is_payment = transaction.category == models.TransactionCategory.Bills
-        if is_payment:
-            # Payment reduces debt balance
-            crud.update_debt_balance(transaction.debt_id, debt.balance - transaction.amount)
+def create_transaction(transaction: models.TransactionCreate,
+                       on_duplicate: models.DuplicatePolicy = models.DuplicatePolicy.allow):
+    """`on_duplicate` applies when a transaction with the same day, amount,
+    recipient and type exists: allow, skip, flag (insert and report it) or
+    merge (update the existing one's category and recipient spelling)."""
+    with unit_of_work.begin(immediate=True):
+        if transaction.debt_id is None:
+            outcome, duplicate_of = crud.create_transactions([transaction], on_duplicate)[0]
         else:
-            # Charge increases debt balance
-            crud.update_debt_balance(transaction.debt_id, debt.balance + transaction.amount)
-        sse_bus.emit_event("debts_changed", transaction.user_id)
-    all_transactions = crud.get_all_transactions()
-
-    month_update(transaction.user_id, all_transactions)
-    organize_assets(transaction.user_id, all_transactions)
-    update_networth(transaction.user_id, transactions = all_transactions)
+            outcome, duplicate_of = "inserted", None
+            if on_duplicate != models.DuplicatePolicy.allow:
+                duplicate_of = crud.match_duplicate_transactions([transaction])[0]
+            if duplicate_of is not None and on_duplicate != models.DuplicatePolicy.flag:
+                # Merging would move the debt balance a second time
+                outcome = "skipped"
+            else:
+                # Insert and move the debt balance (payment down, charge up) in SQL, atomically
+                debt_balance = crud.create_debt_linked_transaction(transaction)
+                if debt_balance is None:
+                    if crud.get_debt(transaction.debt_id) is None:
+                        raise HTTPException(status_code=404, detail="Debt not found")
+                    raise HTTPException(status_code=400, detail="Debt does not belong to user")
+                if duplicate_of is not None:
+                    outcome = "flagged"
+
+        if outcome == "skipped":
+            return {"detail": "Duplicate transaction skipped", "duplicate_of": duplicate_of}
+        recompute_worker.mark_dirty(transaction.user_id, [(transaction.date.year, transaction.date.month)])
+
     sse_bus.emit_event("transactions_changed", transaction.user_id)
-    return {"detail": "Transaction created successfully"}
+    if outcome == "merged":
+        body = {"detail": "Merged into the existing transaction"}
+    else:
+        body = {"detail": "Transaction created successfully"}
+    if duplicate_of is not None:
+        body["duplicate_of"] = duplicate_of
+    if transaction.debt_id is None:
+        return body
+    sse_bus.emit_event("debts_changed", transaction.user_id)
+    return {**body, "debt_balance": debt_balance}
 
 
 @app.get("/transactions/", response_model=list[models.Transaction])
-def get_all_transactions():
-    transactions = crud.get_all_transactions()
-    month_update(1, transactions)
+def get_all_transactions(fields: Optional[str] = None):
+    body = crud.get_all_transactions_json(fast_json.parse_fields(fields, models.Transaction))
+    # Roll the current month's asset row over lazily once a new month starts
+    current_date = datetime.now()
+    if crud.get_user_asset(1, current_date.year, current_date.month) is None:
+        recompute_worker.mark_dirty(1, [(current_date.year, current_date.month)])
     
-    return transactions
+    return fast_json.raw(body)
 
 @app.get("/transactions/{transaction_id}", response_model=models.Transaction)
 def read_transaction(transaction_id: int):
@@ -222,45 +289,115 @@ def read_transaction(transaction_id: int):
 
 @app.delete("/transactions/{transaction_id}")
 def delete_transaction(transaction_id: int):
-    # Get transaction details first to know which user to update
-    transaction = crud.get_transaction(transaction_id)
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-    
-    user_id = transaction.user_id
-
-    # If this transaction was charged to a debt, reverse the balance change
-    if transaction.debt_id is not None:
-        debt = crud.get_debt(transaction.debt_id)
-        if debt:
-            is_payment = transaction.category == models.TransactionCategory.Bills
-            if is_payment:
-                # Payment reduced balance on create, so add back on delete
-                new_balance = debt.balance + transaction.amount
-            else:
-                # Charge increased balance on create, so subtract on delete
-                new_balance = debt.balance - transaction.amount
-            crud.update_debt_balance(transaction.debt_id, new_balance)
-            sse_bus.emit_event("debts_changed", user_id)
+    with unit_of_work.begin(immediate=True):
+        # Delete and reverse any linked debt balance change in one SQLite transaction
+        transaction, debt_balance = crud.delete_transaction_reversing_debt(transaction_id)
+        if not transaction:
+            raise HTTPException(status_code=404, detail="Transaction not found")
 
-    crud.delete_transaction(transaction_id)
-    
-    all_transactions = crud.get_all_transactions()
-    user_transactions = [t for t in all_transactions if t.user_id == user_id]
-    
-    update_networth(user_id, transactions=user_transactions)
-    month_update(user_id, user_transactions)
-    organize_assets(user_id, user_transactions)
+        user_id = transaction.user_id
+        recompute_worker.mark_dirty(user_id, [(transaction.date.year, transaction.date.month)])
+
+    if debt_balance is not None:
+        sse_bus.emit_event("debts_changed", user_id)
     sse_bus.emit_event("transactions_changed", user_id)
     
     return {"detail": "Transaction deleted"}
 
+MAX_SEARCH_PAGE = 200
+
+@app.get("/transactions/{user_id}/search")
+def search_transactions(user_id: int, q: str, limit: int = 50, offset: int = 0, fields: Optional[str] = None):
+    """Ranked full-text search over recipient and category; every word of `q`
+    matches as a prefix. Paginate with limit/offset; `total` counts all matches."""
+    if not 1 <= limit <= MAX_SEARCH_PAGE or offset < 0:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{MAX_SEARCH_PAGE} and offset >= 0")
+    wanted = fast_json.parse_fields(fields, models.Transaction)
+    total, results = crud.search_transactions(user_id, q, limit, offset)
+    return fast_json.trusted({
+        "user_id": user_id,
+        "query": q,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "results": fast_json.project(results, wanted),
+    })
+
+MAX_SUGGESTIONS = 50
+
+@app.get("/recipients/{user_id}/suggest")
+def suggest_recipients(user_id: int, prefix: str = "", limit: int = 10):
+    """Recipients the user has logged before that start with `prefix`, most
+    used first, each with its usual category and typical amount. `known`
+    suggestions are reliable enough to skip model categorisation."""
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{MAX_SUGGESTIONS}")
+    return {"user_id": user_id, "prefix": prefix,
+            "suggestions": recipient_index.suggest(user_id, prefix, limit)}
+
+# --- Category Rules ---
+
+@app.get("/rules/{user_id}", response_model=List[models.CategoryRule])
+def get_category_rules(user_id: int):
+    return crud.get_category_rules(user_id)
+
+@app.post("/rules/", response_model=models.CategoryRule)
+def create_category_rule(rule: models.CategoryRuleCreate):
+    created = crud.create_category_rule(rule)
+    rules_engine.invalidate(rule.user_id)
+    return created
+
+@app.put("/rules/{rule_id}", response_model=models.CategoryRule)
+def update_category_rule(rule_id: int, rule: models.CategoryRuleCreate):
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_category_rule(rule_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Rule not found")
+        if existing.user_id != rule.user_id:
+            raise HTTPException(status_code=400, detail="User ID mismatch")
+        updated = crud.update_category_rule(rule_id, rule)
+    rules_engine.invalidate(existing.user_id)
+    return updated
+
+@app.delete("/rules/{rule_id}")
+def delete_category_rule(rule_id: int):
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_category_rule(rule_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Rule not found")
+        crud.delete_category_rule(rule_id)
+    rules_engine.invalidate(existing.user_id)
+    return {"detail": "Rule deleted"}
+
+@app.post("/rules/{user_id}/learn")
+def learn_category_rules(user_id: int):
+    """Creates exact rules for recipients whose category is settled (the ones
+    /recipients/{user_id}/suggest reports as `known`) and drops stale ones."""
+    with unit_of_work.begin(immediate=True):
+        learned = crud.learn_category_rules(user_id, recipient_index.KNOWN_MIN_COUNT,
+                                            recipient_index.KNOWN_MIN_SHARE)
+    rules_engine.invalidate(user_id)
+    return {"user_id": user_id, **learned}
+
+@app.post("/rules/{user_id}/categorize")
+def categorize_transactions(user_id: int, items: List[models.CategorizeItem], record_hits: bool = True):
+    """Runs the user's rules over `items` (e.g. an import batch). Each result is
+    {"category", "rule_id"}, or null where no rule matched and the model should decide."""
+    results = rules_engine.categorize_many(
+        user_id, [(item.recipient, item.amount, item.type) for item in items], record_hits)
+    return fast_json.trusted({
+        "user_id": user_id,
+        "matched": sum(result is not None for result in results),
+        "results": results,
+    })
+
 @app.get("/stats/sankey/{user_id}")
 def get_sankey_data(user_id: int, year: Optional[int] = None, month: Optional[int] = None):
     current_date = datetime.now()
     target_year = year if year is not None else current_date.year
     target_month = month if month is not None else current_date.month
     
+    recompute_worker.wait_until_clean(user_id)
     # Fetch transactions filtered at the SQL level by month/year
     filtered_txns = crud.get_transactions_by_month(user_id, target_year, target_month)
 
@@ -271,6 +408,11 @@ def get_sankey_data(user_id: int, year: Optional[int] = None, month: Optional[in
         prev_year, prev_month = target_year, target_month - 1
     
     prev_asset = crud.get_user_asset(user_id, prev_year, prev_month)
+    return build_sankey(filtered_txns, prev_asset)
+
+def build_sankey(filtered_txns: list, prev_asset: Optional[models.UserAsset]) -> dict:
+    """Sankey nodes and links for one month's transactions, seeded with the
+    previous month's savings."""
     prev_savings = prev_asset.TSavings if prev_asset and prev_asset.TSavings > 0 else 0
 
     income_total = sum(t.amount for t in filtered_txns if t.type == "income")
@@ -319,7 +461,11 @@ def get_sankey_data(user_id: int, year: Optional[int] = None, month: Optional[in
 @app.get("/stats/history/{user_id}")
 def get_stats_history(user_id: int):
     """Returns monthly financial summary for up to the last 12 months."""
-    assets = crud.get_all_user_assets(user_id)
+    recompute_worker.wait_until_clean(user_id)
+    return build_history(crud.get_all_user_assets(user_id))
+
+def build_history(assets: list) -> list:
+    """The last 12 monthly summaries from the user's user_assets rows."""
     if not assets:
         return []
     
@@ -352,7 +498,10 @@ def get_stats_categories(user_id: int, year: Optional[int] = None, month: Option
     target_month = month if month is not None else current_date.month
     
     txns = crud.get_transactions_by_month(user_id, target_year, target_month)
-    
+    return build_category_breakdown(txns)
+
+def build_category_breakdown(txns: list) -> list:
+    """Expense total and share per category, largest first."""
     categories = defaultdict(float)
     for t in txns:
         if t.type == "expense":
@@ -383,20 +532,28 @@ def create_recurring(rt: models.RecurringTransactionCreate):
     return {"detail": "Recurring transaction created"}
 
 @app.get("/recurring_transactions/{user_id}", response_model=List[models.RecurringTransaction])
-def get_recurring(user_id: int):
+def get_recurring(user_id: int, fields: Optional[str] = None):
+    wanted = fast_json.parse_fields(fields, models.RecurringTransaction)
+    if wanted:
+        return fast_json.trusted(fast_json.project(crud.get_all_recurring_transactions(user_id), wanted))
     return crud.get_all_recurring_transactions(user_id)
 
 @app.put("/recurring_transactions/{rt_id}")
 def update_recurring(rt_id: int, rt: models.RecurringTransactionCreate):
-    crud.update_recurring_transaction(rt_id, rt)
-    sse_bus.emit_event("recurring_changed", rt.user_id)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_recurring_transaction(rt_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Recurring transaction not found")
+        crud.update_recurring_transaction(rt_id, rt)
+    sse_bus.emit_event("recurring_changed", existing.user_id)
     return {"detail": "Recurring transaction updated"}
 
 @app.delete("/recurring_transactions/{rt_id}")
 def delete_recurring(rt_id: int):
-    existing = crud.get_recurring_transaction(rt_id)
-    user_id = existing.user_id if existing else 1
-    crud.delete_recurring_transaction(rt_id)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_recurring_transaction(rt_id)
+        user_id = existing.user_id if existing else 1
+        crud.delete_recurring_transaction(rt_id)
     sse_bus.emit_event("recurring_changed", user_id)
     return {"detail": "Recurring transaction deleted"}
 
@@ -404,85 +561,224 @@ def delete_recurring(rt_id: int):
 def get_category_history(user_id: int, categories: str = "Housing,Food,Transport"):
     """Returns monthly expense totals for specific categories over last 12 months."""
     target_cats = [c.strip() for c in categories.split(",")]
-    assets = crud.get_all_user_assets(user_id)
-    if not assets:
-        return []
-    
-    sorted_assets = sorted(assets, key=lambda a: (a.year, a.month))
+    recompute_worker.wait_until_clean(user_id)
     month_names = ["", "Jan", "Feb", "Mar", "Apr", "May", "Jun",
                    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
     
     result = []
-    for a in sorted_assets[-12:]:
-        txns = crud.get_transactions_by_month(user_id, a.year, a.month)
+    for year, month, totals in crud.get_category_history(user_id, target_cats, 12):
         entry = {
-            "month": month_names[a.month],
-            "year": a.year,
-            "label": f"{month_names[a.month]} {a.year}",
+            "month": month_names[month],
+            "year": year,
+            "label": f"{month_names[month]} {year}",
         }
         for cat in target_cats:
-            entry[cat] = sum(t.amount for t in txns if t.type == "expense" and t.category == cat)
+            entry[cat] = totals.get(cat, 0)
         result.append(entry)
     
     return result
 
+# Longest start..end span the range mode of /stats/daily-spending serves
+MAX_DAILY_SPENDING_DAYS = 3660
+
 @app.get("/stats/daily-spending/{user_id}")
-def get_daily_spending(user_id: int, year: Optional[int] = None, month: Optional[int] = None):
-    """Returns daily expense totals for heatmap visualization."""
+def get_daily_spending(user_id: int, year: Optional[int] = None, month: Optional[int] = None,
+                       start: Optional[date] = None, end: Optional[date] = None):
+    """Returns daily expense totals for heatmap visualization.
+    With start and end, returns every day in the range with spending as
+    parallel `dates` / `amounts` arrays, for year (or multi-year) views."""
+    if start is not None or end is not None:
+        if start is None or end is None:
+            raise HTTPException(status_code=400, detail="start and end must be given together")
+        if end < start:
+            raise HTTPException(status_code=400, detail="end must not be before start")
+        if (end - start).days >= MAX_DAILY_SPENDING_DAYS:
+            raise HTTPException(status_code=400, detail=f"range must be under {MAX_DAILY_SPENDING_DAYS} days")
+        daily = crud.get_daily_expense_totals(user_id, start.isoformat(), end.isoformat())
+        amounts = [round(amount, 2) for _, amount in daily]
+        return {
+            "user_id": user_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "dates": [day for day, _ in daily],
+            "amounts": amounts,
+            "total": round(sum(amounts), 2),
+            "max": max(amounts, default=0),
+        }
+
     current_date = datetime.now()
     target_year = year if year is not None else current_date.year
     target_month = month if month is not None else current_date.month
-    
-    txns = crud.get_transactions_by_month(user_id, target_year, target_month)
-    
-    daily = defaultdict(float)
-    for t in txns:
-        if t.type == "expense":
-            day = t.date.day if hasattr(t.date, 'day') else int(str(t.date).split('-')[2])
-            daily[day] += t.amount
-    
-    # Build full month calendar
+
     import calendar
-    days_in_month = calendar.monthrange(target_year, target_month)[1]
+    first_weekday, days_in_month = calendar.monthrange(target_year, target_month)
+    daily = dict(crud.get_daily_expense_totals(
+        user_id,
+        date(target_year, target_month, 1).isoformat(),
+        date(target_year, target_month, days_in_month).isoformat(),
+    ))
+
+    # Build full month calendar
     result = []
     for d in range(1, days_in_month + 1):
         result.append({
             "day": d,
-            "amount": round(daily.get(d, 0), 2),
-            "weekday": calendar.weekday(target_year, target_month, d),  # 0=Mon, 6=Sun
+            "amount": round(daily.get(date(target_year, target_month, d).isoformat(), 0), 2),
+            "weekday": (first_weekday + d - 1) % 7,  # 0=Mon, 6=Sun
         })
     
     return result
 
+@app.get("/stats/range/{user_id}")
+def get_stats_range(user_id: int, start: date, end: date):
+    """Returns income, expense and net between two dates (inclusive), overall
+    and per category, from the in-memory prefix-sum index."""
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    return range_index.range_summary(user_id, start, end)
+
+
+NET_WORTH_INTERVALS = ("daily", "weekly", "monthly")
+
+def downsample_net_worth(snapshots: list, start: date, interval: str) -> list:
+    """End-of-period net worth per day, ISO week (keyed by its Monday) or month,
+    from (day, net_worth) snapshots. The first point is the value on `start`."""
+    points = {}
+    for day, net_worth in snapshots:
+        d = max(date.fromisoformat(day), start)
+        if interval == "weekly":
+            d -= timedelta(days=d.weekday())
+        elif interval == "monthly":
+            d = d.replace(day=1)
+        points[d.isoformat()] = net_worth
+    return [{"date": d, "net_worth": round(v, 2)} for d, v in points.items()]
+
+@app.get("/stats/net-worth/{user_id}")
+def get_net_worth_history(user_id: int, start: Optional[date] = None, end: Optional[date] = None, interval: str = "daily"):
+    """Returns net worth over time from the daily snapshots, downsampled to
+    daily, weekly or monthly points (defaults to the last 12 months)."""
+    if interval not in NET_WORTH_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(NET_WORTH_INTERVALS)}")
+    end = end or date.today()
+    start = start or end - timedelta(days=365)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    recompute_worker.wait_until_clean(user_id)
+    snapshots = crud.get_net_worth_snapshots(user_id, start.isoformat(), end.isoformat())
+    return {
+        "user_id": user_id,
+        "interval": interval,
+        "points": downsample_net_worth(snapshots, start, interval),
+    }
+
+
+# --- Dashboard Bundle ---
+
+DASHBOARD_SECTIONS = ("user_asset", "history", "sankey", "categories", "budgets",
+                      "notifications", "tracked_assets", "debts")
+
+def section_etag(payload) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(body.encode()).hexdigest()[:16]
+
+def parse_known_etags(known: Optional[str]) -> dict:
+    """`history:ab12,sankey:cd34` -> {"history": "ab12", "sankey": "cd34"}"""
+    pairs = (item.split(":", 1) for item in (known or "").split(",") if ":" in item)
+    return {name.strip(): etag.strip() for name, etag in pairs}
+
+@app.get("/dashboard/{user_id}")
+def get_dashboard(user_id: int, request: Request, response: Response,
+                  sections: Optional[str] = None, known: Optional[str] = None):
+    """Returns every dashboard widget's payload in one response, read from one
+    SQLite snapshot. Each section carries an ETag; sections whose ETag is
+    passed in `known` (name:etag,...) come back as {"etag", "unchanged": true}
+    without data, and If-None-Match on the bundle ETag returns 304."""
+    wanted = DASHBOARD_SECTIONS if not sections else tuple(
+        name for name in DASHBOARD_SECTIONS if name in {part.strip() for part in sections.split(",")})
+    recompute_worker.wait_until_clean(user_id)
+
+    now = datetime.now()
+    prev_key = (now.year - 1, 12) if now.month == 1 else (now.year, now.month - 1)
+    payloads = {}
+    with unit_of_work.begin(snapshot=True):
+        user = crud.get_user(user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        # Shared loads: the monthly rows feed user_asset, history and the
+        # sankey seed; this month's transactions feed sankey and categories
+        assets = crud.get_all_user_assets(user_id)
+        by_month = {(a.year, a.month): a for a in assets}
+        if "sankey" in wanted or "categories" in wanted:
+            month_txns = crud.get_transactions_by_month(user_id, now.year, now.month)
+
+        if "user_asset" in wanted:
+            current = by_month.get((now.year, now.month))
+            payloads["user_asset"] = None if current is None else models.UserAssetWithUser(
+                asset=current, previous_asset=by_month.get(prev_key), user=user)
+        if "history" in wanted:
+            payloads["history"] = build_history(assets)
+        if "sankey" in wanted:
+            payloads["sankey"] = build_sankey(month_txns, by_month.get(prev_key))
+        if "categories" in wanted:
+            payloads["categories"] = build_category_breakdown(month_txns)
+        if "budgets" in wanted:
+            payloads["budgets"] = crud.get_budgets(user_id)
+        if "notifications" in wanted:
+            payloads["notifications"] = crud.get_user_notifications(user_id)
+        if "tracked_assets" in wanted:
+            payloads["tracked_assets"] = crud.get_tracked_assets(user_id)
+        if "debts" in wanted:
+            payloads["debts"] = crud.get_debts(user_id)
+
+    payloads = jsonable_encoder(payloads)
+    etags = {name: section_etag(payload) for name, payload in payloads.items()}
+    bundle_etag = '"' + section_etag(etags) + '"'
+    if bundle_etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": bundle_etag})
+    response.headers["ETag"] = bundle_etag
+
+    client_etags = parse_known_etags(known)
+    return {
+        "user_id": user_id,
+        "sections": {
+            name: {"etag": etags[name], "unchanged": True} if client_etags.get(name) == etags[name]
+            else {"etag": etags[name], "data": payloads[name]}
+            for name in wanted
+        },
+    }
+
+
+# --- Incremental Sync ---
+
+@app.get("/sync/{user_id}")
+def sync_changes(user_id: int, since: int = 0):
+    """Rows in the synced tables (transactions, budgets, debts, tracked_assets,
+    user_assets, recurring_transactions, notifications) changed since the
+    client's cursor, from the trigger-written change_log. Pass the returned
+    `seq` as `since` next time; `full: true` means replace the local cache."""
+    if since < 0:
+        raise HTTPException(status_code=400, detail="since must be >= 0")
+    # user_assets rows are written by the worker; wait so they include the client's own writes
+    recompute_worker.wait_until_clean(user_id)
+    with unit_of_work.begin(snapshot=True):
+        if crud.get_user(user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        payload = crud.get_changes_since(user_id, since)
+    return fast_json.trusted(payload)
+
 
 # Non endpoint functions
 
-def update_networth(user_id: int, transaction: Optional[models.TransactionCreate] = None, transactions: Optional[List[models.TransactionCreate]] = None):
-    user = crud.get_user(user_id)
-    if user is None:
+@unit_of_work.transactional
+def update_networth(user_id: int):
+    """Net worth = ledger balance + tracked assets - debts, straight from the
+    user's running totals. The user_totals triggers already keep it current;
+    this re-syncs it after a recompute or a manual PUT /users edit."""
+    if crud.get_user(user_id) is None:
         raise HTTPException(status_code=404, detail="User not found")
+    crud.refresh_net_worth(user_id)
 
-    total_debt = crud.get_total_debt_balance(user_id)
-    total_assets = crud.get_total_tracked_assets_value(user_id)
-
-    if transaction:
-        if transaction.type == "income":
-            user.net_worth += transaction.amount
-        elif transaction.type == "expense":
-            user.net_worth -= transaction.amount
-        user.net_worth += total_assets
-        user.net_worth -= total_debt
-    elif transactions:
-        raw = 0.0
-        for tx in transactions:
-            if tx.type == "income":
-                raw += tx.amount
-            elif tx.type == "expense":
-                raw -= tx.amount
-        user.net_worth = (raw + total_assets) - total_debt
-
-    crud.update_user(user_id, user)
-
+@unit_of_work.transactional
 def month_update(user_id: int, transactions: list[models.TransactionCreate]):
     user = crud.get_user(user_id)
     if user is None:
@@ -535,15 +831,55 @@ def month_update(user_id: int, transactions: list[models.TransactionCreate]):
     )
     crud.update_user_asset(user_asset_obj)
 
-def organize_assets(user_id: int, transactions: list[models.TransactionCreate]):
+@unit_of_work.transactional
+def organize_assets(user_id: int, transactions: list[models.TransactionCreate], since: Optional[tuple[int, int]] = None):
     """
     Organizes assets for the user based on transactions.
-    This function can be expanded to include more complex asset management logic.
+    Months before `since` (year, month) are left untouched; their stored
+    savings seed the overflow chain for the months that are recomputed.
     """
-    assets = crud.get_all_user_assets(user_id)
+    assets = crud.get_all_user_assets(user_id) if since is None else crud.get_user_assets_since(user_id, *since)
+
+    # Create assets for months that have transactions but no row yet, before
+    # chaining, so the new months pick up overflow in this same pass
+
+    # Build a set of (year, month) tuples from assets
+    asset_months = {(a.year, a.month) for a in assets}
+
+    # Organize transactions by (year, month)
+    txns_by_month = defaultdict(list)
+    for t in transactions:
+        txns_by_month[(t.date.year, t.date.month)].append(t)
+
+    new_months = [ym for ym in txns_by_month if ym not in asset_months and (since is None or ym >= since)]
+    for (year, month) in new_months:
+        txns = txns_by_month[(year, month)]
+        TotalIncome = sum(t.amount for t in txns if t.type == "income")
+        TotalExpense = sum(t.amount for t in txns if t.type == "expense")
+        TotalSavings = TotalIncome - TotalExpense
+
+        asset = models.UserAsset(
+            user_id=user_id,
+            year=year,
+            month=month,
+            TIncome=TotalIncome,
+            TExpense=TotalExpense,
+            TSavings=TotalSavings,
+            net_worth=TotalSavings  # Adjust net worth based on savings
+        )
+
+        crud.create_user_asset(asset)
+
+    if new_months:
+        if since is not None:
+            since = min(since, min(new_months))
+        assets = crud.get_all_user_assets(user_id) if since is None else crud.get_user_assets_since(user_id, *since)
+
     assets_sorted = sorted(assets, key=lambda a: (a.year, a.month))
 
     for i, asset in enumerate(assets_sorted):
+        if since is not None and (asset.year, asset.month) < since:
+            continue
         # Reset totals for the current asset
         TotalIncome = 0
         TotalExpense = 0
@@ -553,11 +889,8 @@ def organize_assets(user_id: int, transactions: list[models.TransactionCreate]):
         if i > 0:
             OverFlow = assets_sorted[i - 1].TSavings
 
-        # Filter transactions for the current asset's month and year
-        monTransactions = [t for t in transactions if t.date.month == asset.month and t.date.year == asset.year]
-
         # Calculate totals even if there are no transactions (important for deletes)
-        for transaction in monTransactions:
+        for transaction in txns_by_month.get((asset.year, asset.month), []):
             if transaction.type == "income":
                 TotalIncome += transaction.amount
             elif transaction.type == "expense":
@@ -574,103 +907,91 @@ def organize_assets(user_id: int, transactions: list[models.TransactionCreate]):
         # Commit the changes to the database
         crud.update_user_asset(asset)
 
-    # Create new assets for transactions that lie outside the current asset's month
-
-    # Build a set of (year, month) tuples from assets
-    asset_months = {(a.year, a.month) for a in assets}
-
-    # Filter transactions whose (year, month) is not in assets
-    excess = [t for t in transactions if (t.date.year, t.date.month) not in asset_months]
-
-    # Organize excess by (year, month)
-    excess_by_month = defaultdict(list)
-    for t in excess:
-        excess_by_month[(t.date.year, t.date.month)].append(t)
-
-    # Now you can easily iterate:
-    for (year, month), txns in excess_by_month.items():
-        TotalIncome = sum(t.amount for t in txns if t.type == "income")
-        TotalExpense = sum(t.amount for t in txns if t.type == "expense")
-        TotalSavings = TotalIncome - TotalExpense
-
-        asset = models.UserAsset(
-            user_id=user_id,
-            year=year,
-            month=month,
-            TIncome=TotalIncome,
-            TExpense=TotalExpense,
-            TSavings=TotalSavings,
-            net_worth=TotalSavings  # Adjust net worth based on savings
-        )
+@unit_of_work.transactional
+def recompute_user(user_id: int, since: tuple[int, int]):
+    """Rebuilds the user's monthly aggregates from `since` onwards and refreshes
+    net worth. Runs on the recompute worker thread, off the request path.
+    Closed months are neither loaded nor rewritten; afterwards every month past
+    the close horizon is frozen."""
+    first_open = crud.get_first_open_month(user_id)
+    if first_open is not None:
+        since = max(since, first_open)
+    CURR_DATE = datetime.now()
+    user_transactions = crud.get_transactions_since(user_id, *min(since, (CURR_DATE.year, CURR_DATE.month)))
+    month_update(user_id, user_transactions)
+    organize_assets(user_id, user_transactions, since=since)
+    update_networth(user_id)
+    crud.refresh_net_worth_history(user_id, date(*since, 1).isoformat())
+    horizon = recompute_worker.close_horizon()
+    if horizon is not None:
+        crud.close_periods(user_id, horizon)
 
-        crud.create_user_asset(asset)
+recompute_worker.register(recompute_user)
 
 # --- Debt Endpoints ---
 
 @app.get("/debts/{user_id}", response_model=List[models.Debt])
-def get_debts(user_id: int, type: Optional[str] = None):
+def get_debts(user_id: int, type: Optional[str] = None, fields: Optional[str] = None):
+    wanted = fast_json.parse_fields(fields, models.Debt)
     if type:
-        return crud.get_debts_by_type(user_id, type)
-    return crud.get_debts(user_id)
+        return fast_json.trusted(fast_json.project(crud.get_debts_by_type(user_id, type), wanted))
+    return fast_json.trusted(fast_json.project(crud.get_debts(user_id), wanted))
 
 @app.post("/debts/{user_id}", response_model=models.Debt)
 def create_debt(user_id: int, debt: models.DebtCreate):
     if debt.user_id != user_id:
         raise HTTPException(status_code=400, detail="User ID mismatch")
-    created = crud.create_debt(debt)
-    
-    # Auto-create recurring transaction for monthly payment
+    with unit_of_work.begin():
+        created = crud.create_debt(debt)
+
+        # Auto-create recurring transaction for monthly payment
+        if debt.monthly_payment > 0:
+            # Avoid circular validation errors by parsing strings/dates safely
+            start_dt = debt.start_date if debt.start_date else datetime.now().date()
+            rt = models.RecurringTransactionCreate(
+                user_id=user_id,
+                recipient=debt.name,
+                amount=debt.monthly_payment,
+                category=models.TransactionCategory.Bills,
+                type=models.TransactionType.expense,
+                interval=models.RecurringInterval.monthly,
+                start_date=start_dt
+            )
+            crud.create_recurring_transaction(rt)
+
+
     if debt.monthly_payment > 0:
-        # Avoid circular validation errors by parsing strings/dates safely
-        start_dt = debt.start_date if debt.start_date else datetime.now().date()
-        rt = models.RecurringTransactionCreate(
-            user_id=user_id,
-            recipient=debt.name,
-            amount=debt.monthly_payment,
-            category=models.TransactionCategory.Bills,
-            type=models.TransactionType.expense,
-            interval=models.RecurringInterval.monthly,
-            start_date=start_dt
-        )
-        crud.create_recurring_transaction(rt)
         sse_bus.emit_event("recurring_changed", user_id)
-
-    # New debt immediately reduces net worth
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
     sse_bus.emit_event("debts_changed", user_id)
     return created
 
 @app.put("/debts/{debt_id}", response_model=models.Debt)
 def update_debt(debt_id: int, debt: models.DebtCreate):
-    existing = crud.get_debt(debt_id)
-    if not existing:
-        raise HTTPException(status_code=404, detail="Debt not found")
-    updated = crud.update_debt(debt_id, debt)
-    all_transactions = crud.get_all_transactions()
-    update_networth(existing.user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_debt(debt_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Debt not found")
+        updated = crud.update_debt(debt_id, debt)
     sse_bus.emit_event("debts_changed", existing.user_id)
     return updated
 
 @app.patch("/debts/{debt_id}/balance")
 def patch_debt_balance(debt_id: int, body: models.BalanceUpdate):
-    existing = crud.get_debt(debt_id)
-    if not existing:
-        raise HTTPException(status_code=404, detail="Debt not found")
-    crud.update_debt_balance(debt_id, body.balance)
-    all_transactions = crud.get_all_transactions()
-    update_networth(existing.user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_debt(debt_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Debt not found")
+        crud.update_debt_balance(debt_id, body.balance)
     sse_bus.emit_event("debts_changed", existing.user_id)
     return {"detail": "Balance updated"}
 
 @app.delete("/debts/{debt_id}")
 def delete_debt(debt_id: int):
-    existing = crud.get_debt(debt_id)
-    if not existing:
-        raise HTTPException(status_code=404, detail="Debt not found")
-    crud.delete_debt(debt_id)
-    all_transactions = crud.get_all_transactions()
-    update_networth(existing.user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_debt(debt_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Debt not found")
+        crud.delete_debt(debt_id)
     sse_bus.emit_event("debts_changed", existing.user_id)
     return {"detail": "Debt deleted"}
 
@@ -678,14 +999,16 @@ def delete_debt(debt_id: int):
 
 
 @app.get("/notifications/{user_id}", response_model=List[models.Notification])
-def get_notifications(user_id: int):
-    return crud.get_user_notifications(user_id)
+def get_notifications(user_id: int, fields: Optional[str] = None):
+    wanted = fast_json.parse_fields(fields, models.Notification)
+    return fast_json.trusted(fast_json.project(crud.get_user_notifications(user_id), wanted))
 
 @app.put("/notifications/{notification_id}/read")
 def read_notification(notification_id: int):
-    notif = crud.get_notification(notification_id)
-    user_id = notif.user_id if notif else 1
-    crud.mark_notification_read(notification_id)
+    with unit_of_work.begin(immediate=True):
+        notif = crud.get_notification(notification_id)
+        user_id = notif.user_id if notif else 1
+        crud.mark_notification_read(notification_id)
     sse_bus.emit_event("notifications_changed", user_id)
     return {"detail": "Notification marked read"}
 
@@ -697,31 +1020,69 @@ def read_all_notifications(user_id: int):
 
 @app.delete("/notifications/{notification_id}")
 def delete_notification(notification_id: int):
-    notif = crud.get_notification(notification_id)
-    user_id = notif.user_id if notif else 1
-    crud.delete_notification(notification_id)
+    with unit_of_work.begin(immediate=True):
+        notif = crud.get_notification(notification_id)
+        user_id = notif.user_id if notif else 1
+        crud.delete_notification(notification_id)
     sse_bus.emit_event("notifications_changed", user_id)
     return {"detail": "Notification deleted"}
 
 # --- MCP Server Integration ---
-from mcp.server.fastmcp import FastMCP
-
-mcp_server = FastMCP("sAIve")
-
-@mcp_server.tool()
+# Tools are collected here and only registered on a FastMCP instance the first
+# time /mcp is hit, so importing the mcp SDK stays off the startup path.
+_mcp_tools: list = []
+_mcp_server = None
+_mcp_lock = threading.Lock()
+
+def mcp_tool(fn=None, *, structured_output: Optional[bool] = None):
+    """Register `fn` as an MCP tool once the server is built. Tools that may
+    return compact_output text pass structured_output=False, so FastMCP does
+    not repeat the result as structured content."""
+    def register(fn):
+        _mcp_tools.append((fn, structured_output))
+        return fn
+    return register(fn) if fn is not None else register
+
+def get_mcp_server():
+    """Builds the FastMCP server and its tools on first use."""
+    global _mcp_server
+    with _mcp_lock:
+        if _mcp_server is None:
+            from mcp.server.fastmcp import FastMCP
+            server = FastMCP("sAIve")
+            for fn, structured_output in _mcp_tools:
+                server.tool(structured_output=structured_output)(fn)
+            _mcp_server = server
+    return _mcp_server
+
+class LazyMCPApp:
+    """ASGI app mounted at /mcp that builds the MCP SSE app on the first request."""
+    def __init__(self):
+        self._app = None
+
+    async def __call__(self, scope, receive, send):
+        if self._app is None:
+            self._app = get_mcp_server().sse_app()
+        await self._app(scope, receive, send)
+
+@mcp_tool
 def get_net_worth(user_id: int) -> float:
     """Get the current net worth of a user."""
+    recompute_worker.wait_until_clean(user_id)
     user = crud.get_user(user_id)
     if not user:
         return 0.0
     return user.net_worth
 
-@mcp_server.tool()
-def log_transaction(user_id: int, amount: float, tx_type: str, category: str, recipient: str, date: Optional[str] = None) -> str:
+@mcp_tool
+def log_transaction(user_id: int, amount: float, tx_type: str, category: str, recipient: str, date: Optional[str] = None,
+                    on_duplicate: str = "skip") -> str:
     """Log a new financial transaction for the user, updating their net worth. 
     tx_type must be 'income' or 'expense'.
     category must be one of: 'Housing', 'Food', 'Transportation', 'Subscriptions', 'Bills', 'Income', 'Other'.
     date should be in 'YYYY-MM-DD' format. If not provided, defaults to today.
+    on_duplicate: if the same amount to the same recipient on the same day is already logged,
+    'skip' (default, safe to retry) it, 'flag' it, 'merge' it, or 'allow' it for a genuine repeat purchase.
     """
     if date:
         try:
@@ -742,66 +1103,114 @@ def log_transaction(user_id: int, amount: float, tx_type: str, category: str, re
             date=tx_date,
             recipient=sanitize(recipient)
         )
+        policy = models.DuplicatePolicy(on_duplicate)
     except Exception as e:
         return f"Error: Invalid input — {e}"
-    crud.create_transaction(tx)
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
-    month_update(user_id, all_transactions)
-    organize_assets(user_id, all_transactions)
+    with unit_of_work.begin(immediate=True):
+        outcome, duplicate_of = crud.create_transactions([tx], policy)[0]
+        if outcome == "skipped":
+            return (f"Not logged: an identical {tx_type} of {amount} to {recipient} on {tx_date} already exists "
+                    f"(transaction {duplicate_of}). Use on_duplicate='allow' if this is a separate purchase.")
+        recompute_worker.mark_dirty(user_id, [(tx.date.year, tx.date.month)])
     sse_bus.emit_event("transactions_changed", user_id)
-    return f"Successfully logged {tx_type} of {amount} to {recipient} on {tx_date}."
+    if outcome == "merged":
+        return f"Updated the existing {tx_type} of {amount} to {recipient} on {tx_date} (transaction {duplicate_of})."
+    result = f"Successfully logged {tx_type} of {amount} to {recipient} on {tx_date}."
+    if outcome == "flagged":
+        result += f" It looks like a duplicate of transaction {duplicate_of}."
+    return result
 
-@mcp_server.tool()
-def batch_log_transactions(user_id: int, transactions: list[dict]) -> str:
+@mcp_tool
+def batch_log_transactions(user_id: int, transactions: list[dict], on_duplicate: str = "skip") -> str:
     """
     Log multiple transactions rapidly.
     'transactions' should be a list of dicts, each containing:
     - amount: float
     - tx_type: str ('income' or 'expense')
-    - category: str (must be 'Housing', 'Food', 'Transportation', 'Subscriptions', 'Bills', 'Income', or 'Other')
+    - category: str (optional: 'Housing', 'Food', 'Transportation', 'Subscriptions', 'Bills', 'Income', or 'Other';
+      leave it out or pass 'auto' to apply the user's categorisation rules)
     - recipient: str
     - date: str (optional, 'YYYY-MM-DD')
+    on_duplicate: rows already logged earlier (same day, amount, recipient and type) are
+    'skip'ped by default, so a retried or re-imported batch is safe; or 'flag', 'merge', 'allow'.
+    Identical rows within one batch are kept.
     """
-    success_count = 0
+    try:
+        policy = models.DuplicatePolicy(on_duplicate)
+    except ValueError as e:
+        return f"Error: Invalid input — {e}"
     errors = []
-    
-    for i, t in enumerate(transactions):
-        try:
-            date_str = t.get('date')
-            if date_str:
-                datetime.strptime(date_str, "%Y-%m-%d")
-            else:
-                date_str = datetime.now().strftime("%Y-%m-%d")
-
-            tx = models.TransactionCreate(
-                user_id=user_id,
-                amount=float(t['amount']),
-                type=t['tx_type'],
-                category=t['category'],
-                date=date_str,
-                recipient=sanitize(t['recipient'])
-            )
-            crud.create_transaction(tx)
-            success_count += 1
-        except Exception as e:
-            errors.append(f"Row {i} failed: {str(e)}")
-            
-    # Calculate globally once at the end of the batch
-    if success_count > 0:
-        all_transactions = crud.get_all_transactions()
-        update_networth(user_id, transactions=all_transactions)
-        month_update(user_id, all_transactions)
-        organize_assets(user_id, all_transactions)
+    valid = []
+    touched_months = set()
+    rules = None
+    rule_hits = defaultdict(int)
+    outcomes = defaultdict(int)
+    flagged = []
+
+    # One transaction and one commit for the whole batch
+    with unit_of_work.begin(immediate=True):
+        for i, t in enumerate(transactions):
+            try:
+                date_str = t.get('date')
+                if date_str:
+                    datetime.strptime(date_str, "%Y-%m-%d")
+                else:
+                    date_str = datetime.now().strftime("%Y-%m-%d")
+
+                category = t.get('category') or 'auto'
+                rule = None
+                if category == 'auto':
+                    rules = rules or rules_engine.compiled(user_id)
+                    rule = rules.match(str(t['recipient']), float(t['amount']), t['tx_type'])
+                    if rule is None:
+                        raise ValueError("no category given and no categorisation rule matched")
+                    category = rule.category
+
+                tx = models.TransactionCreate(
+                    user_id=user_id,
+                    amount=float(t['amount']),
+                    type=t['tx_type'],
+                    category=category,
+                    date=date_str,
+                    recipient=sanitize(t['recipient'])
+                )
+                valid.append((i, tx, rule))
+            except Exception as e:
+                errors.append(f"Row {i} failed: {str(e)}")
+
+        # One indexed duplicate probe per row, then the inserts
+        results = crud.create_transactions([tx for _, tx, _ in valid], policy)
+        for (i, tx, rule), (outcome, duplicate_of) in zip(valid, results):
+            outcomes[outcome] += 1
+            if outcome == "skipped":
+                continue
+            touched_months.add((tx.date.year, tx.date.month))
+            if rule is not None:
+                rule_hits[rule.id] += 1
+            if outcome == "flagged":
+                flagged.append(f"row {i} matches transaction {duplicate_of}")
+
+        crud.record_rule_hits(rule_hits)
+        # Queue one recompute for the whole batch; skipped duplicates cost nothing
+        if touched_months:
+            recompute_worker.mark_dirty(user_id, touched_months)
+
+    if touched_months:
         sse_bus.emit_event("transactions_changed", user_id)
         
-    result = f"Successfully logged {success_count} transactions."
+    result = f"Successfully logged {outcomes['inserted'] + outcomes['flagged']} transactions."
+    if outcomes["skipped"]:
+        result += f" Skipped {outcomes['skipped']} already logged."
+    if outcomes["merged"]:
+        result += f" Merged {outcomes['merged']} into existing transactions."
+    if flagged:
+        result += " Possible duplicates: " + "; ".join(flagged) + "."
     if errors:
         result += f" Encountered {len(errors)} errors: " + " | ".join(errors)
         
     return result
 
-@mcp_server.tool()
+@mcp_tool
 def get_expense_categories(user_id: int, year: int, month: int) -> dict:
     """Returns a breakdown of expense categories for a specific month and year."""
     txns = crud.get_transactions_by_month(user_id, year, month)
@@ -811,7 +1220,7 @@ def get_expense_categories(user_id: int, year: int, month: int) -> dict:
             categories[t.category] += t.amount
     return dict(categories)
 
-@mcp_server.tool()
+@mcp_tool
 def update_budget(user_id: int, category: str, amount: float) -> str:
     """Update or set the budget limit for a specific category.
     category must be one of: 'Housing', 'Food', 'Transportation', 'Subscriptions', 'Bills', 'Income', 'Other'.
@@ -821,24 +1230,39 @@ def update_budget(user_id: int, category: str, amount: float) -> str:
         category=category,
         amount=amount
     )
-    crud.set_budget(bg)
+    with unit_of_work.begin(immediate=True):
+        crud.set_budget(bg)
     sse_bus.emit_event("budgets_changed", user_id)
     return f"Successfully updated budget for {category} to {amount}."
 
-@mcp_server.tool()
+@mcp_tool
 def get_user_info(user_id: int) -> dict:
     """Get the name and net worth of a user."""
+    recompute_worker.wait_until_clean(user_id)
     user = crud.get_user(user_id)
     if not user:
         return {"error": f"User {user_id} not found."}
     return {"id": user.id, "name": user.name, "net_worth": user.net_worth}
 
-@mcp_server.tool()
-def get_transactions(user_id: int, year: int, month: int) -> list:
+@mcp_tool(structured_output=False)
+def get_transactions(user_id: int, year: int, month: int, compact: Optional[bool] = None,
+                     top: Optional[int] = None) -> list | str:
     """Get all transactions for a user in a specific month and year.
     Returns a list of transaction dicts with id, date, amount, type, category, and recipient.
+    compact=true returns one table instead: "columns" names the fields of each
+    entry in "rows", "day" is the day of the month and "category" an index into
+    codes.category. top=N lists only the N largest; "others" totals the rest.
     """
     txns = crud.get_transactions_by_month(user_id, year, month)
+    if compact_output.enabled(compact):
+        rows = [
+            {"id": t.id, "day": t.date.day, "amount": t.amount, "type": t.type,
+             "category": t.category, "recipient": t.recipient}
+            for t in txns
+        ]
+        return compact_output.encode({"year": year, "month": month, **compact_output.table(
+            rows, ["id", "day", "amount", "type", "category", "recipient"], codes=("category",),
+            top=top, rank=lambda r: r["amount"], summarize=compact_output.flow_totals)})
     return [
         {
             "id": t.id,
@@ -851,26 +1275,109 @@ def get_transactions(user_id: int, year: int, month: int) -> list:
         for t in txns
     ]
 
-@mcp_server.tool()
+@mcp_tool
+def search_transactions_text(user_id: int, query: str, limit: int = 20) -> dict:
+    """Find a user's transactions by recipient or category text, e.g. "netflix",
+    "uber eats" or "groceries". Each word matches the start of a word, best
+    matches first, then newest. Returns the total number of matches and up to
+    `limit` (max 50) transactions with id, date, amount, type, category and recipient.
+    """
+    total, txns = crud.search_transactions(user_id, query, max(1, min(limit, 50)))
+    return {
+        "total": total,
+        "transactions": [
+            {
+                "id": t.id,
+                "date": str(t.date),
+                "amount": t.amount,
+                "type": t.type,
+                "category": t.category,
+                "recipient": t.recipient,
+            }
+            for t in txns
+        ],
+    }
+
+@mcp_tool
+def search_transactions_semantic(user_id: int, query: str, k: int = 10,
+                                 start: Optional[str] = None, end: Optional[str] = None) -> dict:
+    """Answer questions about spending from only the relevant transactions,
+    e.g. "how much did I spend on coffee", "groceries", "rent", "uber rides over 30".
+    Pass start/end ('YYYY-MM-DD') to limit the period, e.g. this month.
+    Returns the matching recipients with their count and expense/income totals
+    (use these totals for "how much" questions), overall count/expense/income,
+    and the k (max 50) most relevant transactions.
+    """
+    if not vector_index.available():
+        return {"error": "Semantic search needs NumPy, which is not installed. Use search_transactions_text instead."}
+    for value in (start, end):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                return {"error": "start and end must be in YYYY-MM-DD format."}
+    return vector_index.search(user_id, query, max(1, min(k, 50)), start, end)
+
+@mcp_tool
+def suggest_recipient_category(user_id: int, recipient: str) -> dict:
+    """Look up a recipient (or the start of one) the user has logged before and
+    return its usual category and typical amount. Use it before logging a
+    transaction to pick the category. When "known" is true the category is
+    reliable; otherwise decide yourself. Returns up to 5 matches, most used first.
+    """
+    return {"matches": recipient_index.suggest(user_id, recipient, 5)}
+
+@mcp_tool
+def get_range_summary(user_id: int, start_date: str, end_date: str) -> dict:
+    """Get total income, expense and net for a user between two dates (inclusive),
+    overall and per category. Use it for questions like "this quarter",
+    "year to date", "last 90 days" or "between March and June".
+    Dates must be in 'YYYY-MM-DD' format.
+    """
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except ValueError:
+        return {"error": "Dates must be in YYYY-MM-DD format."}
+    if end < start:
+        return {"error": "end_date must not be before start_date."}
+    return range_index.range_summary(user_id, start, end)
+
+@mcp_tool
+def get_net_worth_on_date(user_id: int, date: str) -> dict:
+    """Get a user's net worth as of the end of a past day (ledger balance plus
+    tracked assets minus debts, from the daily net-worth history).
+    date must be in 'YYYY-MM-DD' format.
+    """
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        return {"error": "date must be in YYYY-MM-DD format."}
+    recompute_worker.wait_until_clean(user_id)
+    snapshots = crud.get_net_worth_snapshots(user_id, day.isoformat(), day.isoformat())
+    if not snapshots:
+        return {"error": f"No net worth history for user {user_id} on or before {date}."}
+    return {"user_id": user_id, "date": day.isoformat(), "net_worth": round(snapshots[-1][1], 2)}
+
+@mcp_tool
 def delete_transaction(transaction_id: int, user_id: int) -> str:
     """Delete a transaction by its ID and recalculate the user's financial state.
     Returns a confirmation message or an error string.
     """
-    transaction = crud.get_transaction(transaction_id)
-    if not transaction:
-        return f"Error: Transaction {transaction_id} not found."
-    if transaction.user_id != user_id:
-        return f"Error: Transaction {transaction_id} does not belong to user {user_id}."
-    crud.delete_transaction(transaction_id)
-    all_transactions = crud.get_all_transactions()
-    user_transactions = [t for t in all_transactions if t.user_id == user_id]
-    update_networth(user_id, transactions=user_transactions)
-    month_update(user_id, user_transactions)
-    organize_assets(user_id, user_transactions)
+    with unit_of_work.begin(immediate=True):
+        transaction = crud.get_transaction(transaction_id)
+        if not transaction:
+            return f"Error: Transaction {transaction_id} not found."
+        if transaction.user_id != user_id:
+            return f"Error: Transaction {transaction_id} does not belong to user {user_id}."
+        _, debt_balance = crud.delete_transaction_reversing_debt(transaction_id)
+        recompute_worker.mark_dirty(user_id, [(transaction.date.year, transaction.date.month)])
+    if debt_balance is not None:
+        sse_bus.emit_event("debts_changed", user_id)
     sse_bus.emit_event("transactions_changed", user_id)
     return f"Successfully deleted transaction {transaction_id}."
 
-@mcp_server.tool()
+@mcp_tool
 def get_budgets(user_id: int) -> list:
     """Get all budget limits set for a user.
     Returns a list of dicts with category and amount.
@@ -878,12 +1385,13 @@ def get_budgets(user_id: int) -> list:
     budgets = crud.get_budgets(user_id)
     return [{"id": b.id, "category": b.category, "amount": b.amount} for b in budgets]
 
-@mcp_server.tool()
+@mcp_tool
 def get_monthly_summary(user_id: int, year: int, month: int) -> dict:
     """Get the monthly financial summary (income, expenses, savings, net worth) for a user.
     Returns a dict with keys: income, expense, savings, net_worth.
     Returns an empty dict if no data exists for that month.
     """
+    recompute_worker.wait_until_clean(user_id)
     asset = crud.get_user_asset(user_id, year, month)
     if not asset:
         return {}
@@ -896,12 +1404,14 @@ def get_monthly_summary(user_id: int, year: int, month: int) -> dict:
         "net_worth": asset.net_worth,
     }
 
-@mcp_server.tool()
-def get_financial_history(user_id: int) -> list:
+@mcp_tool(structured_output=False)
+def get_financial_history(user_id: int, compact: Optional[bool] = None) -> list | str:
     """Get the financial history for a user over the last 12 months.
     Returns a list of monthly summaries sorted oldest to newest, each with:
     month, year, income, expense, savings, net_worth, savings_rate (%).
+    compact=true returns one table: "columns" names the fields of each entry in "rows".
     """
+    recompute_worker.wait_until_clean(user_id)
     assets = crud.get_all_user_assets(user_id)
     if not assets:
         return []
@@ -920,14 +1430,32 @@ def get_financial_history(user_id: int) -> list:
             "net_worth": a.net_worth,
             "savings_rate": round(savings_rate, 1),
         })
+    if compact_output.enabled(compact):
+        return compact_output.encode(compact_output.table(
+            result, ["month", "year", "income", "expense", "savings", "net_worth", "savings_rate"]))
     return result
 
-@mcp_server.tool()
-def get_recurring_transactions(user_id: int) -> list:
+@mcp_tool(structured_output=False)
+def get_recurring_transactions(user_id: int, compact: Optional[bool] = None,
+                               top: Optional[int] = None) -> list | str:
     """Get all recurring transactions (subscriptions, bills, etc.) for a user.
     Returns a list of dicts with id, recipient, amount, type, category, interval, start_date, next_date.
+    compact=true returns one table instead: "columns" names the fields of each
+    entry in "rows"; category and interval are indexes into "codes".
+    top=N lists only the N largest; "others" totals the rest.
     """
     rts = crud.get_all_recurring_transactions(user_id)
+    if compact_output.enabled(compact):
+        rows = [
+            {"id": rt.id, "recipient": rt.recipient, "amount": rt.amount, "type": rt.type,
+             "category": rt.category, "interval": rt.interval,
+             "start_date": str(rt.start_date), "next_date": str(rt.next_date)}
+            for rt in rts
+        ]
+        return compact_output.encode(compact_output.table(
+            rows, ["id", "recipient", "amount", "type", "category", "interval", "start_date", "next_date"],
+            codes=("category", "interval"), top=top, rank=lambda r: r["amount"],
+            summarize=compact_output.flow_totals))
     return [
         {
             "id": rt.id,
@@ -942,7 +1470,7 @@ def get_recurring_transactions(user_id: int) -> list:
         for rt in rts
     ]
 
-@mcp_server.tool()
+@mcp_tool
 def create_recurring_transaction(user_id: int, amount: float, tx_type: str, category: str, recipient: str, interval: str, start_date: str) -> str:
     """Create a new recurring transaction (e.g. a subscription or regular bill).
     tx_type must be 'income' or 'expense'.
@@ -966,11 +1494,12 @@ def create_recurring_transaction(user_id: int, amount: float, tx_type: str, cate
         )
     except Exception as e:
         return f"Error: Invalid input — {e}"
-    crud.create_recurring_transaction(rt)
+    with unit_of_work.begin(immediate=True):
+        crud.create_recurring_transaction(rt)
     sse_bus.emit_event("recurring_changed", user_id)
     return f"Successfully created recurring {tx_type} of {amount} to {recipient} every {interval} starting {start_date}."
 
-@mcp_server.tool()
+@mcp_tool
 def update_recurring_transaction(rt_id: int, user_id: int, amount: float, tx_type: str, category: str, recipient: str, interval: str, start_date: str) -> str:
     """Update an existing recurring transaction (e.g. change subscription amount or frequency).
     tx_type must be 'income' or 'expense'.
@@ -978,11 +1507,6 @@ def update_recurring_transaction(rt_id: int, user_id: int, amount: float, tx_typ
     interval must be one of: 'daily', 'weekly', 'monthly', 'yearly'.
     start_date should be in 'YYYY-MM-DD' format.
     """
-    existing = crud.get_recurring_transaction(rt_id)
-    if not existing:
-        return f"Error: Recurring transaction {rt_id} not found."
-    if existing.user_id != user_id:
-        return f"Error: Recurring transaction {rt_id} does not belong to user {user_id}."
     try:
         datetime.strptime(start_date, "%Y-%m-%d")
     except ValueError:
@@ -999,23 +1523,30 @@ def update_recurring_transaction(rt_id: int, user_id: int, amount: float, tx_typ
         )
     except Exception as e:
         return f"Error: Invalid input — {e}"
-    crud.update_recurring_transaction(rt_id, rt)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_recurring_transaction(rt_id)
+        if not existing:
+            return f"Error: Recurring transaction {rt_id} not found."
+        if existing.user_id != user_id:
+            return f"Error: Recurring transaction {rt_id} does not belong to user {user_id}."
+        crud.update_recurring_transaction(rt_id, rt)
     sse_bus.emit_event("recurring_changed", user_id)
     return f"Successfully updated recurring transaction {rt_id}."
 
-@mcp_server.tool()
+@mcp_tool
 def delete_recurring_transaction(rt_id: int, user_id: int) -> str:
     """Delete a recurring transaction (cancel a subscription or bill) by its ID."""
-    existing = crud.get_recurring_transaction(rt_id)
-    if not existing:
-        return f"Error: Recurring transaction {rt_id} not found."
-    if existing.user_id != user_id:
-        return f"Error: Recurring transaction {rt_id} does not belong to user {user_id}."
-    crud.delete_recurring_transaction(rt_id)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_recurring_transaction(rt_id)
+        if not existing:
+            return f"Error: Recurring transaction {rt_id} not found."
+        if existing.user_id != user_id:
+            return f"Error: Recurring transaction {rt_id} does not belong to user {user_id}."
+        crud.delete_recurring_transaction(rt_id)
     sse_bus.emit_event("recurring_changed", user_id)
     return f"Successfully deleted recurring transaction {rt_id}."
 
-@mcp_server.tool()
+@mcp_tool
 def get_notifications(user_id: int) -> list:
     """Get the latest notifications for a user (up to 50, newest first).
     Returns a list of dicts with id, title, message, date, is_read, and type.
@@ -1035,30 +1566,29 @@ def get_notifications(user_id: int) -> list:
 
 @app.post("/tracked_assets/", response_model=models.TrackedAsset)
 def create_tracked_asset(asset: models.TrackedAssetCreate):
-    created = crud.create_tracked_asset(asset)
-    
-    # Recalculate net worth immediately incorporating the new equity
-    all_transactions = crud.get_all_transactions()
-    update_networth(asset.user_id, transactions=all_transactions)
+    with unit_of_work.begin():
+        created = crud.create_tracked_asset(asset)
+
     sse_bus.emit_event("tracked_assets_changed", asset.user_id)
     sse_bus.emit_event("transactions_changed", asset.user_id) # Triggers front-end net-worth card refetch
     
     return created
 
 @app.get("/tracked_assets/{user_id}", response_model=List[models.TrackedAsset])
-def get_tracked_assets(user_id: int):
+def get_tracked_assets(user_id: int, fields: Optional[str] = None):
+    wanted = fast_json.parse_fields(fields, models.TrackedAsset)
+    if wanted:
+        return fast_json.trusted(fast_json.project(crud.get_tracked_assets(user_id), wanted))
     return crud.get_tracked_assets(user_id)
 
 @app.put("/tracked_assets/{asset_id}", response_model=models.TrackedAsset)
 def update_tracked_asset(asset_id: int, asset: models.TrackedAssetCreate):
-    existing = crud.get_tracked_asset(asset_id)
-    if not existing:
-        raise HTTPException(status_code=404, detail="Asset not found")
-    
-    updated = crud.update_tracked_asset(asset_id, asset)
-    
-    all_transactions = crud.get_all_transactions()
-    update_networth(asset.user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_tracked_asset(asset_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Asset not found")
+
+        updated = crud.update_tracked_asset(asset_id, asset)
     sse_bus.emit_event("tracked_assets_changed", asset.user_id)
     sse_bus.emit_event("transactions_changed", asset.user_id)
     
@@ -1066,15 +1596,13 @@ def update_tracked_asset(asset_id: int, asset: models.TrackedAssetCreate):
 
 @app.delete("/tracked_assets/{asset_id}")
 def delete_tracked_asset(asset_id: int):
-    existing = crud.get_tracked_asset(asset_id)
-    if not existing:
-        raise HTTPException(status_code=404, detail="Asset not found")
-        
-    user_id = existing.user_id
-    crud.delete_tracked_asset(asset_id)
-    
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing = crud.get_tracked_asset(asset_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Asset not found")
+
+        user_id = existing.user_id
+        crud.delete_tracked_asset(asset_id)
     sse_bus.emit_event("tracked_assets_changed", user_id)
     sse_bus.emit_event("transactions_changed", user_id)
     
@@ -1082,18 +1610,22 @@ def delete_tracked_asset(asset_id: int):
 
 # --- FastAPI MCP Tools ---
 
-@mcp_server.tool()
-def get_debts(user_id: int, debt_type: Optional[str] = None) -> list:
+@mcp_tool(structured_output=False)
+def get_debts(user_id: int, debt_type: Optional[str] = None, compact: Optional[bool] = None,
+              top: Optional[int] = None) -> list | str:
     """Get all debts for a user.
     Optionally filter by debt_type (e.g. 'auto', 'credit_card', 'student', 'mortgage', 'personal').
     Returns a list of dicts representing the debts.
+    compact=true returns one table instead: "columns" names the fields of each
+    entry in "rows"; type is an index into codes.type.
+    top=N lists only the N largest balances; "others" totals the rest.
     """
     if debt_type:
         debts = crud.get_debts_by_type(user_id, debt_type)
     else:
         debts = crud.get_debts(user_id)
         
-    return [
+    result = [
         {
             "id": d.id,
             "name": d.name,
@@ -1106,8 +1638,14 @@ def get_debts(user_id: int, debt_type: Optional[str] = None) -> list:
         }
         for d in debts
     ]
+    if compact_output.enabled(compact):
+        return compact_output.encode(compact_output.table(
+            result, ["id", "name", "type", "balance", "total_amount", "interest_rate", "monthly_payment", "start_date"],
+            codes=("type",), top=top, rank=lambda r: r["balance"],
+            summarize=compact_output.column_totals("balance", "monthly_payment")))
+    return result
 
-@mcp_server.tool()
+@mcp_tool
 def get_credit_cards(user_id: int) -> list:
     """Convenience tool to get all credit card revolving debts for a user.
     Returns a list of dicts representing the user's credit card debts.
@@ -1126,7 +1664,7 @@ def get_credit_cards(user_id: int) -> list:
         for d in debts
     ]
 
-@mcp_server.tool()
+@mcp_tool
 def create_debt(
     user_id: int, 
     name: str, 
@@ -1161,32 +1699,32 @@ def create_debt(
     except Exception as e:
         return f"Error: Invalid input — {e}"
         
-    crud.create_debt(debt_data)
-    
-    # Auto-create recurring transaction for monthly payment
+    with unit_of_work.begin(immediate=True):
+        crud.create_debt(debt_data)
+
+        # Auto-create recurring transaction for monthly payment
+        if monthly_payment > 0:
+            rt_start_date = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else datetime.now().date()
+            rt = models.RecurringTransactionCreate(
+                user_id=user_id,
+                recipient=sanitize(name),
+                amount=monthly_payment,
+                category=models.TransactionCategory.Bills,
+                type=models.TransactionType.expense,
+                interval=models.RecurringInterval.monthly,
+                start_date=rt_start_date
+            )
+            crud.create_recurring_transaction(rt)
+
+
     if monthly_payment > 0:
-        rt_start_date = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else datetime.now().date()
-        rt = models.RecurringTransactionCreate(
-            user_id=user_id,
-            recipient=sanitize(name),
-            amount=monthly_payment,
-            category=models.TransactionCategory.Bills,
-            type=models.TransactionType.expense,
-            interval=models.RecurringInterval.monthly,
-            start_date=rt_start_date
-        )
-        crud.create_recurring_transaction(rt)
         sse_bus.emit_event("recurring_changed", user_id)
-    
-    # Update net worth since debt reduces net worth
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
     sse_bus.emit_event("debts_changed", user_id)
     sse_bus.emit_event("transactions_changed", user_id) # Triggers front-end net-worth card refetch
     
     return f"Successfully created {debt_type} debt '{name}' with balance ${balance}."
 
-@mcp_server.tool()
+@mcp_tool
 def update_debt(
     debt_id: int,
     user_id: int, 
@@ -1202,12 +1740,6 @@ def update_debt(
     debt_type MUST be one of: 'auto', 'credit_card', 'student', 'mortgage', 'personal'.
     start_date must be 'YYYY-MM-DD' if provided.
     """
-    existing_debt = crud.get_debt(debt_id)
-    if not existing_debt:
-        return f"Error: Debt {debt_id} not found."
-    if existing_debt.user_id != user_id:
-        return f"Error: Debt {debt_id} does not belong to user {user_id}."
-        
     if start_date:
         try:
             datetime.strptime(start_date, "%Y-%m-%d")
@@ -1228,55 +1760,49 @@ def update_debt(
     except Exception as e:
         return f"Error: Invalid input — {e}"
         
-    crud.update_debt(debt_id, debt_data)
-    
-    # Recalculate net worth
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing_debt = crud.get_debt(debt_id)
+        if not existing_debt:
+            return f"Error: Debt {debt_id} not found."
+        if existing_debt.user_id != user_id:
+            return f"Error: Debt {debt_id} does not belong to user {user_id}."
+        crud.update_debt(debt_id, debt_data)
     sse_bus.emit_event("debts_changed", user_id)
     
     return f"Successfully updated debt {debt_id} ('{name}')."
 
-@mcp_server.tool()
+@mcp_tool
 def update_debt_balance(debt_id: int, user_id: int, balance: float) -> str:
     """Update only the current balance of an existing debt."""
-    existing_debt = crud.get_debt(debt_id)
-    if not existing_debt:
-        return f"Error: Debt {debt_id} not found."
-    if existing_debt.user_id != user_id:
-        return f"Error: Debt {debt_id} does not belong to user {user_id}."
-        
     if balance < 0:
         return "Error: Balance cannot be negative."
         
-    crud.update_debt_balance(debt_id, balance)
-    
-    # Recalculate net worth 
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing_debt = crud.get_debt(debt_id)
+        if not existing_debt:
+            return f"Error: Debt {debt_id} not found."
+        if existing_debt.user_id != user_id:
+            return f"Error: Debt {debt_id} does not belong to user {user_id}."
+        crud.update_debt_balance(debt_id, balance)
     sse_bus.emit_event("debts_changed", user_id)
     
     return f"Successfully updated balance for debt {debt_id} to ${balance}."
 
-@mcp_server.tool()
+@mcp_tool
 def delete_debt(debt_id: int, user_id: int) -> str:
     """Delete a debt by its ID."""
-    existing_debt = crud.get_debt(debt_id)
-    if not existing_debt:
-        return f"Error: Debt {debt_id} not found."
-    if existing_debt.user_id != user_id:
-        return f"Error: Debt {debt_id} does not belong to user {user_id}."
-        
-    crud.delete_debt(debt_id)
-    
-    # Recalculate net worth since debt is removed
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing_debt = crud.get_debt(debt_id)
+        if not existing_debt:
+            return f"Error: Debt {debt_id} not found."
+        if existing_debt.user_id != user_id:
+            return f"Error: Debt {debt_id} does not belong to user {user_id}."
+        crud.delete_debt(debt_id)
     sse_bus.emit_event("debts_changed", user_id)
     
     return f"Successfully deleted debt {debt_id}."
 
-@mcp_server.tool()
+@mcp_tool
 def get_tracked_assets(user_id: int) -> list:
     """Get all physical tracked assets/equity for a user.
     Returns a list of dicts representing the assets (real estate, vehicles, etc).
@@ -1292,7 +1818,7 @@ def get_tracked_assets(user_id: int) -> list:
         for a in assets
     ]
 
-@mcp_server.tool()
+@mcp_tool
 def add_tracked_asset(
     user_id: int, 
     name: str, 
@@ -1312,16 +1838,14 @@ def add_tracked_asset(
     except Exception as e:
         return f"Error: Invalid input — {e}"
         
-    crud.create_tracked_asset(asset_data)
-    
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        crud.create_tracked_asset(asset_data)
     sse_bus.emit_event("tracked_assets_changed", user_id)
     sse_bus.emit_event("transactions_changed", user_id) 
     
     return f"Successfully created {asset_type} asset '{name}' with estimated value ${value}."
 
-@mcp_server.tool()
+@mcp_tool
 def update_tracked_asset(
     asset_id: int,
     user_id: int, 
@@ -1330,12 +1854,6 @@ def update_tracked_asset(
     value: float
 ) -> str:
     """Update an existing tracked asset's details (e.g. updating the market value)."""
-    existing_asset = crud.get_tracked_asset(asset_id)
-    if not existing_asset:
-        return f"Error: Asset {asset_id} not found."
-    if existing_asset.user_id != user_id:
-        return f"Error: Asset {asset_id} does not belong to user {user_id}."
-            
     try:
         asset_data = models.TrackedAssetCreate(
             user_id=user_id,
@@ -1346,43 +1864,43 @@ def update_tracked_asset(
     except Exception as e:
         return f"Error: Invalid input — {e}"
         
-    crud.update_tracked_asset(asset_id, asset_data)
-    
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing_asset = crud.get_tracked_asset(asset_id)
+        if not existing_asset:
+            return f"Error: Asset {asset_id} not found."
+        if existing_asset.user_id != user_id:
+            return f"Error: Asset {asset_id} does not belong to user {user_id}."
+        crud.update_tracked_asset(asset_id, asset_data)
     sse_bus.emit_event("tracked_assets_changed", user_id)
     sse_bus.emit_event("transactions_changed", user_id)
     
     return f"Successfully updated asset {asset_id} market value."
 
-@mcp_server.tool()
+@mcp_tool
 def delete_tracked_asset(asset_id: int, user_id: int) -> str:
     """Delete a tracked asset by its ID."""
-    existing_asset = crud.get_tracked_asset(asset_id)
-    if not existing_asset:
-        return f"Error: Asset {asset_id} not found."
-    if existing_asset.user_id != user_id:
-        return f"Error: Asset {asset_id} does not belong to user {user_id}."
-        
-    crud.delete_tracked_asset(asset_id)
-    
-    all_transactions = crud.get_all_transactions()
-    update_networth(user_id, transactions=all_transactions)
+    with unit_of_work.begin(immediate=True):
+        existing_asset = crud.get_tracked_asset(asset_id)
+        if not existing_asset:
+            return f"Error: Asset {asset_id} not found."
+        if existing_asset.user_id != user_id:
+            return f"Error: Asset {asset_id} does not belong to user {user_id}."
+        crud.delete_tracked_asset(asset_id)
     sse_bus.emit_event("tracked_assets_changed", user_id)
     sse_bus.emit_event("transactions_changed", user_id)
     
     return f"Successfully deleted asset {asset_id}."
 
-# Mount the MCP server to the FastAPI app at /mcp
-app.mount("/mcp", mcp_server.sse_app())
+# Mount the MCP server to the FastAPI app at /mcp (built lazily on first request)
+app.mount("/mcp", LazyMCPApp())
 
 # --- Background Auto-Processor ---
 import asyncio
 from datetime import timedelta
-from dateutil.relativedelta import relativedelta
 
 async def process_recurring_transactions_loop():
     """Runs continuously in the background, checking for due recurring transactions."""
+    from dateutil.relativedelta import relativedelta  # deferred: not needed to serve the first request
     while True:
         try:
             current_date = datetime.now().date()
@@ -1392,7 +1910,7 @@ async def process_recurring_transactions_loop():
             
             recurring_txns = crud.get_all_recurring_transactions(user_id)
             
-            transactions_added = False
+            touched_months = set()
             for rt in recurring_txns:
                 # We need to process occurrences safely, even if multiple backends run.
                 # Instead of holding `next_date` in memory, we try to advance the DB
@@ -1415,48 +1933,47 @@ async def process_recurring_transactions_loop():
                     else:
                         advanced_date = db_next_date + relativedelta(months=1)  # Fallback
                         
-                    # 2. Try to claim this occurrence in the DB atomically
-                    rows_updated = crud.advance_recurring_transaction(
-                        rt.id, 
-                        db_next_date.strftime("%Y-%m-%d"), 
-                        advanced_date.strftime("%Y-%m-%d")
-                    )
-                    
-                    if rows_updated == 0:
-                        # Another backend already processed this date, skip further processing for this RT in this loop run
-                        break
-                        
-                    # 3. We successfully claimed it! Now insert the transaction
-                    new_tx = models.TransactionCreate(
-                        user_id=rt.user_id,
-                        recipient=rt.recipient,
-                        date=db_next_date,
-                        amount=rt.amount,
-                        category=rt.category,
-                        type=rt.type
-                    )
-                    crud.create_transaction(new_tx)
-
-                    # 4. Generate a notification for this occurrence
-                    new_notif = models.NotificationCreate(
-                        user_id=rt.user_id,
-                        title="Subscription Paid",
-                        message=f"{rt.recipient} (${rt.amount:.2f}) was automatically logged to your ledger.",
-                        date=datetime.now(),
-                        is_read=False,
-                        type="system"
-                    )
-                    crud.create_notification(new_notif)
-                    
-                    transactions_added = True
+                    # 2-4 commit together, so a claimed date always has its transaction and notification
+                    with unit_of_work.begin():
+                        # 2. Try to claim this occurrence in the DB atomically
+                        rows_updated = crud.advance_recurring_transaction(
+                            rt.id, 
+                            db_next_date.strftime("%Y-%m-%d"), 
+                            advanced_date.strftime("%Y-%m-%d")
+                        )
+
+                        if rows_updated == 0:
+                            # Another backend already processed this date, skip further processing for this RT in this loop run
+                            break
+
+                        # 3. We successfully claimed it! Now insert the transaction
+                        new_tx = models.TransactionCreate(
+                            user_id=rt.user_id,
+                            recipient=rt.recipient,
+                            date=db_next_date,
+                            amount=rt.amount,
+                            category=rt.category,
+                            type=rt.type
+                        )
+                        crud.create_transaction(new_tx)
+                        touched_months.add((db_next_date.year, db_next_date.month))
+
+                        # 4. Generate a notification for this occurrence
+                        new_notif = models.NotificationCreate(
+                            user_id=rt.user_id,
+                            title="Subscription Paid",
+                            message=f"{rt.recipient} (${rt.amount:.2f}) was automatically logged to your ledger.",
+                            date=datetime.now(),
+                            is_read=False,
+                            type="system"
+                        )
+                        crud.create_notification(new_notif)
+
                     db_next_date = advanced_date
 
             # If we added transactions, we need to update assets/net worth
-            if transactions_added:
-                all_txns = crud.get_all_transactions()
-                update_networth(user_id, transactions=all_txns)
-                month_update(user_id, all_txns)
-                organize_assets(user_id, all_txns)
+            if touched_months:
+                recompute_worker.mark_dirty(user_id, touched_months)
                 sse_bus.emit_event("transactions_changed", user_id)
                 sse_bus.emit_event("notifications_changed", user_id)
                 
@@ -1470,8 +1987,8 @@ async def process_recurring_transactions_loop():
 
 if __name__ == "__main__":
     import uvicorn
-    import socket
     import os
+    import launcher
 
     # Check if we are running in a cloud environment (e.g., Railway sets PORT)
     env_port = os.getenv("PORT")
@@ -1480,13 +1997,11 @@ if __name__ == "__main__":
         print(f"Starting in cloud mode on port {env_port}")
         uvicorn.run(app, host="0.0.0.0", port=int(env_port), log_level="info")
     else:
-        # Let the OS assign a free port (Local Electron behavior)
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.bind(("127.0.0.1", 0))
-        port = sock.getsockname()[1]
-        sock.close()
+        # Local Electron behavior: a Unix socket (--uds/SAIVE_UDS) or a free
+        # loopback port, bound once and handed to uvicorn so there is no race
+        sock, announce = launcher.bind_local(launcher.uds_path())
 
-        # Signal the port to Electron (must be flushed immediately)
-        print(f"PORT:{port}", flush=True)
+        # Signal the address to Electron (must be flushed immediately)
+        print(announce, flush=True)
 
-        uvicorn.run(app, host="127.0.0.1", port=port, log_level="info")
+        launcher.serve(app, sock)
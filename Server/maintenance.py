@@ -0,0 +1,84 @@
+"""
+maintenance.py — Consistency checks for derived tables.
+
+user_totals holds each user's debt total, tracked-asset total and ledger
+balance, kept current by SQLite triggers on users, transactions, debts and
+tracked_assets. These commands compare it against a full recomputation from
+the source tables and rebuild it if it ever drifts (e.g. after rows were
+edited with triggers disabled or by an older build).
+
+Closed periods carry a checksum of their transactions and monthly totals;
+verify-periods recomputes it, reopens any month that no longer matches and
+queues it for the recompute worker, which picks it up on the next start.
+
+compact-changes runs the sync change_log compaction the recompute worker
+otherwise does hourly.
+
+Usage (from Server/):
+    python maintenance.py verify-totals      # exit 1 if any user's totals drifted
+    python maintenance.py repair-totals      # rebuild user_totals and net worth
+    python maintenance.py verify-periods     # exit 1 (and reopen) if a closed month drifted
+    python maintenance.py compact-changes    # coalesce and prune change_log
+"""
+
+import argparse
+import sys
+
+import crud
+import database
+import recompute_worker
+
+
+def verify_totals() -> int:
+    mismatches = crud.verify_user_totals()
+    for mismatch in mismatches:
+        print(f"[Maintenance] user_totals drift: {mismatch}")
+    print(f"[Maintenance] verify-totals: {len(mismatches)} mismatch(es)")
+    return 1 if mismatches else 0
+
+
+def repair_totals() -> int:
+    rows = crud.repair_user_totals()
+    print(f"[Maintenance] repair-totals: rebuilt {rows} user_totals row(s)")
+    return 0
+
+
+def verify_periods() -> int:
+    mismatches = crud.verify_closed_periods()
+    earliest = {}
+    for mismatch in mismatches:
+        print(f"[Maintenance] closed period drift: {mismatch}")
+        month = (mismatch["year"], mismatch["month"])
+        earliest[mismatch["user_id"]] = min(earliest.get(mismatch["user_id"], month), month)
+    for user_id, (year, month) in earliest.items():
+        crud.reopen_periods(user_id, year, month)
+        crud.mark_months_dirty(user_id, [(year, month)])
+    print(f"[Maintenance] verify-periods: {len(mismatches)} mismatch(es)")
+    return 1 if mismatches else 0
+
+
+def compact_changes() -> int:
+    result = crud.compact_change_log(recompute_worker.CHANGE_LOG_RETENTION_DAYS)
+    print(f"[Maintenance] compact-changes: coalesced {result['coalesced']}, pruned {result['pruned']} row(s)")
+    return 0
+
+
+COMMANDS = {
+    "verify-totals": verify_totals,
+    "repair-totals": repair_totals,
+    "verify-periods": verify_periods,
+    "compact-changes": compact_changes,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+
+    database.ensure_schema()
+    sys.exit(COMMANDS[args.command]())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, field_validator, model_validator
 from typing import Optional
 from datetime import date, datetime
 from enum import Enum
@@ -52,6 +52,19 @@ class TrackedAssetType(str, Enum):
     other        = "other"
 
 
+class RuleMatch(str, Enum):
+    contains = "contains"
+    exact    = "exact"
+
+
+class DuplicatePolicy(str, Enum):
+    """What a write does when a transaction with the same fingerprint exists."""
+    allow = "allow"     # insert anyway
+    skip  = "skip"      # keep the existing one, insert nothing
+    flag  = "flag"      # insert, and report the existing match
+    merge = "merge"     # update the existing one's category and recipient spelling
+
+
 # ── Shared Validators ─────────────────────────────────────────────────────────
 
 def _validate_amount(v: float) -> float:
@@ -94,6 +107,18 @@ class User(BaseModel):
     net_worth: float
 
 
+class UserTotals(BaseModel):
+    """Running per-user sums kept in step by triggers (see database.create_tables)."""
+    user_id: int
+    total_debt: float = 0.0
+    total_tracked_assets: float = 0.0
+    ledger_balance: float = 0.0
+
+    @property
+    def net_worth(self) -> float:
+        return self.ledger_balance + self.total_tracked_assets - self.total_debt
+
+
 class UserAsset(BaseModel):
     id: Optional[int] = None
     user_id: int
@@ -301,3 +326,56 @@ class TrackedAssetCreate(BaseModel):
 
 class BalanceUpdate(BaseModel):
     balance: float
+
+
+class CategoryRule(BaseModel):
+    id: int
+    user_id: int
+    pattern: str
+    match_type: RuleMatch
+    category: str
+    type: Optional[TransactionType] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    priority: int
+    source: str            # 'user' or 'learned'
+    hits: int
+    last_hit_at: Optional[datetime] = None
+
+
+class CategoryRuleCreate(BaseModel):
+    """Recipient `pattern` (case- and accent-insensitive) and/or an amount range,
+    optionally limited to one transaction type. Bounds are inclusive."""
+    user_id: int
+    pattern: str = ""
+    match_type: RuleMatch = RuleMatch.contains
+    category: TransactionCategory
+    type: Optional[TransactionType] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    priority: int = 0
+
+    @field_validator("pattern", mode="before")
+    @classmethod
+    def validate_pattern(cls, v: str) -> str:
+        v = (v or "").strip()
+        if len(v) > MAX_RECIPIENT_LEN:
+            raise ValueError(f"pattern must be {MAX_RECIPIENT_LEN} characters or fewer")
+        return v
+
+    @model_validator(mode="after")
+    def validate_conditions(self):
+        if not self.pattern and self.min_amount is None and self.max_amount is None:
+            raise ValueError("a rule needs a pattern or an amount range")
+        if self.match_type == RuleMatch.exact and not self.pattern:
+            raise ValueError("exact rules need a pattern")
+        if (self.min_amount is not None and self.max_amount is not None
+                and self.min_amount > self.max_amount):
+            raise ValueError("min_amount must not exceed max_amount")
+        return self
+
+
+class CategorizeItem(BaseModel):
+    recipient: str
+    amount: float
+    type: Optional[TransactionType] = None
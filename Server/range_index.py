@@ -0,0 +1,159 @@
+"""
+range_index.py — In-memory Fenwick trees over each user's daily totals.
+
+Answers "how much between these two dates" for any range (quarter, YTD,
+last 90 days, ...) in O(log n) instead of scanning transactions. Each user
+gets one income and one expense tree per category, plus overall trees, over
+one slot per calendar day. The source of truth is the trigger-maintained
+daily_totals table; every change there bumps a per-user version, so a query
+first fetches only the rows newer than the cached version and applies their
+deltas as point updates. Rows dated outside the cached span rebuild the
+user's index.
+
+Usage (backend):
+    import range_index
+    summary = range_index.range_summary(user_id, date(2026, 1, 1), date(2026, 3, 31))
+    # {"start", "end", "income", "expense", "net", "categories": {cat: {...}}}
+"""
+
+import threading
+from datetime import date, timedelta
+from typing import Optional
+
+import crud
+
+# Days of headroom past today so new transactions update in place
+FUTURE_SLACK_DAYS = 366
+
+
+class Fenwick:
+    """Binary indexed tree over float values, 0-based externally."""
+    __slots__ = ("tree",)
+
+    def __init__(self, values: list):
+        tree = [0.0] + values
+        n = len(values)
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.tree = tree
+
+    def add(self, index: int, delta: float) -> None:
+        i = index + 1
+        tree = self.tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index: int) -> float:
+        """Sum of slots 0..index inclusive."""
+        total = 0.0
+        i = index + 1
+        tree = self.tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def range(self, lo: int, hi: int) -> float:
+        return self.prefix(hi) - (self.prefix(lo - 1) if lo > 0 else 0.0)
+
+
+class RangeIndex:
+    """One user's trees. `cells` mirrors daily_totals so updates apply as deltas."""
+
+    def __init__(self, rows: list):
+        self.version = max((row[4] for row in rows), default=0)
+        self.cells: dict[tuple[str, str], tuple[float, float]] = {
+            (day, category): (income, expense) for day, category, income, expense, _ in rows
+        }
+        days = [date.fromisoformat(day) for day, _ in self.cells] or [date.today()]
+        self.first = min(days)
+        last = max(max(days), date.today() + timedelta(days=FUTURE_SLACK_DAYS))
+        size = (last - self.first).days + 1
+
+        series: dict[Optional[str], tuple[list, list]] = {None: ([0.0] * size, [0.0] * size)}
+        for (day, category), (income, expense) in self.cells.items():
+            slot = (date.fromisoformat(day) - self.first).days
+            for key in (None, category):
+                if key not in series:
+                    series[key] = ([0.0] * size, [0.0] * size)
+                series[key][0][slot] += income
+                series[key][1][slot] += expense
+        # None holds the all-category trees
+        self.trees = {key: (Fenwick(income), Fenwick(expense)) for key, (income, expense) in series.items()}
+        self.size = size
+
+    def slot(self, day: date) -> Optional[int]:
+        offset = (day - self.first).days
+        return offset if 0 <= offset < self.size else None
+
+    def apply(self, rows: list) -> bool:
+        """Apply changed rows as point updates. False if one falls outside the span."""
+        for day, category, income, expense, version in rows:
+            slot = self.slot(date.fromisoformat(day))
+            if slot is None:
+                return False
+            old_income, old_expense = self.cells.get((day, category), (0.0, 0.0))
+            self.cells[(day, category)] = (income, expense)
+            for key in (None, category):
+                if key not in self.trees:
+                    self.trees[key] = (Fenwick([0.0] * self.size), Fenwick([0.0] * self.size))
+                self.trees[key][0].add(slot, income - old_income)
+                self.trees[key][1].add(slot, expense - old_expense)
+            self.version = max(self.version, version)
+        return True
+
+    def summary(self, start: date, end: date) -> dict:
+        lo = max((start - self.first).days, 0)
+        hi = min((end - self.first).days, self.size - 1)
+        sums = {}
+        for key, (income, expense) in self.trees.items():
+            sums[key] = (income.range(lo, hi), expense.range(lo, hi)) if lo <= hi else (0.0, 0.0)
+
+        total_income, total_expense = sums.pop(None)
+        categories = {
+            category: {"income": round(income, 2), "expense": round(expense, 2)}
+            for category, (income, expense) in sorted(sums.items())
+            if round(income, 2) or round(expense, 2)
+        }
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "income": round(total_income, 2),
+            "expense": round(total_expense, 2),
+            "net": round(total_income - total_expense, 2),
+            "categories": categories,
+        }
+
+
+_indexes: dict[int, RangeIndex] = {}
+_lock = threading.Lock()
+
+
+def _refresh(user_id: int) -> RangeIndex:
+    # Caller holds _lock
+    index = _indexes.get(user_id)
+    if index is None:
+        index = _indexes[user_id] = RangeIndex(crud.get_daily_totals_since(user_id))
+        return index
+    changed = crud.get_daily_totals_since(user_id, index.version)
+    if changed and not index.apply(changed):
+        index = _indexes[user_id] = RangeIndex(crud.get_daily_totals_since(user_id))
+    return index
+
+
+def range_summary(user_id: int, start: date, end: date) -> dict:
+    """Income, expense and net between start and end (inclusive), overall and per category."""
+    with _lock:
+        return {"user_id": user_id, **_refresh(user_id).summary(start, end)}
+
+
+def invalidate(user_id: Optional[int] = None) -> None:
+    """Drop cached indexes (all of them without a user_id)."""
+    with _lock:
+        if user_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(user_id, None)
@@ -0,0 +1,131 @@
+"""
+recipient_index.py — In-memory prefix index over each user's recipients.
+
+Autocomplete and category suggestion for recipients the user has logged
+before, without running the local model. Each user gets a sorted array of
+normalised recipient names (bisect gives the prefix range) and, per name,
+how often each category was used and the summed amount. The source of truth
+is the trigger-maintained recipient_totals table; like range_index.py, a
+query first fetches only the rows whose per-user version is newer than the
+cached one and applies them in place.
+
+A suggestion is "known" once the recipient has KNOWN_MIN_COUNT transactions
+and one category holds KNOWN_MIN_SHARE of them; callers can take its
+category as-is and skip model inference.
+
+Usage (backend):
+    import recipient_index
+    recipient_index.suggest(user_id, "netf")
+    # [{"recipient": "Netflix", "count": 38, "category": "Subscriptions",
+    #   "category_share": 1.0, "typical_amount": 15.49, "known": True}]
+"""
+
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Optional
+
+import crud
+
+KNOWN_MIN_COUNT = 3
+KNOWN_MIN_SHARE = 0.8
+
+
+def normalize(name: str) -> str:
+    """Index key: case-folded, accents stripped, whitespace collapsed, so
+    "cafe" finds "Café". SQLite's lower() only folds ASCII, so keys from
+    recipient_totals are normalised again here."""
+    key = " ".join(name.split()).casefold()
+    if key.isascii():
+        return key
+    decomposed = unicodedata.normalize("NFKD", key)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+class RecipientIndex:
+    """One user's recipients. `cells` mirrors recipient_totals so updates apply as deltas."""
+
+    def __init__(self, rows: list):
+        self.version = 0
+        self.cells: dict[tuple[str, str], tuple[int, float]] = {}
+        self.stats: dict[str, dict[str, list]] = {}   # key -> category -> [count, amount]
+        self.display: dict[str, str] = {}
+        self.keys: list[str] = []
+        self.apply(rows)
+
+    def apply(self, rows: list) -> None:
+        for recipient_key, category, recipient, count, amount, version in rows:
+            old_count, old_amount = self.cells.get((recipient_key, category), (0, 0.0))
+            self.cells[(recipient_key, category)] = (count, amount)
+            key = normalize(recipient_key)
+            if not key:
+                continue
+            if key not in self.stats:
+                self.stats[key] = {}
+                insort(self.keys, key)
+            totals = self.stats[key].setdefault(category, [0, 0.0])
+            totals[0] += count - old_count
+            totals[1] += amount - old_amount
+            # Show the spelling of the latest transaction
+            if count > old_count or key not in self.display:
+                self.display[key] = recipient.strip()
+            self.version = max(self.version, version)
+
+    def _suggestion(self, key: str):
+        categories = {category: totals for category, totals in self.stats[key].items() if totals[0] > 0}
+        if not categories:
+            return None
+        count = sum(totals[0] for totals in categories.values())
+        category, (top_count, top_amount) = max(categories.items(), key=lambda item: (item[1][0], item[0]))
+        share = top_count / count
+        return {
+            "recipient": self.display[key],
+            "count": count,
+            "category": category,
+            "category_share": round(share, 2),
+            "typical_amount": round(top_amount / top_count, 2),
+            "known": count >= KNOWN_MIN_COUNT and share >= KNOWN_MIN_SHARE,
+        }
+
+    def suggest(self, prefix: str, limit: int) -> list:
+        """Recipients starting with `prefix`, most used first."""
+        prefix = normalize(prefix)
+        keys = self.keys
+        matches = []
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            suggestion = self._suggestion(keys[i])
+            if suggestion is not None:
+                matches.append(suggestion)
+        matches.sort(key=lambda s: (-s["count"], s["recipient"]))
+        return matches[:limit]
+
+
+_indexes: dict[int, RecipientIndex] = {}
+_lock = threading.Lock()
+
+
+def _refresh(user_id: int) -> RecipientIndex:
+    # Caller holds _lock
+    index = _indexes.get(user_id)
+    if index is None:
+        index = _indexes[user_id] = RecipientIndex(crud.get_recipient_totals_since(user_id))
+        return index
+    index.apply(crud.get_recipient_totals_since(user_id, index.version))
+    return index
+
+
+def suggest(user_id: int, prefix: str, limit: int = 10) -> list:
+    """Up to `limit` known recipients starting with `prefix`, with their usual category and amount."""
+    with _lock:
+        return _refresh(user_id).suggest(prefix, limit)
+
+
+def invalidate(user_id: Optional[int] = None) -> None:
+    """Drop cached indexes (all of them without a user_id)."""
+    with _lock:
+        if user_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(user_id, None)
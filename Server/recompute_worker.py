@@ -0,0 +1,163 @@
+"""
+recompute_worker.py — Background aggregation worker.
+
+Mutation endpoints no longer rebuild user_assets and net worth inline. They
+mark the (user, year, month) they touched as dirty and return; a single
+daemon thread drains the dirty_months table, coalesces it to the earliest
+dirty month per user and recomputes from there off the request path.
+
+Usage (backend):
+    import recompute_worker
+    recompute_worker.register(recompute_user)       # once, at import
+    recompute_worker.start()                        # from the lifespan
+    recompute_worker.mark_dirty(user_id, [(2026, 3)])
+
+Usage (read endpoints that need read-your-writes):
+    recompute_worker.wait_until_clean(user_id)
+
+Months older than SAIVE_CLOSE_AFTER_MONTHS are closed once recomputed (see
+crud.close_periods); a back-dated write reopens them through a trigger.
+
+The worker also compacts the sync change_log every COMPACT_INTERVAL seconds
+(see crud.compact_change_log).
+"""
+
+import os
+import threading
+import time
+from datetime import date
+from typing import Callable, Iterable, Optional
+
+import crud
+
+# Seconds a read waits for pending recomputes before serving stale aggregates.
+READ_WAIT_TIMEOUT = 2.0
+# Idle poll so rows left behind by a crash are still picked up.
+IDLE_POLL_INTERVAL = 5.0
+# Months this far behind the current one are closed after a recompute and
+# skipped by later ones until a back-dated write reopens them. 0 disables closing.
+CLOSE_AFTER_MONTHS = int(os.environ.get("SAIVE_CLOSE_AFTER_MONTHS", "3"))
+# change_log compaction cadence, and how long rows for deleted entities are
+# kept before clients older than them must resync in full.
+COMPACT_INTERVAL = 3600.0
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get("SAIVE_CHANGE_LOG_RETENTION_DAYS", "30"))
+
+_cond = threading.Condition()
+_pending: dict[int, int] = {}  # user_id -> generation of the latest mark
+_recompute: Optional[Callable[[int, tuple[int, int]], None]] = None
+_thread: Optional[threading.Thread] = None
+_stopping = False
+
+
+def register(recompute: Callable[[int, tuple[int, int]], None]) -> None:
+    """Set the recompute callback. `recompute(user_id, since)` rebuilds every
+    aggregate for the user from the (year, month) `since` onwards."""
+    global _recompute
+    _recompute = recompute
+
+
+def start() -> None:
+    """Start the worker thread and pick up anything left queued on disk."""
+    global _thread, _stopping
+    _stopping = False
+    _thread = threading.Thread(target=_run, name="recompute-worker", daemon=True)
+    _thread.start()
+
+
+def stop(timeout: float = 5.0) -> None:
+    """Ask the worker to finish its current pass and exit."""
+    global _stopping, _thread
+    with _cond:
+        _stopping = True
+        _cond.notify_all()
+    if _thread is not None:
+        _thread.join(timeout)
+    _thread = None
+
+
+def is_running() -> bool:
+    return _thread is not None and _thread.is_alive()
+
+
+def mark_dirty(user_id: int, months: Iterable[tuple[int, int]]) -> None:
+    """Queue the given months for recompute and wake the worker.
+    Without a running worker (scripts, tests) the recompute happens inline."""
+    months = set(months)
+    if not months:
+        return
+    crud.mark_months_dirty(user_id, months)
+    if not is_running():
+        _drain()
+        return
+    with _cond:
+        _pending[user_id] = _pending.get(user_id, 0) + 1
+        _cond.notify_all()
+
+
+def close_horizon(today: Optional[date] = None) -> Optional[tuple[int, int]]:
+    """The first (year, month) that stays open, or None when closing is disabled."""
+    if CLOSE_AFTER_MONTHS <= 0:
+        return None
+    today = today or date.today()
+    year, month = divmod(today.year * 12 + today.month - 1 - CLOSE_AFTER_MONTHS, 12)
+    return (year, month + 1)
+
+
+def wait_until_clean(user_id: int, timeout: float = READ_WAIT_TIMEOUT) -> bool:
+    """Block until no recompute is pending for the user.
+    Returns False if the timeout expired and the caller will read stale data."""
+    with _cond:
+        return _cond.wait_for(lambda: user_id not in _pending, timeout=timeout)
+
+
+def _run() -> None:
+    # The first pass runs straight away to recover rows queued before a restart
+    snapshot: dict[int, int] = {}
+    next_compaction = time.monotonic()
+    while True:
+        failed: set[int] = set()
+        try:
+            failed = _drain()
+        except Exception as e:
+            # The claim itself failed: nothing in the snapshot is known clean
+            failed = set(snapshot)
+            print(f"Error in recompute worker: {e}")
+        if time.monotonic() >= next_compaction:
+            next_compaction = time.monotonic() + COMPACT_INTERVAL
+            try:
+                crud.compact_change_log(CHANGE_LOG_RETENTION_DAYS)
+            except Exception as e:
+                print(f"Error compacting change log: {e}")
+        with _cond:
+            # Only users with no marks since the snapshot are clean; anything
+            # newer is still in the table and gets picked up next pass.
+            for user_id, generation in snapshot.items():
+                if _pending.get(user_id) == generation and user_id not in failed:
+                    del _pending[user_id]
+            # A failed user stays pending (readers see it as stale) and is
+            # retried on the idle poll, or sooner if it is marked again
+            for user_id in failed:
+                _pending.setdefault(user_id, 0)
+            retry = {user_id: _pending[user_id] for user_id in failed}
+            _cond.notify_all()
+            _cond.wait_for(lambda: _stopping or any(generation != retry.get(user_id)
+                                                    for user_id, generation in _pending.items()),
+                           timeout=IDLE_POLL_INTERVAL)
+            if _stopping:
+                return
+            snapshot = dict(_pending)
+
+
+def _drain() -> set[int]:
+    """Recomputes every claimed user; returns the users whose recompute failed.
+    One failure must not drop the claims of the users after it."""
+    failed = set()
+    for user_id, since in crud.claim_dirty_months().items():
+        try:
+            _recompute(user_id, since)
+        except Exception as e:
+            # Put the claim back so the next pass retries it
+            crud.mark_months_dirty(user_id, [since])
+            failed.add(user_id)
+            print(f"Error recomputing user {user_id} from {since[0]}-{since[1]:02d}: {e}")
+    return failed
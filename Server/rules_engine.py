@@ -0,0 +1,187 @@
+"""
+rules_engine.py — Compiled rule-based categorisation of transactions.
+
+A user's category_rules are compiled once into a matcher and cached until a
+rule changes. Rules look at the normalised recipient (recipient_index.normalize,
+so case, accents and spacing do not matter): "contains" rules match a
+substring, "exact" rules the whole name. Either may also require a
+transaction type and an inclusive amount range, and a rule with no pattern
+matches on amount and type alone.
+
+All "contains" patterns are compiled into one regex shaped like a trie
+(common prefixes merged, so at each position the engine follows a single
+branch instead of trying every pattern) inside a lookahead, so one finditer
+pass reports the longest pattern starting at each position. Every other
+pattern found at that position is a prefix of it, so the matcher keeps a
+precomputed list of prefix patterns per pattern and does no further
+scanning. "exact" rules are a dict lookup.
+
+Candidate rules are ordered once: user rules before learned ones, then
+higher priority, then longer pattern (more specific); the first whose type
+and amount conditions hold wins. Candidates are memoised per recipient, so
+a bulk import runs the regex once per distinct bank line.
+
+Learned rules are exact rules for the recipients recipient_index would call
+"known" (crud.learn_category_rules). Hit counts are written back in one
+statement per batch (crud.record_rule_hits).
+
+Usage (backend):
+    import rules_engine
+    rules_engine.categorize(user_id, "NETFLIX.COM 866-579-7172", 15.49, "expense")
+    # {"category": "Subscriptions", "rule_id": 3}
+    rules_engine.categorize_many(user_id, [(recipient, amount, tx_type), ...])
+    rules_engine.invalidate(user_id)   # after creating, editing or learning rules
+"""
+
+import re
+import threading
+from collections import Counter
+from typing import NamedTuple, Optional
+
+import crud
+import recipient_index
+
+MAX_MEMO = 100_000
+
+
+class Rule(NamedTuple):
+    id: int
+    category: str
+    type: Optional[str]
+    min_amount: Optional[float]
+    max_amount: Optional[float]
+
+
+def trie_pattern(keys) -> str:
+    """A regex matching the longest of `keys` at a position, with shared prefixes merged."""
+    trie: dict = {}
+    for key in keys:
+        node = trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[""] = {}           # end of a key
+
+    def emit(node: dict) -> str:
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy: prefer the longer key, fall back to ending here
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+class CompiledRules:
+    """One user's rules, compiled. `conditions` are crud.get_rule_conditions rows."""
+
+    def __init__(self, conditions: list):
+        order = {}          # rule -> sort key
+        contains: dict[str, list] = {}
+        exact: dict[str, list] = {}
+        anywhere = []       # no pattern: amount/type rules
+        for rule_id, pattern, match_type, category, tx_type, min_amount, max_amount, priority, source in conditions:
+            rule = Rule(rule_id, category, tx_type, min_amount, max_amount)
+            key = recipient_index.normalize(pattern)
+            order[rule] = (source != "user", -priority, -len(key), rule_id)
+            if not key:
+                anywhere.append(rule)
+            elif match_type == "exact":
+                exact.setdefault(key, []).append(rule)
+            else:
+                contains.setdefault(key, []).append(rule)
+
+        self.size = len(order)
+        self._order = order
+        self._anywhere = anywhere
+        self._exact = exact
+        self._contains = contains
+        # Patterns that are prefixes of each pattern (itself included)
+        self._prefixes = {
+            key: [key[:n] for n in range(1, len(key) + 1) if key[:n] in contains]
+            for key in contains
+        }
+        self._scanner = None
+        if contains:
+            self._scanner = re.compile(f"(?=({trie_pattern(contains)}))")
+        self._ordered: dict[tuple, tuple] = {}
+        self._memo: dict[str, tuple] = {}
+
+    def candidates(self, recipient: str) -> tuple:
+        """Rules whose pattern matches `recipient`, in precedence order."""
+        found = self._memo.get(recipient)
+        if found is not None:
+            return found
+        key = recipient_index.normalize(recipient)
+        matched = frozenset(self._scanner.findall(key)) if self._scanner is not None else frozenset()
+        exact = key if key in self._exact else None
+        # Few distinct pattern combinations occur, so their ordering is cached too
+        found = self._ordered.get((matched, exact))
+        if found is None:
+            rules = set(self._anywhere)
+            rules.update(self._exact.get(exact, ()))
+            for longest in matched:
+                for pattern in self._prefixes[longest]:
+                    rules.update(self._contains[pattern])
+            found = tuple(sorted(rules, key=self._order.__getitem__))
+            if len(self._ordered) >= MAX_MEMO:
+                self._ordered.clear()
+            self._ordered[(matched, exact)] = found
+        if len(self._memo) >= MAX_MEMO:
+            self._memo.clear()
+        self._memo[recipient] = found
+        return found
+
+    def match(self, recipient: str, amount: float, tx_type: Optional[str] = None) -> Optional[Rule]:
+        for rule in self.candidates(recipient):
+            _, _, rule_type, min_amount, max_amount = rule
+            if ((rule_type is None or tx_type is None or rule_type == tx_type)
+                    and (min_amount is None or amount >= min_amount)
+                    and (max_amount is None or amount <= max_amount)):
+                return rule
+        return None
+
+
+_compiled: dict[int, CompiledRules] = {}
+_lock = threading.Lock()
+
+
+def compiled(user_id: int) -> CompiledRules:
+    """The user's compiled rules, built on first use after an invalidate()."""
+    with _lock:
+        rules = _compiled.get(user_id)
+        if rules is None:
+            rules = _compiled[user_id] = CompiledRules(crud.get_rule_conditions(user_id))
+        return rules
+
+
+def categorize_many(user_id: int, rows, record_hits: bool = True) -> list:
+    """{"category", "rule_id"} (or None when no rule matches) per
+    (recipient, amount, tx_type) row; tx_type may be None to match any type."""
+    rules = compiled(user_id)
+    hits = Counter()
+    results = []
+    for recipient, amount, tx_type in rows:
+        rule = rules.match(recipient, amount, tx_type)
+        if rule is None:
+            results.append(None)
+            continue
+        hits[rule.id] += 1
+        results.append({"category": rule.category, "rule_id": rule.id})
+    if record_hits:
+        crud.record_rule_hits(hits)
+    return results
+
+
+def categorize(user_id: int, recipient: str, amount: float, tx_type: Optional[str] = None,
+               record_hits: bool = True) -> Optional[dict]:
+    return categorize_many(user_id, [(recipient, amount, tx_type)], record_hits)[0]
+
+
+def invalidate(user_id: Optional[int] = None) -> None:
+    """Drop compiled rules (all of them without a user_id)."""
+    with _lock:
+        if user_id is None:
+            _compiled.clear()
+        else:
+            _compiled.pop(user_id, None)
@@ -0,0 +1,85 @@
+# -*- mode: python ; coding: utf-8 -*-
+# PyInstaller spec for sAIve backend — startup-optimised onedir profile
+#
+# Differences from sAIve-backend.spec (onefile):
+#   - onedir: nothing is unpacked to a temp dir on every launch
+#   - no UPX: no decompression of every binary at load time
+#   - unused stdlib/test/dev modules excluded from the bundle
+#   - bytecode precompiled at SAIVE_PYOPT (default 1, see below)
+#   - preload_modules.txt bundled for launcher.py's post-startup warm-up
+#
+# Build:  pyinstaller sAIve-backend-onedir.spec --distpath dist
+# Output: dist/sAIve-backend/sAIve-backend(.exe) plus dist/sAIve-backend/_internal/
+
+import os
+
+# Level 2 also strips docstrings, and FastMCP publishes tool docstrings as the
+# tool descriptions the local assistant relies on, so it defaults to 1
+# (asserts stripped). Set SAIVE_PYOPT=2 for a build without the MCP server.
+OPTIMIZE = int(os.environ.get('SAIVE_PYOPT', '1'))
+
+a = Analysis(
+    ['launcher.py'],
+    pathex=[],
+    binaries=[],
+    datas=[('preload_modules.txt', '.')],
+    hiddenimports=[
+        'uvicorn.logging',
+        'uvicorn.loops',
+        'uvicorn.loops.auto',
+        'uvicorn.protocols',
+        'uvicorn.protocols.http',
+        'uvicorn.protocols.http.auto',
+        'uvicorn.lifespan',
+        'uvicorn.lifespan.on',
+        # Picked by uvicorn's "auto" loop/http when present; skipped with a warning if not
+        'uvicorn.loops.uvloop',
+        'uvicorn.protocols.http.httptools_impl',
+        'uvloop',
+        'httptools',
+    ],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[
+        # GUI / REPL tooling
+        'tkinter', '_tkinter', 'turtle', 'turtledemo', 'idlelib', 'curses', 'IPython',
+        # test and packaging infrastructure
+        'unittest', 'doctest', 'test', 'pytest', '_pytest', 'lib2to3',
+        'distutils', 'setuptools', 'pip', 'pydoc_data',
+        # uvicorn extras the app never uses (no websockets, no --reload, no YAML log config)
+        'websockets', 'wsproto', 'watchfiles', 'yaml',
+        'xmlrpc',
+    ],
+    noarchive=False,
+    optimize=OPTIMIZE,
+)
+
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='sAIve-backend',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    name='sAIve-backend',
+)
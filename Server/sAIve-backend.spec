@@ -2,7 +2,7 @@
 # PyInstaller spec for sAIve backend
 
 a = Analysis(
-    ['main.py'],
+    ['launcher.py'],
     pathex=[],
     binaries=[],
     datas=[],
@@ -17,6 +17,11 @@ a = Analysis(
         'uvicorn.protocols.websockets.auto',
         'uvicorn.lifespan',
         'uvicorn.lifespan.on',
+        # Picked by uvicorn's "auto" loop/http when present; skipped with a warning if not
+        'uvicorn.loops.uvloop',
+        'uvicorn.protocols.http.httptools_impl',
+        'uvloop',
+        'httptools',
     ],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,197 @@
+"""
+unit_of_work.py — Request-scoped unit of work with an identity map.
+
+While a unit of work is active on the current thread/task, every
+crud function shares one SQLite connection and one transaction:
+
+  * database.create_connection() hands out the shared connection; the
+    commit() and close() calls crud makes on it are deferred to the end.
+  * Entity reads decorated with @identity(kind) are cached per unit of work,
+    so repeated get_user / get_user_asset / get_debt calls hit SQLite once.
+  * Updates registered through defer_write() are buffered, coalesced per
+    entity and flushed with executemany before the next statement runs
+    (so reads always see them) or at commit.
+  * Everything commits once when the outermost block exits and rolls back
+    if it raises.
+
+Usage (backend):
+    import unit_of_work
+
+    with unit_of_work.begin(immediate=True):   # take the write lock up front
+        debt = crud.get_debt(debt_id)
+        crud.create_transaction(tx)
+        crud.update_debt_balance(debt_id, debt.balance + tx.amount)
+
+    @unit_of_work.transactional
+    def recompute_user(user_id, since): ...
+
+    with unit_of_work.begin(snapshot=True):    # several reads, one snapshot
+        user = crud.get_user(user_id)
+        budgets = crud.get_budgets(user_id)
+
+Nested begin() calls join the outer unit of work.
+"""
+
+import functools
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import groupby
+from typing import Iterator, Optional
+
+_current: ContextVar[Optional["UnitOfWork"]] = ContextVar("saive_unit_of_work", default=None)
+
+
+class _BorrowedConnection:
+    """The shared connection as crud sees it: commit() and close() are left
+    to the unit of work."""
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class UnitOfWork:
+    def __init__(self, immediate: bool = False, snapshot: bool = False):
+        self.immediate = immediate
+        self.snapshot = snapshot
+        self.identity: dict[tuple, object] = {}
+        self._pending: dict[tuple, tuple[str, tuple]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def connection(self) -> _BorrowedConnection:
+        if self._conn is None:
+            import database
+            self._conn = database._connect()
+            if self.immediate:
+                self._conn.execute("BEGIN IMMEDIATE")
+            elif self.snapshot:
+                self._conn.execute("BEGIN")
+        self.flush()
+        return _BorrowedConnection(self._conn)
+
+    def defer(self, key: tuple, entity, sql: str, parameters: tuple) -> None:
+        # Re-inserting keeps the key's original flush position; the last write wins
+        self._pending[key] = (sql, parameters)
+        self.identity[key] = entity
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        cursor = self._conn.cursor()
+        for sql, group in groupby(pending.values(), key=lambda item: item[0]):
+            cursor.executemany(sql, [parameters for _, parameters in group])
+
+    def commit(self) -> None:
+        if self._conn is None:
+            if not self._pending:
+                return
+            self.connection()
+        self.flush()
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        self._pending.clear()
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self.identity.clear()
+
+
+def current() -> Optional[UnitOfWork]:
+    return _current.get()
+
+
+@contextmanager
+def begin(immediate: bool = False, snapshot: bool = False) -> Iterator[UnitOfWork]:
+    """Run the block as one unit of work (or join the one already active).
+    immediate=True issues BEGIN IMMEDIATE on first use so reads made for a
+    read-modify-write can't go stale before the write. snapshot=True opens a
+    plain BEGIN so a read-only block sees one consistent snapshot."""
+    outer = _current.get()
+    if outer is not None:
+        yield outer
+        return
+
+    uow = UnitOfWork(immediate, snapshot)
+    token = _current.set(uow)
+    try:
+        yield uow
+        uow.commit()
+    except BaseException:
+        uow.rollback()
+        raise
+    finally:
+        _current.reset(token)
+        uow.close()
+
+
+def transactional(fn):
+    """Decorator form of begin() for helpers that should run as one unit of work."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with begin():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def borrow() -> Optional[_BorrowedConnection]:
+    """The active unit of work's connection, or None outside one. Used by database.create_connection()."""
+    uow = _current.get()
+    return uow.connection() if uow is not None else None
+
+
+def identity(kind: str):
+    """Cache an entity getter's result per unit of work, keyed by (kind, *args)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            uow = _current.get()
+            if uow is None or kwargs:
+                return fn(*args, **kwargs)
+            key = (kind, *args)
+            if key not in uow.identity:
+                uow.identity[key] = fn(*args)
+            return uow.identity[key]
+        return wrapper
+    return decorate
+
+
+def defer_write(key: tuple, entity, sql: str, parameters: tuple) -> bool:
+    """Buffer an UPDATE of `entity` inside the active unit of work.
+    Returns False when there is none and the caller should write directly."""
+    uow = _current.get()
+    if uow is None:
+        return False
+    uow.defer(key, entity, sql, parameters)
+    return True
+
+
+def evict(*keys: tuple) -> None:
+    """Drop identity-map entries a write is about to invalidate."""
+    uow = _current.get()
+    if uow is not None:
+        for key in keys:
+            uow.identity.pop(key, None)
+
+
+def evict_kind(kind: str) -> None:
+    """Drop every cached entity of one kind, for writes that can't name the key."""
+    uow = _current.get()
+    if uow is not None:
+        for key in [k for k in uow.identity if k[0] == kind]:
+            del uow.identity[key]
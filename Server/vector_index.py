@@ -0,0 +1,299 @@
+"""
+vector_index.py — Local hashed n-gram vector index for assistant retrieval.
+
+Lets the assistant fetch only the transactions relevant to a question instead
+of a whole month of rows. Each (recipient, category) cell of the user's
+recipient_totals is one document, embedded deterministically by feature
+hashing: words and character trigrams of the recipient, the category and a
+few plain-language words for it ("groceries", "rent", ...), the typical
+amount's bucket and the transaction type. A query is embedded the same way,
+with question words dropped and numbers mapped to amount buckets. No model
+is involved; the same text always gives the same vector.
+
+The vectors of one user form a NumPy float32 matrix (one row per cell) and
+cosine similarity is a single matrix-vector product. Like recipient_index.py,
+a query first applies the recipient_totals rows whose version is newer than
+the cached one, so writes are picked up on the next search. The matrix is
+persisted under the data directory and reloaded on startup, after which only
+the cells changed since the last save are re-embedded.
+
+NumPy is optional: without it available() is False and callers fall back.
+
+Usage (backend):
+    import vector_index
+    vector_index.search(user_id, "coffee and groceries", k=10, start="2026-10-01", end="2026-10-31")
+    # {"query", "matches": [{recipient, category, score, count, expense, income}],
+    #  "count", "expense", "income", "transactions": [top-k rows]}
+"""
+
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+import crud
+import database
+import recipient_index
+
+DIM = 2048                          # 8 KB per document
+EMBED_VERSION = 1                   # bump when the featurisation changes
+MAX_DOCS = 25                       # cells whose transactions feed one answer
+MIN_SCORE = 0.12                    # unrelated queries score below ~0.1
+RELATIVE_SCORE = 0.5                # ...and at least this share of the best score
+SAVE_INTERVAL_S = 30.0
+INDEX_DIR = Path(database.DATABASE_PATH).parent / "vector_index"
+
+# Field weights; recipient terms weigh 1
+CATEGORY_WEIGHT = 0.6
+AMOUNT_WEIGHT = 0.4
+TYPE_WEIGHT = 0.3
+
+CATEGORY_TERMS = {
+    "Housing": "housing rent mortgage home landlord furniture repairs",
+    "Food": "food groceries grocery restaurant restaurants dining coffee takeout lunch dinner",
+    "Transportation": "transportation transport gas fuel car ride rides taxi parking transit train bus",
+    "Subscriptions": "subscriptions subscription streaming membership music video",
+    "Bills": "bills bill utilities utility electric electricity water phone internet insurance",
+    "Income": "income salary paycheck pay deposit earnings",
+    "Other": "other shopping purchases",
+}
+AMOUNT_EDGES = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+EXPENSE_WORDS = frozenset("spend spent spending expense expenses paid bought buy cost costs".split())
+INCOME_WORDS = frozenset("income earn earned earning earnings received salary paycheck".split())
+STOPWORDS = frozenset("""
+    a an the and or of on in at to for from by with about how much many what which who when where why
+    did do does i me my we us our you your it its is are was were be been have has had
+    this that these those last next past month months year years week weeks day days today yesterday
+    total totals sum all any some show list find get give tell more most less than over under
+    """.split()) | EXPENSE_WORDS
+
+_WORD = re.compile(r"[^\W_]+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def available() -> bool:
+    return np is not None
+
+
+def amount_bucket(amount: float) -> str:
+    for edge in AMOUNT_EDGES:
+        if amount < edge:
+            return f"amount<{edge}"
+    return f"amount>={AMOUNT_EDGES[-1]}"
+
+
+def _terms(text: str, weight: float, features: dict, trigrams: bool = True) -> None:
+    """Adds the words of `text` (and their character trigrams) to `features`."""
+    for word in _WORD.findall(recipient_index.normalize(text)):
+        features[word] = features.get(word, 0.0) + weight
+        if not trigrams:
+            continue
+        padded = f" {word} "
+        # The trigrams of a word weigh as much as the word itself, together
+        gram_weight = weight / math.sqrt(len(padded) - 2)
+        for i in range(len(padded) - 2):
+            gram = "#" + padded[i:i + 3]
+            features[gram] = features.get(gram, 0.0) + gram_weight
+
+
+def _vector(features: dict):
+    """Signed feature hashing into DIM slots, L2-normalised."""
+    vector = np.zeros(DIM, dtype=np.float32)
+    for feature, weight in features.items():
+        # Not crc32: it is linear, and near-identical strings collide
+        # ("netflx" and "spotify" share their low 12 bits)
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=4).digest(), "little")
+        vector[h % DIM] += weight if h & 0x80000000 else -weight
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def embed_document(recipient: str, category: str, typical_amount: float):
+    features: dict = {}
+    _terms(recipient, 1.0, features)
+    # Whole words only: trigrams of the vocabulary would match unrelated
+    # queries ("weather" shares three with "other")
+    _terms(CATEGORY_TERMS.get(category, category), CATEGORY_WEIGHT, features, trigrams=False)
+    features[amount_bucket(typical_amount)] = AMOUNT_WEIGHT
+    features["type:income" if category.lower() == "income" else "type:expense"] = TYPE_WEIGHT
+    return _vector(features)
+
+
+def embed_query(query: str):
+    features: dict = {}
+    words = _WORD.findall(recipient_index.normalize(query))
+    _terms(" ".join(w for w in words if w not in STOPWORDS and not w.isdigit()), 1.0, features)
+    for number in _NUMBER.findall(query):
+        features[amount_bucket(float(number.replace(",", "")))] = AMOUNT_WEIGHT
+    if any(w in EXPENSE_WORDS for w in words):
+        features["type:expense"] = TYPE_WEIGHT
+    if any(w in INCOME_WORDS for w in words):
+        features["type:income"] = TYPE_WEIGHT
+    return _vector(features)
+
+
+class VectorIndex:
+    """One user's document vectors; row i of `matrix` embeds `keys[i]`."""
+
+    def __init__(self):
+        self.version = 0
+        self.keys: list[tuple[str, str]] = []    # (recipient_key, category)
+        self.display: list[str] = []
+        self.slots: dict[tuple[str, str], int] = {}
+        self.matrix = np.zeros((0, DIM), dtype=np.float32)
+        self.saved_at = 0.0
+        self.unsaved = False
+
+    def apply(self, rows: list) -> None:
+        added = []
+        for recipient_key, category, recipient, count, amount, version in rows:
+            key = (recipient_key, category)
+            vector = embed_document(recipient, category, amount / count) if count > 0 else np.zeros(DIM, np.float32)
+            slot = self.slots.get(key)
+            if slot is None:
+                self.slots[key] = len(self.keys)
+                self.keys.append(key)
+                self.display.append(recipient.strip())
+                added.append(vector)
+            else:
+                self.matrix[slot] = vector
+                self.display[slot] = recipient.strip()
+            self.version = max(self.version, version)
+        if added:
+            self.matrix = np.vstack([self.matrix, np.stack(added)])
+        if rows:
+            self.unsaved = True
+
+    def nearest(self, query: str) -> list:
+        """[(slot, score)] of the best documents for `query`, best first."""
+        if not len(self.keys):
+            return []
+        scores = self.matrix @ embed_query(query)
+        top = np.argsort(-scores)[:MAX_DOCS]
+        best = float(scores[top[0]])
+        floor = max(MIN_SCORE, best * RELATIVE_SCORE)
+        return [(int(slot), round(float(scores[slot]), 3)) for slot in top if scores[slot] >= floor]
+
+    # ── Persistence ──
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        np.savez(
+            tmp,
+            meta=np.array([EMBED_VERSION, DIM, self.version], dtype=np.int64),
+            matrix=self.matrix,
+            recipient_keys=np.array([k[0] for k in self.keys], dtype=str),
+            categories=np.array([k[1] for k in self.keys], dtype=str),
+            display=np.array(self.display, dtype=str),
+        )
+        os.replace(tmp, path)
+        self.saved_at = time.monotonic()
+        self.unsaved = False
+
+    @classmethod
+    def load(cls, path: Path):
+        """The saved index, or None if it is missing, unreadable or from another featurisation."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                embed_version, dim, version = (int(v) for v in data["meta"])
+                if embed_version != EMBED_VERSION or dim != DIM:
+                    return None
+                index = cls()
+                index.version = version
+                index.matrix = data["matrix"].astype(np.float32, copy=False)
+                index.keys = list(zip(data["recipient_keys"].tolist(), data["categories"].tolist()))
+                index.display = data["display"].tolist()
+        except (OSError, KeyError, ValueError) as e:
+            if path.exists():
+                print(f"Discarding unreadable vector index {path}: {e}")
+            return None
+        index.slots = {key: i for i, key in enumerate(index.keys)}
+        index.saved_at = time.monotonic()
+        return index
+
+
+_indexes: dict[int, VectorIndex] = {}
+_lock = threading.Lock()
+
+
+def _path(user_id: int) -> Path:
+    return INDEX_DIR / f"user_{user_id}.npz"
+
+
+def _refresh(user_id: int) -> VectorIndex:
+    # Caller holds _lock
+    index = _indexes.get(user_id)
+    if index is None:
+        index = VectorIndex.load(_path(user_id))
+        # A saved version ahead of the table means the database was replaced
+        if index is not None and index.version > crud.get_recipient_totals_version(user_id):
+            index = None
+        if index is None:
+            index = VectorIndex()
+        _indexes[user_id] = index
+    index.apply(crud.get_recipient_totals_since(user_id, index.version))
+    if index.unsaved and time.monotonic() - index.saved_at >= SAVE_INTERVAL_S:
+        index.save(_path(user_id))
+    return index
+
+
+def search(user_id: int, query: str, k: int = 10, start: Optional[str] = None, end: Optional[str] = None) -> dict:
+    """The `k` most relevant transactions for `query` (optionally within
+    [start, end]), plus counts and totals over every transaction of the
+    matching recipients, so the answer needs no other rows."""
+    with _lock:
+        index = _refresh(user_id)
+        nearest = index.nearest(query)
+        docs = [(*index.keys[slot], score) for slot, score in nearest]
+        display = {index.keys[slot]: index.display[slot] for slot, _ in nearest}
+    groups, rows = crud.get_transactions_for_documents(user_id, docs, k, start, end)
+    matches = [{
+        "recipient": display[(g["recipient_key"], g["category"])],
+        "category": g["category"],
+        "score": g["score"],
+        "count": g["count"],
+        "expense": round(g["expense"], 2),
+        "income": round(g["income"], 2),
+    } for g in groups]
+    return {
+        "query": query,
+        "start": start,
+        "end": end,
+        "matches": matches,
+        "count": sum(m["count"] for m in matches),
+        "expense": round(sum(m["expense"] for m in matches), 2),
+        "income": round(sum(m["income"] for m in matches), 2),
+        "transactions": rows,
+    }
+
+
+def flush() -> None:
+    """Saves every index with unsaved changes (called on shutdown)."""
+    with _lock:
+        for user_id, index in _indexes.items():
+            if index.unsaved:
+                index.save(_path(user_id))
+
+
+def invalidate(user_id: Optional[int] = None) -> None:
+    """Drop cached indexes and their saved files (all of them without a user_id)."""
+    with _lock:
+        users = list(_indexes) if user_id is None else [user_id]
+        for uid in users:
+            _indexes.pop(uid, None)
+        paths = INDEX_DIR.glob("user_*.npz") if user_id is None else [_path(user_id)]
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
@@ -77,9 +77,16 @@ const startBackend = () => {
     if (app.isPackaged) {
       // Production: run the PyInstaller-built binary
       const binaryName = process.platform === 'win32' ? 'sAIve-backend.exe' : 'sAIve-backend';
-      executable = path.join(process.resourcesPath, 'backend', binaryName);
+      // Prefer the onedir build (sAIve-backend-onedir.spec), fall back to onefile
+      const onedirCwd = path.join(process.resourcesPath, 'backend', 'sAIve-backend');
+      if (fs.existsSync(path.join(onedirCwd, binaryName))) {
+        executable = path.join(onedirCwd, binaryName);
+        cwd = onedirCwd;
+      } else {
+        executable = path.join(process.resourcesPath, 'backend', binaryName);
+        cwd = path.join(process.resourcesPath, 'backend');
+      }
       args = [];
-      cwd = path.join(process.resourcesPath, 'backend');
 
       if (!fs.existsSync(executable)) {
         const errorMessage = `Backend binary not found at: ${executable}`;
@@ -89,9 +96,9 @@ const startBackend = () => {
         return;
       }
     } else {
-      // Development: run python main.py directly
+      // Development: run the fast-start launcher directly
       executable = 'python';
-      args = ['main.py'];
+      args = ['launcher.py'];
       cwd = path.join(__dirname, '..', '..', 'Server');
     }
 